@@ -3,23 +3,53 @@ from flask_cors import CORS
 from flask_migrate import Migrate
 from .models.models import db
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
 
 migrate = Migrate()
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     
     # Configuration
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'postgresql://localhost/defi_analytics')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
+    app.config['LOAD_BATCH_SIZE'] = int(os.getenv('LOAD_BATCH_SIZE', 50000))
+    app.config['LOAD_MEMORY_BUDGET_MB'] = int(os.getenv('LOAD_MEMORY_BUDGET_MB', 512))
+    # Statements slower than this are recorded; 0 turns the recorder off
+    app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', 0))
+    app.config['SLOW_QUERY_LOG'] = os.getenv('SLOW_QUERY_LOG')
+    app.config['SLOW_QUERY_EXPLAIN'] = os.getenv('SLOW_QUERY_EXPLAIN', '1') == '1'
+    # In-memory columnar copy of the transactions for the dashboard, off by default
+    app.config['ANALYTICS_ENGINE'] = os.getenv('ANALYTICS_ENGINE', '0') == '1'
+    app.config['ANALYTICS_REFRESH_SECONDS'] = float(os.getenv('ANALYTICS_REFRESH_SECONDS', 5))
+    # Older than this the engine is skipped and the dashboard reads SQL
+    app.config['ANALYTICS_MAX_LAG_SECONDS'] = float(os.getenv('ANALYTICS_MAX_LAG_SECONDS', 60))
+    app.config['ANALYTICS_RECONCILE_SECONDS'] = float(os.getenv('ANALYTICS_RECONCILE_SECONDS', 300))
+    # Transactions older than ARCHIVE_AFTER_DAYS move to Parquet under ARCHIVE_DIR
+    app.config['ARCHIVE_DIR'] = os.getenv('ARCHIVE_DIR', 'archive')
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.getenv('ARCHIVE_AFTER_DAYS', 180))
+    # How often the stat counters are checked against the tables; 0 leaves it to reconcile-stats
+    app.config['STATS_RECONCILE_SECONDS'] = float(os.getenv('STATS_RECONCILE_SECONDS', 3600))
+    # Threads the dashboard bundle runs widgets on, each holding a connection while it runs
+    app.config['DASHBOARD_WORKERS'] = int(os.getenv('DASHBOARD_WORKERS', 8))
+    # Analytics responses are cached this long, then served stale while one request refreshes them; 0 turns it off
+    app.config['RESPONSE_CACHE_SECONDS'] = float(os.getenv('RESPONSE_CACHE_SECONDS', 30))
+    app.config['RESPONSE_CACHE_STALE_SECONDS'] = float(os.getenv('RESPONSE_CACHE_STALE_SECONDS', 300))
+    app.config['RESPONSE_CACHE_MAX_ENTRIES'] = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+    # How often the cache looks for writes made by other processes
+    app.config['RESPONSE_CACHE_CHECK_SECONDS'] = float(os.getenv('RESPONSE_CACHE_CHECK_SECONDS', 1))
+    # Most SQL statements a request may run in testing before it fails; 0 turns the check off
+    app.config['QUERY_BUDGET'] = int(os.getenv('QUERY_BUDGET', 25))
+    if config:
+        app.config.update(config)
     
     # Initialize extensions
     db.init_app(app)
-    migrate.init_app(app, db)
+    migrate.init_app(app, db, directory=os.path.join(os.path.dirname(app.root_path), 'migrations'))
     CORS(app, resources={r"/api/*": {"origins": "*"}})
     
     # Register blueprints
@@ -32,4 +62,46 @@ def create_app():
     app.register_blueprint(market.bp)
     app.register_blueprint(dashboard.bp)  # NEW
     
+    # Threads are only started by the first bundle request
+    app.extensions['dashboard_pool'] = ThreadPoolExecutor(
+        max_workers=app.config['DASHBOARD_WORKERS'], thread_name_prefix='dashboard'
+    )
+    
+    from .utils import query_counter
+    with app.app_context():
+        query_counter.install(app, db.engine)
+    
+    if app.config['SLOW_QUERY_MS']:
+        from .utils.slow_queries import SlowQueryRecorder
+        recorder = SlowQueryRecorder(app.config['SLOW_QUERY_MS'], log_path=app.config['SLOW_QUERY_LOG'],
+                                     explain=app.config['SLOW_QUERY_EXPLAIN'])
+        with app.app_context():
+            recorder.install(db.engine)
+        app.extensions['slow_queries'] = recorder
+    
+    if app.config['ANALYTICS_ENGINE']:
+        from .utils.columnar import AnalyticsEngine
+        # Loaded by the first dashboard request, so CLI commands never pay for it
+        app.extensions['analytics'] = AnalyticsEngine(
+            app,
+            refresh_seconds=app.config['ANALYTICS_REFRESH_SECONDS'],
+            max_lag_seconds=app.config['ANALYTICS_MAX_LAG_SECONDS'],
+            reconcile_seconds=app.config['ANALYTICS_RECONCILE_SECONDS']
+        )
+    
+    if app.config['STATS_RECONCILE_SECONDS']:
+        from .utils.counters import Reconciler
+        # Started by the first read of the counters, so CLI commands never run it
+        app.extensions['stat_counters'] = Reconciler(app, app.config['STATS_RECONCILE_SECONDS'])
+    
+    if app.config['RESPONSE_CACHE_SECONDS']:
+        from .utils.response_cache import ResponseCache
+        app.extensions['response_cache'] = ResponseCache(
+            app,
+            ttl=app.config['RESPONSE_CACHE_SECONDS'],
+            stale_seconds=app.config['RESPONSE_CACHE_STALE_SECONDS'],
+            max_entries=app.config['RESPONSE_CACHE_MAX_ENTRIES'],
+            check_seconds=app.config['RESPONSE_CACHE_CHECK_SECONDS']
+        )
+    
     return app
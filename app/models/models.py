@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from .types import HexBinary, ScaledInteger, UnitCount
 
 db = SQLAlchemy()
 
@@ -35,9 +36,9 @@ class Contract(db.Model):
     )
     
     contract_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    contract_address = db.Column(db.String(255), nullable=False, index=True)
+    contract_address = db.Column(HexBinary(255), nullable=False, index=True)
     blockchain = db.Column(db.String(50), nullable=False, index=True)
-    protocol_id = db.Column(db.Integer, db.ForeignKey('protocols.protocol_id'), nullable=False)
+    protocol_id = db.Column(db.Integer, db.ForeignKey('protocols.protocol_id'), nullable=False, index=True)
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -57,9 +58,14 @@ class Contract(db.Model):
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Listing orders by total_volume, optionally within one user_type
+        db.Index('ix_users_total_volume', 'total_volume'),
+        db.Index('ix_users_user_type_total_volume', 'user_type', 'total_volume'),
+    )
     
     user_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    user_address = db.Column(db.String(255), unique=True, nullable=False, index=True)
+    user_address = db.Column(HexBinary(255), unique=True, nullable=False, index=True)
     total_transactions = db.Column(db.Integer, default=0)
     total_volume = db.Column(db.Numeric(38, 18), default=0)
     first_transaction_date = db.Column(db.DateTime)
@@ -91,18 +97,29 @@ class User(db.Model):
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    # On PostgreSQL the table is range-partitioned by month on timestamp, so
+    # there the primary key and the hash unique index also include timestamp
+    # (see utils/partitions.py)
+    __table_args__ = (
+        # The list endpoint filters on one of these and orders by timestamp
+        db.Index('ix_transactions_contract_id_timestamp', 'contract_id', 'timestamp'),
+        db.Index('ix_transactions_from_address_timestamp', 'from_address', 'timestamp'),
+        db.Index('ix_transactions_status_timestamp', 'status', 'timestamp'),
+    )
     
     transaction_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    transaction_hash = db.Column(db.String(255), unique=True, nullable=False, index=True)
+    transaction_hash = db.Column(HexBinary(255), unique=True, nullable=False, index=True)
     contract_id = db.Column(db.Integer, db.ForeignKey('contracts.contract_id'), nullable=False)
-    from_user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'))
-    to_user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'))
-    from_address = db.Column(db.String(255), nullable=False, index=True)
-    to_address = db.Column(db.String(255), index=True)
-    value = db.Column(db.Numeric(38, 18))
+    # Copy of the contract's protocol_id, so protocol aggregates skip the contracts join
+    protocol_id = db.Column(db.Integer, db.ForeignKey('protocols.protocol_id'), nullable=False, index=True)
+    from_user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), index=True)
+    to_user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), index=True)
+    from_address = db.Column(HexBinary(255), nullable=False)
+    to_address = db.Column(HexBinary(255), index=True)
+    value = db.Column(ScaledInteger())
     gas_used = db.Column(db.BigInteger)
-    gas_price = db.Column(db.Numeric(38, 18))
-    transaction_fee = db.Column(db.Numeric(38, 18))
+    gas_price = db.Column(ScaledInteger())
+    transaction_fee = db.Column(ScaledInteger())
     timestamp = db.Column(db.DateTime, nullable=False, index=True)
     block_number = db.Column(db.BigInteger, index=True)
     status = db.Column(db.String(20), default='success')  # success, failed, pending
@@ -113,6 +130,7 @@ class Transaction(db.Model):
             'transaction_id': self.transaction_id,
             'transaction_hash': self.transaction_hash,
             'contract_id': self.contract_id,
+            'protocol_id': self.protocol_id,
             'from_address': self.from_address,
             'to_address': self.to_address,
             'value': str(self.value) if self.value else '0',
@@ -124,6 +142,25 @@ class Transaction(db.Model):
             'status': self.status
         }
 
+class TransactionDailyRollup(db.Model):
+    __tablename__ = 'transaction_daily_rollup'
+    # Kept in step with transactions by utils/rollup.py; averages are
+    # total / count over the rows where the column is not null
+
+    date = db.Column(db.Date, primary_key=True)
+    contract_id = db.Column(db.Integer, db.ForeignKey('contracts.contract_id', ondelete='CASCADE'), primary_key=True)
+    protocol_id = db.Column(db.Integer, db.ForeignKey('protocols.protocol_id', ondelete='CASCADE'),
+                            primary_key=True, index=True)
+    status = db.Column(db.String(20), primary_key=True)
+    tx_count = db.Column(db.BigInteger, nullable=False, default=0)
+    total_value = db.Column(db.Numeric(38, 18), nullable=False, default=0)
+    total_fee = db.Column(db.Numeric(38, 18), nullable=False, default=0)
+    fee_count = db.Column(db.BigInteger, nullable=False, default=0)
+    total_gas_used = db.Column(db.Numeric(38, 0), nullable=False, default=0)
+    gas_used_count = db.Column(db.BigInteger, nullable=False, default=0)
+    total_gas_price = db.Column(db.Numeric(38, 18), nullable=False, default=0)
+    gas_price_count = db.Column(db.BigInteger, nullable=False, default=0)
+
 class MarketData(db.Model):
     __tablename__ = 'market_data'
     
@@ -156,3 +193,68 @@ class MarketData(db.Model):
             'avg_transaction_value': str(self.avg_transaction_value) if self.avg_transaction_value else '0',
             'total_fees': str(self.total_fees) if self.total_fees else '0'
         }
+
+class IngestionManifest(db.Model):
+    __tablename__ = 'ingestion_manifest'
+    __table_args__ = (
+        db.UniqueConstraint('loader', 'fingerprint', name='uq_manifest_loader_fingerprint'),
+    )
+    
+    manifest_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    loader = db.Column(db.String(50), nullable=False)  # contracts, users, transactions, market
+    file_path = db.Column(db.String(1024), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False, index=True)
+    file_size = db.Column(db.BigInteger)
+    row_groups = db.Column(db.Integer)
+    total_rows = db.Column(db.BigInteger)
+    rows_loaded = db.Column(db.BigInteger, default=0)
+    status = db.Column(db.String(20), default='pending')  # pending, running, complete
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    
+    # Relationships
+    checkpoints = db.relationship('IngestionCheckpoint', backref='manifest', lazy='dynamic', cascade='all, delete-orphan')
+    
+    def to_dict(self):
+        return {
+            'manifest_id': self.manifest_id,
+            'loader': self.loader,
+            'file_path': self.file_path,
+            'fingerprint': self.fingerprint,
+            'file_size': self.file_size,
+            'row_groups': self.row_groups,
+            'total_rows': self.total_rows,
+            'rows_loaded': self.rows_loaded,
+            'status': self.status,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+class IngestionCheckpoint(db.Model):
+    __tablename__ = 'ingestion_checkpoints'
+    __table_args__ = (
+        db.UniqueConstraint('manifest_id', 'row_group', name='uq_checkpoint_row_group'),
+    )
+    
+    checkpoint_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    manifest_id = db.Column(db.Integer, db.ForeignKey('ingestion_manifest.manifest_id'), nullable=False)
+    row_group = db.Column(db.Integer, nullable=False)
+    rows_total = db.Column(db.BigInteger, nullable=False)
+    rows_committed = db.Column(db.BigInteger, default=0)  # offset to resume from
+    is_complete = db.Column(db.Boolean, default=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Watermark(db.Model):
+    __tablename__ = 'watermarks'
+    
+    name = db.Column(db.String(100), primary_key=True)  # job the watermark belongs to
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class StatCounter(db.Model):
+    __tablename__ = 'stat_counters'
+    # Global totals kept in step with the tables by utils/counters.py
+
+    name = db.Column(db.String(100), primary_key=True)
+    value = db.Column(UnitCount(), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,299 @@
+import re
+import sqlite3
+from decimal import Context, Decimal, InvalidOperation, ROUND_HALF_EVEN
+from sqlalchemy import event, literal_column, type_coerce
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import Float, LargeBinary, Numeric, String, TypeDecorator
+
+# Even-length 0x-prefixed hex: EVM addresses and hashes, and the like on other chains
+HEX_PATTERN = re.compile(r'0x(?:[0-9a-fA-F]{2})+')
+
+# Fractional digits kept by ScaledInteger amounts, wei for ether, and the
+# digits of the stored unit counts: the range and precision of the
+# numeric(38, 18) columns they replaced, which 64-bit counts cannot hold
+AMOUNT_DECIMALS = 18
+AMOUNT_PRECISION = 38
+
+# Scaling amounts and sums of them; the default context keeps only 28 digits
+SCALE_CONTEXT = Context(prec=2 * AMOUNT_PRECISION)
+
+# First byte of a stored value: raw bytes of a hex string, or UTF-8 text of anything else
+HEX_TAG = b'\x00'
+TEXT_TAG = b'\x01'
+
+
+def to_binary(value):
+    """Storage form of an address or hash string"""
+    if value is None:
+        return None
+    if HEX_PATTERN.fullmatch(value):
+        return HEX_TAG + bytes.fromhex(value[2:])
+    return TEXT_TAG + value.encode('utf-8')
+
+
+def from_binary(value):
+    """API form of a stored address or hash; hex comes back lower case"""
+    if value is None:
+        return None
+    value = bytes(value)
+    if value[:1] == HEX_TAG:
+        return '0x' + value[1:].hex()
+    return value[1:].decode('utf-8')
+
+
+def to_binary_sql(expression):
+    """PostgreSQL expression turning text into the storage form, for raw SQL and COPY staging"""
+    return (
+        f"CASE WHEN {expression} ~ '^{HEX_PATTERN.pattern}$' "
+        f"THEN '\\x00'::bytea || decode(substr({expression}, 3), 'hex') "
+        f"ELSE '\\x01'::bytea || convert_to({expression}, 'UTF8') END"
+    )
+
+
+class HexBinary(TypeDecorator):
+    """Address or hash string stored as bytes.
+
+    0x-prefixed hex is kept as its raw bytes, half the size of the text and
+    of its index entries, and read back lower case. Any other string (base58
+    and bech32 addresses of non-EVM chains) is kept as UTF-8 and read back as
+    given. One leading byte tells the two apart. length caps the string form.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, length=None):
+        super().__init__()
+        self.length = length
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and self.length is not None and len(value) > self.length:
+            raise ValueError(f'Value is longer than {self.length} characters')
+        return to_binary(value)
+
+    def process_result_value(self, value, dialect):
+        return from_binary(value)
+
+
+def parse_amount(value):
+    """An amount given as a number or a numeric string as an exact Decimal, or None if it is not one"""
+    if isinstance(value, bool):
+        return None
+    try:
+        amount = value if isinstance(value, Decimal) else Decimal(str(value).strip())
+    except InvalidOperation:
+        return None
+    return amount if amount.is_finite() else None
+
+
+def to_scaled(value, decimals=AMOUNT_DECIMALS, precision=AMOUNT_PRECISION):
+    """Integer count of 10**-decimals units in an amount, rounded half to even"""
+    if value is None:
+        return None
+    # str() keeps a float's shortest repr instead of its binary expansion, and
+    # takes NumPy scalars from DataFrames too
+    amount = value if isinstance(value, Decimal) else Decimal(str(value))
+    scaled = int(amount.scaleb(decimals, SCALE_CONTEXT).to_integral_value(ROUND_HALF_EVEN))
+    if abs(scaled) >= 10 ** precision:
+        raise ValueError(f'{value} does not fit in a {precision}-digit amount')
+    return scaled
+
+
+def from_scaled(value, decimals=AMOUNT_DECIMALS):
+    """Amount as a Decimal from a count of units, or from a sum or average of them"""
+    if value is None:
+        return None
+    amount = Decimal(str(value)) if isinstance(value, float) else Decimal(value)
+    return amount.scaleb(-decimals, SCALE_CONTEXT)
+
+
+def to_scaled_sql(expression, decimals=AMOUNT_DECIMALS, precision=AMOUNT_PRECISION):
+    """PostgreSQL expression turning a numeric amount into its stored units"""
+    return f'round({expression} * 1e{decimals})::numeric({precision}, 0)'
+
+
+def fits_sql(expression, decimals=AMOUNT_DECIMALS, precision=AMOUNT_PRECISION):
+    """PostgreSQL condition that a numeric amount, or null, can be stored as units"""
+    return f'({expression} IS NULL OR round(abs({expression}), {decimals}) < 1e{precision - decimals})'
+
+
+def from_scaled_sql(expression, decimals=AMOUNT_DECIMALS):
+    """SQL expression turning stored units, or a sum of them, into a numeric amount"""
+    return f'({expression}) * 1e-{decimals}'
+
+
+class _SumUnits:
+    """SQLite aggregate summing float units as integers, exactly, into text that cannot overflow"""
+
+    def __init__(self):
+        self.total = None
+
+    def step(self, value):
+        if value is not None:
+            self.total = (self.total or 0) + int(value)
+
+    def finalize(self):
+        return None if self.total is None else str(self.total)
+
+
+def _add_units(a, b):
+    return None if a is None or b is None else str(int(a) + int(b))
+
+
+@event.listens_for(Engine, 'connect')
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_aggregate('sum_units', 1, _SumUnits)
+        dbapi_connection.create_function('add_units', 2, _add_units, deterministic=True)
+
+
+class UnitCount(TypeDecorator):
+    """Integer of up to 38 digits, such as a sum of ScaledInteger units, as an int.
+
+    numeric(38, 0), except on SQLite, which would keep it as a float: there
+    it is decimal text, and add_units() adds to it exactly.
+    """
+
+    impl = Numeric
+    cache_ok = True
+
+    def __init__(self):
+        super().__init__(AMOUNT_PRECISION, 0)
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'sqlite':
+            return dialect.type_descriptor(String())
+        return dialect.type_descriptor(self.impl)
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return str(int(value)) if dialect.name == 'sqlite' else int(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else int(value)
+
+
+class add_units(FunctionElement):
+    """a + b of two UnitCount expressions, exact on SQLite too"""
+    inherit_cache = True
+    type = UnitCount()
+
+
+@compiles(add_units)
+def _compile_add_units(element, compiler, **kw):
+    a, b = element.clauses
+    return f'({compiler.process(a, **kw)} + {compiler.process(b, **kw)})'
+
+
+@compiles(add_units, 'sqlite')
+def _compile_add_units_sqlite(element, compiler, **kw):
+    return f'add_units({compiler.process(element.clauses, **kw)})'
+
+
+class _sum_units(FunctionElement):
+    """SUM of a column in its units; see ScaledInteger.sum_units"""
+    inherit_cache = True
+    type = UnitCount()
+
+
+@compiles(_sum_units)
+def _compile_sum_units(element, compiler, **kw):
+    return f'sum({compiler.process(element.clauses, **kw)})'
+
+
+@compiles(_sum_units, 'sqlite')
+def _compile_sum_units_sqlite(element, compiler, **kw):
+    return f'sum_units({compiler.process(element.clauses, **kw)})'
+
+
+class _unscale(FunctionElement):
+    """(units, decimals) as a numeric amount; see ScaledInteger.unscaled"""
+    inherit_cache = True
+    type = Numeric(38, 18)
+
+
+@compiles(_unscale)
+def _compile_unscale(element, compiler, **kw):
+    units, decimals = element.clauses
+    return f'({compiler.process(units, **kw)}) * 1e-{compiler.process(decimals, **kw)}'
+
+
+@compiles(_unscale, 'sqlite')
+def _compile_unscale_sqlite(element, compiler, **kw):
+    # 1e-18 is inexact as a float and would leave noise in the last digits;
+    # powers of ten up to 1e22 are exact, so dividing rounds only once
+    units, decimals = element.clauses
+    return f'({compiler.process(units, **kw)}) / 1e{compiler.process(decimals, **kw)}'
+
+
+class ScaledInteger(TypeDecorator):
+    """Decimal amount stored as a count of 10**-decimals units, in a
+    numeric(precision, 0) column.
+
+    This rescales numeric(38, 18) to a scale of 0 rather than moving to
+    integer arithmetic: 38 digits do not fit 64 bits, so PostgreSQL still
+    sums the column as numeric, only without scale handling. Sums of units
+    are exact in every reader: SQL, the Parquet archive as decimal128 and
+    the stat counters. func.sum() of the column keeps its type, so sums
+    come back as amounts too; other aggregates, and sums written straight
+    into another table, go through unscaled().
+
+    SQLite has no exact type this wide, so there the units are floats. That
+    keeps the 15 significant digits its numeric amounts had, and amounts
+    with no more than that come back, and sum, as they would have. Sums
+    that must stay exact, such as the stat counters, use sum_units().
+    """
+
+    impl = Numeric
+    cache_ok = True
+
+    def __init__(self, decimals=AMOUNT_DECIMALS, precision=AMOUNT_PRECISION):
+        super().__init__(precision, 0)
+        self.decimals = decimals
+        self.precision = precision
+
+    @property
+    def max_value(self):
+        """Smallest amount too large to store"""
+        return Decimal(10 ** self.precision).scaleb(-self.decimals)
+
+    def fits(self, value):
+        """Whether value is an amount the column can store"""
+        amount = parse_amount(value)
+        if amount is None:
+            return False
+        try:
+            to_scaled(amount, self.decimals, self.precision)
+        except ValueError:
+            return False
+        return True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'sqlite':
+            return dialect.type_descriptor(Float())
+        return dialect.type_descriptor(self.impl)
+
+    def process_bind_param(self, value, dialect):
+        units = to_scaled(value, self.decimals, self.precision)
+        if units is not None and dialect.name == 'sqlite':
+            return float(units)
+        return units
+
+    def process_result_value(self, value, dialect):
+        return from_scaled(value, self.decimals)
+
+    def units(self, expression):
+        """expression of this column, or a sum of it, in its stored units rather than as an amount"""
+        return type_coerce(expression, Numeric(self.precision, 0))
+
+    def sum_units(self, expression):
+        """SUM of expression, in units of this column, as an int. Exact on
+        SQLite too, where sum() would add the units up as floats"""
+        return _sum_units(expression)
+
+    def unscaled(self, expression):
+        """expression, in units of this column, as a Numeric amount in SQL"""
+        return _unscale(expression, literal_column(str(self.decimals)))
@@ -1,10 +1,18 @@
 from flask import Blueprint, request, jsonify
-from ..models.models import db, Contract, Protocol
+from ..models.models import db, Contract, Protocol, Transaction
+from ..utils import archive, counters, pagination, rollup
+from ..utils.query_counter import query_budget
+from ..utils.response_cache import cached, invalidates
+from sqlalchemy.orm import joinedload
 
 bp = Blueprint('contracts', __name__, url_prefix='/api/contracts')
 
+# Listing order
+LIST_ORDER = [(Contract.contract_id, False)]
+
 # CREATE
 @bp.route('', methods=['POST'])
+@invalidates('contracts')
 def create_contract():
     data = request.get_json()
     
@@ -28,32 +36,38 @@ def create_contract():
     )
     
     db.session.add(contract)
+    counters.add({counters.CONTRACTS: 1, counters.chain(contract.blockchain): 1})
     db.session.commit()
     
     return jsonify({'message': 'Contract created', 'contract': contract.to_dict()}), 201
 
 # READ - Get all contracts
 @bp.route('', methods=['GET'])
+@query_budget(3)
 def get_contracts():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     blockchain = request.args.get('blockchain')
     protocol_id = request.args.get('protocol_id', type=int)
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total')
     
-    query = Contract.query
+    # to_dict() reads protocol_name, so the protocols come in the same query
+    query = Contract.query.options(joinedload(Contract.protocol))
     
     if blockchain:
         query = query.filter_by(blockchain=blockchain)
     if protocol_id:
         query = query.filter_by(protocol_id=protocol_id)
     
-    paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+    try:
+        items, fields = pagination.paginate(query, LIST_ORDER, page, per_page, cursor, include_total)
+    except pagination.PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
-        'contracts': [c.to_dict() for c in paginated.items],
-        'total': paginated.total,
-        'pages': paginated.pages,
-        'current_page': page
+        'contracts': [c.to_dict() for c in items],
+        **fields
     })
 
 # READ - Get single contract
@@ -64,6 +78,7 @@ def get_contract(contract_id):
 
 # UPDATE
 @bp.route('/<int:contract_id>', methods=['PUT'])
+@invalidates('contracts', 'transactions')
 def update_contract(contract_id):
     contract = Contract.query.get_or_404(contract_id)
     data = request.get_json()
@@ -72,8 +87,20 @@ def update_contract(contract_id):
         contract.is_active = data['is_active']
     if 'contract_address' in data:
         contract.contract_address = data['contract_address']
-    if 'blockchain' in data:
+    if 'blockchain' in data and data['blockchain'] != contract.blockchain:
+        counters.add({counters.chain(contract.blockchain): -1, counters.chain(data['blockchain']): 1})
         contract.blockchain = data['blockchain']
+    if 'protocol_id' in data and data['protocol_id'] != contract.protocol_id:
+        if not db.session.get(Protocol, data['protocol_id']):
+            return jsonify({'error': 'Protocol not found'}), 400
+        contract.protocol_id = data['protocol_id']
+        # Transactions and the rollup carry their own copy of the protocol
+        Transaction.query.filter_by(contract_id=contract_id).update(
+            {'protocol_id': data['protocol_id']}, synchronize_session=False
+        )
+        rollup.move_contract(contract_id, data['protocol_id'])
+        # Archived transactions keep theirs, so archive reads look it up again
+        archive.bump_version()
     
     db.session.commit()
     
@@ -81,15 +108,21 @@ def update_contract(contract_id):
 
 # DELETE
 @bp.route('/<int:contract_id>', methods=['DELETE'])
+@invalidates('contracts', 'transactions')
 def delete_contract(contract_id):
     contract = Contract.query.get_or_404(contract_id)
+    counters.remove_contract(contract_id)
+    rollup.remove_contract(contract_id)
     db.session.delete(contract)
+    # Its transactions go with it, and archive reads leave out its archived ones
+    archive.bump_version()
     db.session.commit()
     
     return jsonify({'message': 'Contract deleted'}), 200
 
 # ANALYTICS - Contracts by blockchain
 @bp.route('/by-blockchain', methods=['GET'])
+@cached('contracts')
 def contracts_by_blockchain():
     from sqlalchemy import func
     
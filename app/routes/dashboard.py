@@ -1,16 +1,62 @@
-from flask import Blueprint, request, jsonify
-from ..models.models import db, Protocol, Contract, User, Transaction, MarketData
+from flask import Blueprint, request, jsonify, current_app, g
+from ..models.models import db, Protocol, Contract, User, Transaction, TransactionDailyRollup, MarketData
+from ..models.types import from_scaled
+from ..utils import archive, counters, query_counter, timeseries
+from ..utils.response_cache import cached, TAGS
 from sqlalchemy import func, desc, extract
 from datetime import datetime, timedelta
 import random
+import time
 
 bp = Blueprint('dashboard', __name__, url_prefix='/api/dashboard')
 
+
+def _analytics():
+    """The in-memory analytics engine when it is enabled and fresh, else None to read SQL"""
+    engine = current_app.extensions.get('analytics')
+    if engine is None:
+        return None
+    engine.start()
+    ready = engine.ready()
+    g.analytics_source = 'memory' if ready else 'sql'
+    return engine if ready else None
+
+
+@bp.after_request
+def _analytics_source_header(response):
+    if 'analytics_source' in g:
+        response.headers['X-Analytics-Source'] = g.analytics_source
+    return response
+
+
+# ============================================
+# In-memory analytics engine status
+# ============================================
+@bp.route('/engine', methods=['GET'])
+def get_engine_status():
+    """Rows, memory footprint and refresh lag of the in-memory analytics engine"""
+    engine = current_app.extensions.get('analytics')
+    return jsonify({
+        'success': True,
+        'data': dict(engine.status(), enabled=True) if engine else {'enabled': False}
+    })
+
+# ============================================
+# Response cache status
+# ============================================
+@bp.route('/cache', methods=['GET'])
+def get_cache_status():
+    """Entries, hits and misses of the analytics response cache"""
+    cache = current_app.extensions.get('response_cache')
+    return jsonify({
+        'success': True,
+        'data': dict(cache.status(), enabled=True) if cache else {'enabled': False}
+    })
+
 # ============================================
 # 1. Protocol Distribution by Type (Pie Chart)
 # ============================================
-@bp.route('/protocol-distribution', methods=['GET'])
-def get_protocol_distribution():
+def _protocol_distribution():
     """Get distribution of protocols by type (DEX, Lending, etc.)"""
     results = db.session.query(
         Protocol.type,
@@ -19,16 +65,17 @@ def get_protocol_distribution():
     
     data = [{'name': r[0], 'value': r[1]} for r in results]
     
-    return jsonify({
-        'success': True,
-        'data': data
-    })
+    return {'data': data}
+
+@bp.route('/protocol-distribution', methods=['GET'])
+@cached('protocols')
+def get_protocol_distribution():
+    return jsonify(success=True, **_protocol_distribution())
 
 # ============================================
 # 2. Contracts by Blockchain (Bar Chart)
 # ============================================
-@bp.route('/contracts-by-blockchain', methods=['GET'])
-def get_contracts_by_blockchain():
+def _contracts_by_blockchain():
     """Get number of contracts deployed on each blockchain"""
     results = db.session.query(
         Contract.blockchain,
@@ -39,35 +86,38 @@ def get_contracts_by_blockchain():
     
     data = [{'blockchain': r[0], 'contracts': r[1]} for r in results]
     
-    return jsonify({
-        'success': True,
-        'data': data
-    })
+    return {'data': data}
+
+@bp.route('/contracts-by-blockchain', methods=['GET'])
+@cached('contracts')
+def get_contracts_by_blockchain():
+    return jsonify(success=True, **_contracts_by_blockchain())
 
 # ============================================
 # 3. Transaction Volume Over Time (Line Chart)
 # ============================================
-@bp.route('/transaction-volume', methods=['GET'])
-def get_transaction_volume():
+def _transaction_volume(days=30):
     """Get transaction volume over time"""
-    days = request.args.get('days', 30, type=int)
-    
     # Try to get real data first
-    start_date = datetime.utcnow() - timedelta(days=days)
+    start_date = datetime.utcnow().date() - timedelta(days=days)
     
-    results = db.session.query(
-        func.date(Transaction.timestamp).label('date'),
-        func.sum(Transaction.value).label('volume'),
-        func.count(Transaction.transaction_id).label('count')
-    ).filter(Transaction.timestamp >= start_date)\
-     .group_by(func.date(Transaction.timestamp))\
-     .order_by(func.date(Transaction.timestamp)).all()
+    engine = _analytics()
+    if engine:
+        results = engine.volume_by_day(start_date)
+    else:
+        results = db.session.query(
+            TransactionDailyRollup.date,
+            func.sum(TransactionDailyRollup.total_value).label('volume'),
+            func.sum(TransactionDailyRollup.tx_count).label('count')
+        ).filter(TransactionDailyRollup.date >= start_date)\
+         .group_by(TransactionDailyRollup.date)\
+         .order_by(TransactionDailyRollup.date).all()
     
     if results:
         data = [{
             'date': r[0].strftime('%Y-%m-%d') if r[0] else None,
             'volume': float(r[1]) if r[1] else 0,
-            'transactions': r[2]
+            'transactions': int(r[2])
         } for r in results]
     else:
         # Generate sample data if no transactions exist
@@ -80,31 +130,40 @@ def get_transaction_volume():
                 'transactions': random.randint(100, 1000)
             })
     
-    return jsonify({
-        'success': True,
-        'data': data
-    })
+    return {'data': data}
+
+@bp.route('/transaction-volume', methods=['GET'])
+@cached('transactions')
+def get_transaction_volume():
+    return jsonify(success=True, **_transaction_volume(days=request.args.get('days', 30, type=int)))
 
 # ============================================
 # 4. Top Protocols by Volume (Horizontal Bar)
 # ============================================
-@bp.route('/top-protocols', methods=['GET'])
-def get_top_protocols():
+def _top_protocols(limit=10):
     """Get top protocols by transaction volume"""
-    limit = request.args.get('limit', 10, type=int)
-    
     # Try real data first
-    results = db.session.query(
-        Protocol.protocol_name,
-        Protocol.protocol_symbol,
-        Protocol.type,
-        func.coalesce(func.sum(Transaction.value), 0).label('total_volume'),
-        func.count(Transaction.transaction_id).label('tx_count')
-    ).outerjoin(Contract, Protocol.protocol_id == Contract.protocol_id)\
-     .outerjoin(Transaction, Contract.contract_id == Transaction.contract_id)\
-     .group_by(Protocol.protocol_id, Protocol.protocol_name, Protocol.protocol_symbol, Protocol.type)\
-     .order_by(desc(func.sum(Transaction.value)))\
-     .limit(limit).all()
+    engine = _analytics()
+    if engine:
+        volumes = engine.protocol_volumes()
+        protocols = db.session.query(
+            Protocol.protocol_id, Protocol.protocol_name, Protocol.protocol_symbol, Protocol.type
+        ).all()
+        results = sorted(
+            ((p[1], p[2], p[3]) + volumes.get(p[0], (0, 0)) for p in protocols),
+            key=lambda r: r[3], reverse=True
+        )[:limit]
+    else:
+        results = db.session.query(
+            Protocol.protocol_name,
+            Protocol.protocol_symbol,
+            Protocol.type,
+            func.coalesce(func.sum(TransactionDailyRollup.total_value), 0).label('total_volume'),
+            func.coalesce(func.sum(TransactionDailyRollup.tx_count), 0).label('tx_count')
+        ).outerjoin(TransactionDailyRollup, Protocol.protocol_id == TransactionDailyRollup.protocol_id)\
+         .group_by(Protocol.protocol_id, Protocol.protocol_name, Protocol.protocol_symbol, Protocol.type)\
+         .order_by(desc(func.sum(TransactionDailyRollup.total_value)))\
+         .limit(limit).all()
     
     if results and any(r[3] > 0 for r in results):
         data = [{
@@ -112,7 +171,7 @@ def get_top_protocols():
             'symbol': r[1],
             'type': r[2],
             'volume': float(r[3]) if r[3] else 0,
-            'transactions': r[4]
+            'transactions': int(r[4])
         } for r in results]
     else:
         # Generate sample data based on existing protocols
@@ -125,19 +184,18 @@ def get_top_protocols():
             'transactions': random.randint(500, 5000)
         } for p in protocols]
     
-    return jsonify({
-        'success': True,
-        'data': data
-    })
+    return {'data': data}
+
+@bp.route('/top-protocols', methods=['GET'])
+@cached('protocols', 'transactions')
+def get_top_protocols():
+    return jsonify(success=True, **_top_protocols(limit=request.args.get('limit', 10, type=int)))
 
 # ============================================
 # 5. User Activity Trends (Area Chart)
 # ============================================
-@bp.route('/user-activity', methods=['GET'])
-def get_user_activity():
+def _user_activity(days=30):
     """Get user activity trends over time"""
-    days = request.args.get('days', 30, type=int)
-    
     # Check for market data
     start_date = datetime.utcnow().date() - timedelta(days=days)
     
@@ -169,70 +227,75 @@ def get_user_activity():
                 'transactions': random.randint(1000, 5000)
             })
     
-    return jsonify({
-        'success': True,
-        'data': data
-    })
+    return {'data': data}
+
+@bp.route('/user-activity', methods=['GET'])
+@cached('market_data')
+def get_user_activity():
+    return jsonify(success=True, **_user_activity(days=request.args.get('days', 30, type=int)))
 
 # ============================================
 # 6. Market Performance by Protocol (Multi-line)
 # ============================================
-@bp.route('/market-performance', methods=['GET'])
-def get_market_performance():
-    """Get market performance comparison across protocols"""
-    days = request.args.get('days', 14, type=int)
-    
-    # Get top 5 protocols
-    top_protocols = Protocol.query.limit(5).all()
+def _market_performance(days=14, limit=5):
+    """Get market performance comparison across the protocols with the most volume"""
+    end_date = datetime.utcnow().date()
+    start_date = end_date - timedelta(days=days - 1)
     
-    if not top_protocols:
-        return jsonify({'success': True, 'data': []})
+    # The whole date x protocol matrix in one grouped query
+    volumes = timeseries.market_series('total_volume', start_date, end_date, limit=limit)
     
-    data = []
-    for i in range(days):
-        date = datetime.utcnow() - timedelta(days=days-i-1)
-        entry = {'date': date.strftime('%Y-%m-%d')}
-        
-        for protocol in top_protocols:
-            # Try to get real market data
-            market_entry = MarketData.query.filter(
-                MarketData.protocol_id == protocol.protocol_id,
-                MarketData.date == date.date()
-            ).first()
-            
-            if market_entry:
-                entry[protocol.protocol_symbol.upper()] = float(market_entry.total_volume) if market_entry.total_volume else 0
-            else:
-                # Generate sample data
-                entry[protocol.protocol_symbol.upper()] = random.uniform(5000, 50000)
-        
-        data.append(entry)
-    
-    protocols_list = [p.protocol_symbol.upper() for p in top_protocols]
+    if len(volumes.columns):
+        symbols = dict(db.session.query(Protocol.protocol_id, Protocol.protocol_symbol)
+                       .filter(Protocol.protocol_id.in_([int(p) for p in volumes.columns])).all())
+        volumes = volumes.rename(columns=lambda p: symbols[p].upper())
+        volumes.index = [d.strftime('%Y-%m-%d') for d in volumes.index]
+        data = volumes.reset_index(names='date').to_dict('records')
+        protocols_list = list(volumes.columns)
+    else:
+        # Generate sample data
+        top_protocols = Protocol.query.limit(limit).all()
+        if not top_protocols:
+            return {'data': []}
+        protocols_list = [p.protocol_symbol.upper() for p in top_protocols]
+        data = [
+            dict({'date': date.strftime('%Y-%m-%d')}, **{p: random.uniform(5000, 50000) for p in protocols_list})
+            for date in timeseries.date_range(start_date, end_date)
+        ]
     
-    return jsonify({
-        'success': True,
+    return {
         'data': data,
         'protocols': protocols_list
-    })
+    }
+
+@bp.route('/market-performance', methods=['GET'])
+@cached('protocols', 'market_data')
+def get_market_performance():
+    return jsonify(success=True, **_market_performance(
+        days=request.args.get('days', 14, type=int), limit=request.args.get('limit', 5, type=int)
+    ))
 
 # ============================================
 # 7. Gas Fee Analysis (Line Chart)
 # ============================================
-@bp.route('/gas-analysis', methods=['GET'])
-def get_gas_analysis():
+def _gas_analysis(days=30):
     """Get gas fee analysis over time"""
-    days = request.args.get('days', 30, type=int)
-    start_date = datetime.utcnow() - timedelta(days=days)
+    start_date = datetime.utcnow().date() - timedelta(days=days)
     
-    results = db.session.query(
-        func.date(Transaction.timestamp).label('date'),
-        func.avg(Transaction.gas_price).label('avg_gas_price'),
-        func.avg(Transaction.transaction_fee).label('avg_fee'),
-        func.sum(Transaction.transaction_fee).label('total_fees')
-    ).filter(Transaction.timestamp >= start_date)\
-     .group_by(func.date(Transaction.timestamp))\
-     .order_by(func.date(Transaction.timestamp)).all()
+    # Averages over the rows that have a value, as AVG() would
+    engine = _analytics()
+    if engine:
+        results = engine.gas_by_day(start_date)
+    else:
+        rollup = TransactionDailyRollup
+        results = db.session.query(
+            rollup.date,
+            func.sum(rollup.total_gas_price) / func.nullif(func.sum(rollup.gas_price_count), 0),
+            func.sum(rollup.total_fee) / func.nullif(func.sum(rollup.fee_count), 0),
+            func.sum(rollup.total_fee)
+        ).filter(rollup.date >= start_date)\
+         .group_by(rollup.date)\
+         .order_by(rollup.date).all()
     
     if results and any(r[1] for r in results):
         data = [{
@@ -253,27 +316,36 @@ def get_gas_analysis():
                 'totalFees': random.uniform(10000, 50000)
             })
     
-    return jsonify({
-        'success': True,
-        'data': data
-    })
+    return {'data': data}
+
+@bp.route('/gas-analysis', methods=['GET'])
+@cached('transactions')
+def get_gas_analysis():
+    return jsonify(success=True, **_gas_analysis(days=request.args.get('days', 30, type=int)))
 
 # ============================================
 # 8. Protocol Market Share (Donut/Treemap)
 # ============================================
-@bp.route('/market-share', methods=['GET'])
-def get_market_share():
+def _market_share():
     """Get protocol market share by transaction volume"""
     # Try real data
-    results = db.session.query(
-        Protocol.protocol_name,
-        Protocol.type,
-        func.coalesce(func.sum(Transaction.value), 0).label('volume')
-    ).outerjoin(Contract, Protocol.protocol_id == Contract.protocol_id)\
-     .outerjoin(Transaction, Contract.contract_id == Transaction.contract_id)\
-     .group_by(Protocol.protocol_id, Protocol.protocol_name, Protocol.type)\
-     .order_by(desc(func.sum(Transaction.value)))\
-     .limit(10).all()
+    engine = _analytics()
+    if engine:
+        volumes = engine.protocol_volumes()
+        protocols = db.session.query(Protocol.protocol_id, Protocol.protocol_name, Protocol.type).all()
+        results = sorted(
+            ((p[1], p[2], volumes.get(p[0], (0, 0))[0]) for p in protocols),
+            key=lambda r: r[2], reverse=True
+        )[:10]
+    else:
+        results = db.session.query(
+            Protocol.protocol_name,
+            Protocol.type,
+            func.coalesce(func.sum(TransactionDailyRollup.total_value), 0).label('volume')
+        ).outerjoin(TransactionDailyRollup, Protocol.protocol_id == TransactionDailyRollup.protocol_id)\
+         .group_by(Protocol.protocol_id, Protocol.protocol_name, Protocol.type)\
+         .order_by(desc(func.sum(TransactionDailyRollup.total_value)))\
+         .limit(10).all()
     
     if results and any(r[2] > 0 for r in results):
         total = sum(float(r[2]) for r in results if r[2])
@@ -295,30 +367,30 @@ def get_market_share():
             'percentage': round(volumes[i] / total * 100, 2)
         } for i, p in enumerate(protocols)]
     
-    return jsonify({
-        'success': True,
-        'data': data
-    })
+    return {'data': data}
+
+@bp.route('/market-share', methods=['GET'])
+@cached('protocols', 'transactions')
+def get_market_share():
+    return jsonify(success=True, **_market_share())
 
 # ============================================
 # Summary Statistics
 # ============================================
-@bp.route('/summary', methods=['GET'])
-def get_summary():
+def _summary():
     """Get dashboard summary statistics"""
-    total_protocols = Protocol.query.count()
-    total_contracts = Contract.query.count()
-    total_users = User.query.count()
-    total_transactions = Transaction.query.count()
+    values = counters.read()
+    total_protocols = values.get(counters.PROTOCOLS, 0)
+    total_contracts = values.get(counters.CONTRACTS, 0)
+    total_users = values.get(counters.USERS, 0)
     
-    # Get total volume
-    total_volume = db.session.query(func.sum(Transaction.value)).scalar() or 0
+    archived = archive.totals()
+    total_transactions = values.get(counters.TRANSACTIONS, 0) + archived['count']
+    total_volume = from_scaled(values.get(counters.TRANSACTION_VALUE, 0) + archived['value'])
     
-    # Get unique blockchains
-    unique_blockchains = db.session.query(func.count(func.distinct(Contract.blockchain))).scalar() or 0
+    unique_blockchains = counters.distinct_chains(values)
     
-    return jsonify({
-        'success': True,
+    return {
         'data': {
             'totalProtocols': total_protocols,
             'totalContracts': total_contracts,
@@ -327,4 +399,87 @@ def get_summary():
             'totalVolume': float(total_volume) if total_volume > 0 else random.uniform(1000000, 10000000),
             'uniqueBlockchains': unique_blockchains
         }
+    }
+
+@bp.route('/summary', methods=['GET'])
+@cached('protocols', 'contracts', 'users', 'transactions')
+def get_summary():
+    return jsonify(success=True, **_summary())
+
+# ============================================
+# Bundle of Widgets (one request for the whole dashboard)
+# ============================================
+# Widget name -> (function, query parameters it takes and their defaults)
+WIDGETS = {
+    'summary': (_summary, {}),
+    'protocol-distribution': (_protocol_distribution, {}),
+    'contracts-by-blockchain': (_contracts_by_blockchain, {}),
+    'transaction-volume': (_transaction_volume, {'days': 30}),
+    'top-protocols': (_top_protocols, {'limit': 10}),
+    'user-activity': (_user_activity, {'days': 30}),
+    'market-performance': (_market_performance, {'days': 14, 'limit': 5}),
+    'gas-analysis': (_gas_analysis, {'days': 30}),
+    'market-share': (_market_share, {}),
+}
+
+
+def _widget_params(name, params):
+    """A widget's parameters from <name>.<param>, else the shared <param>, else its default"""
+    return {
+        param: request.args.get(f'{name}.{param}', request.args.get(param, default, type=int), type=int)
+        for param, default in params.items()
+    }
+
+
+def _run_widget(app, name, params):
+    """One widget in an app context of its own, so on its own session and connection"""
+    started = time.perf_counter()
+    result = {}
+    with app.app_context():
+        query_counter.start()
+        try:
+            result.update(WIDGETS[name][0](**params))
+        except Exception as e:
+            app.logger.exception('Dashboard widget %s failed', name)
+            result['error'] = str(e)
+        if 'analytics_source' in g:
+            result['source'] = g.analytics_source
+        result['queries'] = query_counter.count()
+    result['ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return name, result
+
+
+@bp.route('/bundle', methods=['GET'])
+@cached(*TAGS)
+def get_bundle():
+    """Several widgets in one response, run concurrently on the dashboard pool.
+
+    widgets is a comma-separated list of names in WIDGETS (all of them when
+    missing). days and limit apply to every widget taking them, and
+    <widget>.days to one alone. A failing widget gets an error in place of
+    its data without failing the others.
+    """
+    names = [name for name in request.args.get('widgets', ','.join(WIDGETS)).split(',') if name]
+    unknown = [name for name in names if name not in WIDGETS]
+    if unknown:
+        return jsonify({'error': f"Unknown widgets: {', '.join(unknown)}"}), 400
+    
+    app = current_app._get_current_object()
+    pool = current_app.extensions['dashboard_pool']
+    started = time.perf_counter()
+    futures = [
+        pool.submit(_run_widget, app, name, _widget_params(name, WIDGETS[name][1]))
+        for name in dict.fromkeys(names)
+    ]
+    widgets = dict(future.result() for future in futures)
+    query_counter.add(sum(widget['queries'] for widget in widgets.values()))
+    
+    sources = {widget['source'] for widget in widgets.values() if 'source' in widget}
+    if sources:
+        g.analytics_source = sources.pop() if len(sources) == 1 else 'mixed'
+    
+    return jsonify({
+        'success': True,
+        'widgets': widgets,
+        'ms': round((time.perf_counter() - started) * 1000, 1)
     })
@@ -1,12 +1,20 @@
 from flask import Blueprint, request, jsonify
 from ..models.models import db, MarketData, Protocol
+from ..utils import pagination, timeseries
+from ..utils.query_counter import query_budget
+from ..utils.response_cache import cached, invalidates
 from sqlalchemy import func, desc
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
 
 bp = Blueprint('market', __name__, url_prefix='/api/market')
 
+# Listing order; market_id breaks ties so cursors point at one row
+LIST_ORDER = [(MarketData.date, True), (MarketData.market_id, True)]
+
 # CREATE
 @bp.route('', methods=['POST'])
+@invalidates('market_data')
 def create_market_data():
     data = request.get_json()
     
@@ -31,25 +39,28 @@ def create_market_data():
 
 # READ - Get all market data
 @bp.route('', methods=['GET'])
+@query_budget(3)
 def get_market_data():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     protocol_id = request.args.get('protocol_id', type=int)
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total')
     
-    query = MarketData.query
+    # to_dict() reads protocol_name, so the protocols come in the same query
+    query = MarketData.query.options(joinedload(MarketData.protocol))
     
     if protocol_id:
         query = query.filter_by(protocol_id=protocol_id)
     
-    paginated = query.order_by(desc(MarketData.date)).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        items, fields = pagination.paginate(query, LIST_ORDER, page, per_page, cursor, include_total)
+    except pagination.PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
-        'market_data': [m.to_dict() for m in paginated.items],
-        'total': paginated.total,
-        'pages': paginated.pages,
-        'current_page': page
+        'market_data': [m.to_dict() for m in items],
+        **fields
     })
 
 # READ - Get single market data entry
@@ -60,6 +71,7 @@ def get_market_data_entry(market_id):
 
 # UPDATE
 @bp.route('/<int:market_id>', methods=['PUT'])
+@invalidates('market_data')
 def update_market_data(market_id):
     market_data = MarketData.query.get_or_404(market_id)
     data = request.get_json()
@@ -81,6 +93,7 @@ def update_market_data(market_id):
 
 # DELETE
 @bp.route('/<int:market_id>', methods=['DELETE'])
+@invalidates('market_data')
 def delete_market_data(market_id):
     market_data = MarketData.query.get_or_404(market_id)
     db.session.delete(market_data)
@@ -90,25 +103,60 @@ def delete_market_data(market_id):
 
 # ANALYTICS - Market trends
 @bp.route('/trends', methods=['GET'])
+@query_budget(2)
+@cached('protocols', 'market_data')
 def get_market_trends():
     days = request.args.get('days', 30, type=int)
     protocol_id = request.args.get('protocol_id', type=int)
-    
-    query = MarketData.query
-    
-    if protocol_id:
-        query = query.filter_by(protocol_id=protocol_id)
-    
-    start_date = datetime.utcnow().date() - timedelta(days=days)
-    results = query.filter(MarketData.date >= start_date)\
-                   .order_by(MarketData.date).all()
-    
-    return jsonify({
-        'trends': [m.to_dict() for m in results]
-    })
+    protocol_ids = request.args.get('protocol_ids')
+    metric = request.args.get('metric', 'total_volume')
+    # include_rows=false leaves out the row-wise trends, for callers that only chart the series
+    include_rows = request.args.get('include_rows', 'true').lower() not in ('false', '0')
+    
+    if metric not in timeseries.METRICS:
+        return jsonify({'error': f"metric must be one of {', '.join(timeseries.METRICS)}"}), 400
+    if protocol_ids is not None:
+        try:
+            protocol_ids = list(dict.fromkeys(int(p) for p in protocol_ids.split(',') if p.strip()))
+        except ValueError:
+            return jsonify({'error': 'protocol_ids must be a comma-separated list of integers'}), 400
+    
+    end_date = datetime.utcnow().date()
+    start_date = end_date - timedelta(days=days)
+    response = {}
+    
+    if include_rows:
+        query = MarketData.query.options(joinedload(MarketData.protocol))
+        if protocol_id:
+            query = query.filter_by(protocol_id=protocol_id)
+        if protocol_ids is not None:
+            query = query.filter(MarketData.protocol_id.in_(protocol_ids))
+        results = query.filter(MarketData.date >= start_date)\
+                       .order_by(MarketData.date, MarketData.protocol_id).all()
+        response['trends'] = [m.to_dict() for m in results]
+    
+    if protocol_ids is not None:
+        # One series of the metric per protocol, 0 on days without data
+        dates = timeseries.date_range(start_date, end_date)
+        if include_rows and not protocol_id:
+            # The rows just read hold every point of the series
+            series = timeseries.pivot(
+                [(m.date, m.protocol_id, getattr(m, metric) or 0) for m in results if m.date <= end_date],
+                dates, protocol_ids
+            )
+        else:
+            series = timeseries.market_series(metric, start_date, end_date, protocol_ids=protocol_ids)
+        response['series'] = {
+            'metric': metric,
+            'dates': [d.isoformat() for d in series.index],
+            'protocols': [{'protocol_id': int(p), 'values': series[p].tolist()} for p in series.columns]
+        }
+    
+    return jsonify(response)
 
 # ANALYTICS - Protocol comparison
 @bp.route('/compare', methods=['GET'])
+@cached('protocols', 'market_data')
 def compare_protocols():
     days = request.args.get('days', 7, type=int)
     start_date = datetime.utcnow().date() - timedelta(days=days)
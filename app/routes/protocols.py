@@ -1,11 +1,17 @@
 from flask import Blueprint, request, jsonify
 from ..models.models import db, Protocol
+from ..utils import archive, counters, pagination, rollup
+from ..utils.response_cache import cached, invalidates
 from sqlalchemy import func
 
 bp = Blueprint('protocols', __name__, url_prefix='/api/protocols')
 
+# Listing order
+LIST_ORDER = [(Protocol.protocol_id, False)]
+
 # CREATE
 @bp.route('', methods=['POST'])
+@invalidates('protocols')
 def create_protocol():
     data = request.get_json()
     
@@ -28,6 +34,7 @@ def create_protocol():
     )
     
     db.session.add(protocol)
+    counters.add({counters.PROTOCOLS: 1})
     db.session.commit()
     
     return jsonify({'message': 'Protocol created', 'protocol': protocol.to_dict()}), 201
@@ -38,19 +45,22 @@ def get_protocols():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     protocol_type = request.args.get('type')
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total')
     
     query = Protocol.query
     
     if protocol_type:
         query = query.filter_by(type=protocol_type)
     
-    paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+    try:
+        items, fields = pagination.paginate(query, LIST_ORDER, page, per_page, cursor, include_total)
+    except pagination.PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
-        'protocols': [p.to_dict() for p in paginated.items],
-        'total': paginated.total,
-        'pages': paginated.pages,
-        'current_page': page
+        'protocols': [p.to_dict() for p in items],
+        **fields
     })
 
 # READ - Get single protocol
@@ -61,6 +71,7 @@ def get_protocol(protocol_id):
 
 # UPDATE
 @bp.route('/<int:protocol_id>', methods=['PUT'])
+@invalidates('protocols')
 def update_protocol(protocol_id):
     protocol = Protocol.query.get_or_404(protocol_id)
     data = request.get_json()
@@ -83,15 +94,21 @@ def update_protocol(protocol_id):
 
 # DELETE
 @bp.route('/<int:protocol_id>', methods=['DELETE'])
+@invalidates('protocols', 'contracts', 'transactions')
 def delete_protocol(protocol_id):
     protocol = Protocol.query.get_or_404(protocol_id)
+    counters.remove_protocol(protocol_id)
+    rollup.remove_protocol(protocol_id)
     db.session.delete(protocol)
+    # Its contracts' transactions go with it, and archive reads leave out their archived ones
+    archive.bump_version()
     db.session.commit()
     
     return jsonify({'message': 'Protocol deleted'}), 200
 
 # ANALYTICS - Protocol statistics
 @bp.route('/stats', methods=['GET'])
+@cached('protocols')
 def get_protocol_stats():
     stats = db.session.query(
         Protocol.type,
@@ -104,27 +121,36 @@ def get_protocol_stats():
 
 # ANALYTICS - Top protocols by transaction volume
 @bp.route('/top-by-volume', methods=['GET'])
+@cached('protocols', 'transactions')
 def get_top_protocols():
     limit = request.args.get('limit', 10, type=int)
     
-    from ..models.models import Contract, Transaction
+    from ..models.models import TransactionDailyRollup as Rollup
+    
+    # Aggregate the daily rollup, which also counts archived transactions,
+    # then look up the few protocols
+    volumes = db.session.query(
+        Rollup.protocol_id,
+        func.sum(Rollup.total_value).label('total_volume'),
+        func.sum(Rollup.tx_count).label('transaction_count')
+    ).group_by(Rollup.protocol_id)\
+     .having(func.sum(Rollup.tx_count) > 0)\
+     .order_by(func.sum(Rollup.total_value).desc())\
+     .limit(limit).subquery()
     
     results = db.session.query(
         Protocol.protocol_name,
         Protocol.type,
-        func.sum(Transaction.value).label('total_volume'),
-        func.count(Transaction.transaction_id).label('transaction_count')
-    ).join(Contract, Protocol.protocol_id == Contract.protocol_id)\
-     .join(Transaction, Contract.contract_id == Transaction.contract_id)\
-     .group_by(Protocol.protocol_id, Protocol.protocol_name, Protocol.type)\
-     .order_by(func.sum(Transaction.value).desc())\
-     .limit(limit).all()
+        volumes.c.total_volume,
+        volumes.c.transaction_count
+    ).join(volumes, Protocol.protocol_id == volumes.c.protocol_id)\
+     .order_by(volumes.c.total_volume.desc()).all()
     
     return jsonify({
         'top_protocols': [{
             'protocol_name': r[0],
             'type': r[1],
             'total_volume': str(r[2]) if r[2] else '0',
-            'transaction_count': r[3]
+            'transaction_count': int(r[3])
         } for r in results]
     })
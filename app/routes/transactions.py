@@ -1,12 +1,22 @@
-from flask import Blueprint, request, jsonify
-from ..models.models import db, Transaction
-from sqlalchemy import func, desc
+from flask import Blueprint, request, jsonify, abort
+from ..models.models import db, Contract, Transaction
+from ..models.types import from_scaled, parse_amount
+from ..utils import archive, counters, ingest, pagination, rollup
+from ..utils.response_cache import cached, invalidates
+from sqlalchemy import func, type_coerce
 from datetime import datetime, timedelta
+from decimal import Decimal
+import pyarrow as pa
+import time
 
 bp = Blueprint('transactions', __name__, url_prefix='/api/transactions')
 
+# Listing order; transaction_id breaks ties so cursors point at one row
+LIST_ORDER = [(Transaction.timestamp, True), (Transaction.transaction_id, True)]
+
 # CREATE
 @bp.route('', methods=['POST'])
+@invalidates('transactions')
 def create_transaction():
     data = request.get_json()
     
@@ -14,13 +24,22 @@ def create_transaction():
     if not all(field in data for field in required_fields):
         return jsonify({'error': 'Missing required fields'}), 400
     
+    for field in ingest.AMOUNT_COLUMNS:
+        if data.get(field) is None:
+            continue
+        if parse_amount(data[field]) is None:
+            return jsonify({'error': f'Invalid {field}'}), 400
+        if not Transaction.__table__.c[field].type.fits(data[field]):
+            return jsonify({'error': f'{field} is out of range'}), 400
+    
     existing = Transaction.query.filter_by(transaction_hash=data['transaction_hash']).first()
-    if existing:
+    if existing or archive.find(transaction_hash=data['transaction_hash']):
         return jsonify({'error': 'Transaction already exists'}), 409
     
     transaction = Transaction(
         transaction_hash=data['transaction_hash'],
         contract_id=data['contract_id'],
+        protocol_id=db.select(Contract.protocol_id).where(Contract.contract_id == data['contract_id']).scalar_subquery(),
         from_user_id=data.get('from_user_id'),
         to_user_id=data.get('to_user_id'),
         from_address=data['from_address'],
@@ -35,15 +54,56 @@ def create_transaction():
     )
     
     db.session.add(transaction)
+    db.session.flush()
+    rollup.add_transactions([transaction.transaction_id])
+    counters.add_transactions([transaction.transaction_id])
     db.session.commit()
     
     return jsonify({'message': 'Transaction created', 'transaction': transaction.to_dict()}), 201
 
+# CREATE - Batch ingest from NDJSON or Arrow IPC
+@bp.route('/batch', methods=['POST'])
+@invalidates('transactions')
+def create_transactions_batch():
+    if request.mimetype in ingest.NDJSON_TYPES:
+        chunks = ingest.read_ndjson(request.stream)
+    elif request.mimetype in ingest.ARROW_STREAM_TYPES | ingest.ARROW_FILE_TYPES:
+        chunks = ingest.read_arrow(request.stream, file_format=request.mimetype in ingest.ARROW_FILE_TYPES)
+    else:
+        return jsonify({'error': 'Content-Type must be NDJSON or Arrow IPC'}), 415
+
+    started = time.perf_counter()
+    totals = {'accepted': 0, 'duplicates': 0, 'rejected': 0}
+    errors = []
+    try:
+        for df, parse_errors in chunks:
+            result = ingest.ingest_transactions(df)
+            for key in totals:
+                totals[key] += result[key]
+            totals['rejected'] += len(parse_errors)
+            errors = sorted(errors + parse_errors + result['errors'], key=lambda e: e['row'])[:ingest.MAX_ERRORS]
+    except pa.ArrowInvalid as e:
+        db.session.rollback()
+        return jsonify({'error': f'Invalid Arrow payload: {e}'}), 400
+
+    db.session.commit()
+
+    seconds = time.perf_counter() - started
+    rows = sum(totals.values())
+    return jsonify({
+        **totals,
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(rows / seconds) if seconds else rows
+    })
+
 # READ - Get all transactions
 @bp.route('', methods=['GET'])
 def get_transactions():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total')
     contract_id = request.args.get('contract_id', type=int)
     from_address = request.args.get('from_address')
     status = request.args.get('status')
@@ -57,37 +117,100 @@ def get_transactions():
     if status:
         query = query.filter_by(status=status)
     
-    paginated = query.order_by(desc(Transaction.timestamp)).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    # Archived transactions are all older, so they follow the table's rows
+    # and are only read by the pages that reach past them
+    filters = {'contract_id': contract_id, 'from_address': from_address, 'status': status}
+    per_page = per_page if per_page > 0 else pagination.DEFAULT_PER_PAGE
+    try:
+        mode = pagination.total_mode(include_total, cursor)
+        if cursor is not None:
+            items, fields, table_rows = _transactions_after(query, cursor, per_page, filters)
+        else:
+            items, fields, table_rows = _transactions_page(query, max(page, 1), per_page, filters)
+    except pagination.PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if mode == 'exact':
+        if table_rows is None:
+            table_rows = query.order_by(None).count()
+        fields.update(pagination.total_fields(table_rows + archive.count(**filters), per_page))
+    elif mode == 'estimate':
+        # The planner knows little of single contracts; the rollup counts
+        # them exactly, archived transactions included
+        if contract_id and not from_address:
+            total = rollup.count_transactions(contract_id, status)
+        else:
+            total = pagination.estimate_count(query) + archive.count(**filters)
+        fields.update(pagination.total_fields(total, per_page))
     
     return jsonify({
-        'transactions': [t.to_dict() for t in paginated.items],
-        'total': paginated.total,
-        'pages': paginated.pages,
-        'current_page': page
+        'transactions': [t.to_dict() for t in items],
+        **fields
     })
 
+def _transactions_page(query, page, per_page, filters):
+    """Numbered page of the transactions listing, its pagination fields, and the
+    table's row count when the page reached past it (None otherwise)"""
+    offset = (page - 1) * per_page
+    items = query.order_by(*pagination.order_by(LIST_ORDER)).offset(offset).limit(per_page + 1).all()
+    table_rows = None
+    if len(items) <= per_page:
+        # An empty page past the start does not say where the table ended
+        table_rows = offset + len(items) if items or not offset else query.order_by(None).count()
+        older = archive.newest(per_page - len(items) + 1, offset=max(offset - table_rows, 0), **filters)
+        items = items + older
+    fields = {
+        'current_page': page,
+        'next_cursor': pagination.encode_cursor(LIST_ORDER, items[per_page - 1]) if len(items) > per_page else None
+    }
+    return items[:per_page], fields, table_rows
+
+def _transactions_after(query, cursor, per_page, filters):
+    """Keyset page of the transactions listing, carrying on into the archive;
+    returns the same as _transactions_page"""
+    items, next_cursor = pagination.keyset_page(query, LIST_ORDER, cursor, per_page)
+    before = pagination.decode_cursor(LIST_ORDER, cursor) if cursor else None
+    
+    if next_cursor is None:
+        if items:
+            before = (items[-1].timestamp, items[-1].transaction_id)
+        wanted = per_page - len(items)
+        older = archive.newest(wanted + 1, before=before, **filters)
+        items = items + older[:wanted]
+        if len(older) > wanted:
+            next_cursor = pagination.encode_cursor(LIST_ORDER, items[-1])
+    
+    return items, {'next_cursor': next_cursor}, None
+
 # READ - Get single transaction
 @bp.route('/<int:transaction_id>', methods=['GET'])
 def get_transaction(transaction_id):
-    transaction = Transaction.query.get_or_404(transaction_id)
+    transaction = db.session.get(Transaction, transaction_id) or archive.find(transaction_id=transaction_id)
+    if transaction is None:
+        abort(404)
     return jsonify(transaction.to_dict())
 
 # READ - Get transaction by hash
 @bp.route('/hash/<string:tx_hash>', methods=['GET'])
 def get_transaction_by_hash(tx_hash):
-    transaction = Transaction.query.filter_by(transaction_hash=tx_hash).first_or_404()
+    transaction = (Transaction.query.filter_by(transaction_hash=tx_hash).first()
+                   or archive.find(transaction_hash=tx_hash))
+    if transaction is None:
+        abort(404)
     return jsonify(transaction.to_dict())
 
 # UPDATE
 @bp.route('/<int:transaction_id>', methods=['PUT'])
+@invalidates('transactions')
 def update_transaction(transaction_id):
     transaction = Transaction.query.get_or_404(transaction_id)
     data = request.get_json()
     
-    if 'status' in data:
+    if 'status' in data and data['status'] != transaction.status:
+        rollup.remove_transactions([transaction_id])
         transaction.status = data['status']
+        db.session.flush()
+        rollup.add_transactions([transaction_id])
     
     db.session.commit()
     
@@ -95,8 +218,11 @@ def update_transaction(transaction_id):
 
 # DELETE
 @bp.route('/<int:transaction_id>', methods=['DELETE'])
+@invalidates('transactions')
 def delete_transaction(transaction_id):
     transaction = Transaction.query.get_or_404(transaction_id)
+    rollup.remove_transactions([transaction_id])
+    counters.remove_transactions([transaction_id])
     db.session.delete(transaction)
     db.session.commit()
     
@@ -104,17 +230,30 @@ def delete_transaction(transaction_id):
 
 # ANALYTICS - Transaction volume over time
 @bp.route('/volume-over-time', methods=['GET'])
+@cached('transactions')
 def get_volume_over_time():
     days = request.args.get('days', 30, type=int)
     start_date = datetime.utcnow() - timedelta(days=days)
     
+    # date() is text on SQLite; coerce it so the days come back as dates
+    day = type_coerce(func.date(Transaction.timestamp), db.Date)
     results = db.session.query(
-        func.date(Transaction.timestamp).label('date'),
+        day.label('date'),
         func.sum(Transaction.value).label('total_volume'),
         func.count(Transaction.transaction_id).label('transaction_count')
     ).filter(Transaction.timestamp >= start_date)\
-     .group_by(func.date(Transaction.timestamp))\
-     .order_by(func.date(Transaction.timestamp)).all()
+     .group_by(day)\
+     .order_by(day).all()
+    
+    horizon = archive.archived_before()
+    if horizon and start_date.date() < horizon:
+        # Days before the horizon come from the archive, plus any late arrivals still in the table
+        days = {r[0]: [r[1] or 0, r[2]] for r in results}
+        for day, (units, count) in archive.daily_volume(start_date).items():
+            totals = days.setdefault(day, [0, 0])
+            totals[0] += from_scaled(units)
+            totals[1] += count
+        results = sorted((day, volume, count) for day, (volume, count) in days.items())
     
     return jsonify({
         'data': [{
@@ -126,11 +265,16 @@ def get_volume_over_time():
 
 # ANALYTICS - Transaction statistics
 @bp.route('/stats', methods=['GET'])
+@cached('transactions')
 def get_transaction_stats():
-    total_transactions = Transaction.query.count()
-    total_volume = db.session.query(func.sum(Transaction.value)).scalar() or 0
-    avg_transaction_value = db.session.query(func.avg(Transaction.value)).scalar() or 0
-    total_fees = db.session.query(func.sum(Transaction.transaction_fee)).scalar() or 0
+    values = counters.read()
+    archived = archive.totals()
+    total_transactions = values.get(counters.TRANSACTIONS, 0) + archived['count']
+    value_units = values.get(counters.TRANSACTION_VALUE, 0) + archived['value']
+    value_count = values.get(counters.VALUED_TRANSACTIONS, 0) + archived['value_count']
+    total_volume = from_scaled(value_units) or 0
+    avg_transaction_value = from_scaled(Decimal(value_units) / value_count) if value_count else 0
+    total_fees = from_scaled(values.get(counters.TRANSACTION_FEES, 0) + archived['fee']) or 0
     
     return jsonify({
         'total_transactions': total_transactions,
@@ -1,11 +1,17 @@
 from flask import Blueprint, request, jsonify
 from ..models.models import db, User
+from ..utils import counters, pagination
+from ..utils.response_cache import cached, invalidates
 from sqlalchemy import func
 
 bp = Blueprint('users', __name__, url_prefix='/api/users')
 
+# Listing order; user_id breaks ties so cursors point at one row
+LIST_ORDER = [(User.total_volume, True), (User.user_id, True)]
+
 # CREATE
 @bp.route('', methods=['POST'])
+@invalidates('users')
 def create_user():
     data = request.get_json()
     
@@ -22,6 +28,7 @@ def create_user():
     )
     
     db.session.add(user)
+    counters.add({counters.USERS: 1})
     db.session.commit()
     
     return jsonify({'message': 'User created', 'user': user.to_dict()}), 201
@@ -31,6 +38,8 @@ def create_user():
 def get_users():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total')
     user_type = request.args.get('user_type')
     
     query = User.query
@@ -38,15 +47,14 @@ def get_users():
     if user_type:
         query = query.filter_by(user_type=user_type)
     
-    paginated = query.order_by(User.total_volume.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        items, fields = pagination.paginate(query, LIST_ORDER, page, per_page, cursor, include_total)
+    except pagination.PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     
     return jsonify({
-        'users': [u.to_dict() for u in paginated.items],
-        'total': paginated.total,
-        'pages': paginated.pages,
-        'current_page': page
+        'users': [u.to_dict() for u in items],
+        **fields
     })
 
 # READ - Get single user
@@ -63,6 +71,7 @@ def get_user_by_address(address):
 
 # UPDATE
 @bp.route('/<int:user_id>', methods=['PUT'])
+@invalidates('users')
 def update_user(user_id):
     user = User.query.get_or_404(user_id)
     data = request.get_json()
@@ -70,7 +79,9 @@ def update_user(user_id):
     if 'user_type' in data:
         user.user_type = data['user_type']
     if 'total_transactions' in data:
+        was_active = (user.total_transactions or 0) > 0
         user.total_transactions = data['total_transactions']
+        counters.add({counters.ACTIVE_USERS: int((user.total_transactions or 0) > 0) - int(was_active)})
     if 'total_volume' in data:
         user.total_volume = data['total_volume']
     
@@ -80,8 +91,10 @@ def update_user(user_id):
 
 # DELETE
 @bp.route('/<int:user_id>', methods=['DELETE'])
+@invalidates('users')
 def delete_user(user_id):
     user = User.query.get_or_404(user_id)
+    counters.add({counters.USERS: -1, counters.ACTIVE_USERS: -int((user.total_transactions or 0) > 0)})
     db.session.delete(user)
     db.session.commit()
     
@@ -89,6 +102,7 @@ def delete_user(user_id):
 
 # ANALYTICS - Top users by volume
 @bp.route('/top-by-volume', methods=['GET'])
+@cached('users')
 def get_top_users():
     limit = request.args.get('limit', 10, type=int)
     
@@ -100,9 +114,11 @@ def get_top_users():
 
 # ANALYTICS - User statistics
 @bp.route('/stats', methods=['GET'])
+@cached('users')
 def get_user_stats():
-    total_users = User.query.count()
-    active_users = User.query.filter(User.total_transactions > 0).count()
+    values = counters.read()
+    total_users = values.get(counters.USERS, 0)
+    active_users = values.get(counters.ACTIVE_USERS, 0)
     
     stats = {
         'total_users': total_users,
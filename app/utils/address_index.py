@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+from ..models.models import db
+
+# Rows fetched per round trip while streaming the (address, id) pairs
+FETCH_SIZE = 100_000
+
+# An EVM address as text: 0x and 40 hex digits, kept as its 20 raw bytes
+WORD_TEXT_LENGTH = 42
+WORD_BYTES = 20
+
+# Value of each hex digit by its ASCII code; 255 marks a byte that is not one
+_NIBBLES = np.full(256, 255, dtype=np.uint8)
+_NIBBLES[np.frombuffer(b'0123456789abcdef', dtype=np.uint8)] = np.arange(16)
+_NIBBLES[np.frombuffer(b'ABCDEF', dtype=np.uint8)] = np.arange(10, 16)
+
+
+class _SortedKeys:
+    """Sorted unique fixed-width byte keys with a parallel id array"""
+
+    def __init__(self, keys, ids):
+        order = np.lexsort((ids, keys))
+        keys = keys[order]
+        ids = ids[order]
+
+        # Keep the highest id when a key appears more than once
+        if len(keys):
+            last = np.append(keys[1:] != keys[:-1], True)
+            keys = keys[last]
+            ids = ids[last]
+
+        id_type = np.int32 if not len(ids) or ids.max() < 2 ** 31 else np.int64
+        self.keys = keys
+        self.ids = ids.astype(id_type)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes + self.ids.nbytes
+
+    def lookup(self, keys, result, rows):
+        """Write the ids of keys, found at the given rows of result, into it"""
+        if not len(self.keys) or not len(keys):
+            return
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = self.keys[positions] == keys
+        result[rows[found]] = self.ids[positions[found]]
+
+
+class AddressIndex:
+    """Compact address -> id lookup backed by sorted fixed-width byte arrays.
+
+    EVM addresses are kept as their 20 raw bytes, half their text, and any
+    other address (base58, bech32, other lengths) as UTF-8 in a second array
+    of its own width. Only the address bytes and the ids are kept, so memory
+    stays well under a Python dict entry per address. Lookups run a
+    vectorized binary search over a whole batch of addresses at once.
+    """
+
+    MISSING = -1
+
+    def __init__(self, addresses, ids):
+        words, word_ids, others, other_ids = _split(np.asarray(addresses, dtype=np.str_),
+                                                    np.asarray(ids, dtype=np.int64))
+        self._build(words, word_ids, others, other_ids)
+
+    def _build(self, words, word_ids, others, other_ids):
+        self.words = _SortedKeys(words, word_ids)
+        self.others = _SortedKeys(others, other_ids)
+
+    @classmethod
+    def from_query(cls, address_column, id_column):
+        """Stream (address, id) pairs through a server-side cursor into an index"""
+        parts = ([], [], [], [])
+
+        result = db.session.execute(
+            db.select(address_column, id_column).execution_options(yield_per=FETCH_SIZE)
+        )
+        for rows in result.partitions():
+            addresses, ids = zip(*rows)
+            # Split each chunk as it arrives so only its text is ever held
+            for chunks, part in zip(parts, _split(np.array(addresses, dtype=np.str_),
+                                                  np.array(ids, dtype=np.int64))):
+                chunks.append(part)
+
+        index = cls.__new__(cls)
+        if not parts[0]:
+            index._build(*_split(np.array([], dtype=np.str_), np.array([], dtype=np.int64)))
+        else:
+            index._build(*(np.concatenate(chunks) for chunks in parts))
+        return index
+
+    def __len__(self):
+        return len(self.words) + len(self.others)
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes + self.others.nbytes
+
+    def lookup(self, values):
+        """Resolve a batch of addresses; misses and nulls come back as MISSING"""
+        values = pd.Series(values)
+        present = values.notna().to_numpy()
+        words, word_rows, others, other_rows = _split(values.fillna('').to_numpy(dtype=np.str_),
+                                                      np.arange(len(values)))
+
+        result = np.full(len(values), self.MISSING, dtype=np.int64)
+        self.words.lookup(words, result, word_rows)
+        self.others.lookup(others, result, other_rows)
+        result[~present] = self.MISSING
+        return result
+
+    def stats(self):
+        """Memory used per address, next to the average raw address length"""
+        count = len(self)
+        raw = WORD_TEXT_LENGTH * len(self.words)
+        if len(self.others):
+            raw += int(np.char.str_len(self.others.keys).sum())
+        return {
+            'addresses': count,
+            'evm_addresses': len(self.words),
+            'bytes': self.nbytes,
+            'bytes_per_address': round(self.nbytes / count, 1) if count else 0,
+            'raw_bytes_per_address': round(raw / count, 1) if count else 0
+        }
+
+
+def _split(addresses, ids):
+    """Split addresses into their 20 raw bytes for EVM ones and UTF-8 for the
+    rest, as (words, word_ids, others, other_ids)"""
+    encoded = _encode(addresses)
+    is_word = np.char.str_len(encoded) == WORD_TEXT_LENGTH
+    words = np.empty(0, dtype=f'S{WORD_BYTES}')
+
+    if is_word.any():
+        rows = np.flatnonzero(is_word)
+        text = encoded[rows].astype(f'S{WORD_TEXT_LENGTH}').view(np.uint8).reshape(-1, WORD_TEXT_LENGTH)
+        nibbles = _NIBBLES[text[:, 2:]]
+        valid = (text[:, 0] == ord('0')) & (text[:, 1] == ord('x')) & (nibbles != 255).all(axis=1)
+        is_word[rows[~valid]] = False
+        nibbles = nibbles[valid]
+        # All exactly 20 bytes, so numpy's trailing-null padding never makes two equal
+        words = np.ascontiguousarray((nibbles[:, 0::2] << 4) | nibbles[:, 1::2]).view(f'S{WORD_BYTES}').ravel()
+
+    others = encoded[~is_word]
+    if not len(others):
+        others = np.empty(0, dtype='S1')
+    return words, ids[is_word], others, ids[~is_word]
+
+
+def _encode(values):
+    return np.char.encode(values, 'utf-8')
@@ -0,0 +1,462 @@
+import os
+import threading
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from flask import current_app
+from sqlalchemy import LargeBinary, and_, func, type_coerce
+from ..models.models import db, Contract, Transaction, Watermark
+from ..models.types import HexBinary, ScaledInteger, from_binary, from_scaled, to_binary
+from .counters import remove_transactions_where
+from .dataset import DATE_PARTITION
+from .rollup import bump_generation
+
+# Rows read from the table, and written to one file, at a time
+ARCHIVE_BATCH = 100_000
+
+# Transaction ids per DELETE statement
+DELETE_CHUNK = 5_000
+
+# Files are sorted by hash, so a hash lookup reads one row group per file;
+# smaller groups make that read cheaper and scans slower
+ROW_GROUP_SIZE = 4_096
+
+# Start of the first day still in the table, as a date ordinal
+HORIZON_WATERMARK = 'transactions_archived_before'
+# Bumped by every archive commit, and by contract deletes and moves, so
+# readers know to drop their cached counts
+VERSION_WATERMARK = 'transactions_archive'
+
+# Amounts as ScaledInteger units, in as many digits as the table keeps
+AMOUNT_UNITS = pa.decimal128(Transaction.value.type.precision, 0)
+
+# Same columns and stored forms as the table: hashes and addresses as
+# HexBinary bytes, amounts as ScaledInteger units
+SCHEMA = pa.schema([
+    ('transaction_id', pa.int64()),
+    ('transaction_hash', pa.binary()),
+    ('contract_id', pa.int32()),
+    ('protocol_id', pa.int32()),
+    ('from_user_id', pa.int32()),
+    ('to_user_id', pa.int32()),
+    ('from_address', pa.binary()),
+    ('to_address', pa.binary()),
+    ('value', AMOUNT_UNITS),
+    ('gas_used', pa.int64()),
+    ('gas_price', AMOUNT_UNITS),
+    ('transaction_fee', AMOUNT_UNITS),
+    ('timestamp', pa.timestamp('us')),
+    ('block_number', pa.int64()),
+    ('status', pa.string()),
+    ('created_at', pa.timestamp('us')),
+])
+
+PARTITIONING = ds.partitioning(pa.schema([(DATE_PARTITION, pa.date32())]), flavor='hive')
+
+# What reads see of the archive: the dataset, the (contract ids, protocol
+# ids) arrays of the live contracts and memoized counts, all of one version
+Snapshot = namedtuple('Snapshot', ['dataset', 'contracts', 'counts'])
+
+_cache = {'key': None, 'snapshot': None}
+_cache_lock = threading.Lock()
+
+
+def archive_root():
+    return os.path.join(current_app.config['ARCHIVE_DIR'], 'transactions')
+
+
+def _raw(column):
+    """column selected in its stored form, skipping the type's conversion"""
+    if isinstance(column.type, HexBinary):
+        return type_coerce(column, LargeBinary)
+    if isinstance(column.type, ScaledInteger):
+        return column.type.units(column)
+    return column
+
+
+def _to_arrow(rows):
+    columns = list(zip(*rows))
+    arrays = []
+    for field, values in zip(SCHEMA, columns):
+        if pa.types.is_binary(field.type):
+            # psycopg2 hands bytea back as memoryview
+            values = [bytes(value) if value is not None else None for value in values]
+        arrays.append(pa.array(values, field.type))
+    return pa.Table.from_arrays(arrays, schema=SCHEMA)
+
+
+def _write(root, day, table):
+    """Write one sorted file under the day's partition, unpublished; returns its path.
+
+    Dataset discovery skips dot files, so readers do not see it until
+    _publish renames it.
+    """
+    directory = os.path.join(root, f'{DATE_PARTITION}={day.isoformat()}')
+    os.makedirs(directory, exist_ok=True)
+    ids = table['transaction_id']
+    partial = os.path.join(directory, f'.part-{pc.min(ids).as_py()}-{pc.max(ids).as_py()}.parquet')
+    pq.write_table(table.sort_by('transaction_hash'), partial, row_group_size=ROW_GROUP_SIZE)
+    return partial
+
+
+def _publish(partial):
+    directory, name = os.path.split(partial)
+    os.replace(partial, os.path.join(directory, name[1:]))
+
+
+def _recover(conn, root):
+    """Settle the files a crashed run left unpublished; returns how many were published.
+
+    A file is published once the commit deleting its rows is, so if none of
+    its transactions are left in the table that commit happened and the
+    file is published now, and otherwise it is dropped for the run to
+    write again.
+    """
+    published = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if not (name.startswith('.part-') and name.endswith('.parquet')):
+                continue
+            partial = os.path.join(directory, name)
+            ids = pq.read_table(partial, columns=['transaction_id'])['transaction_id'].to_pylist()
+            remaining = any(
+                conn.execute(db.select(Transaction.transaction_id).where(
+                    Transaction.transaction_id.in_(ids[offset:offset + DELETE_CHUNK])
+                ).limit(1)).first()
+                for offset in range(0, len(ids), DELETE_CHUNK)
+            )
+            if remaining:
+                os.remove(partial)
+            else:
+                _publish(partial)
+                published += 1
+    return published
+
+
+def _read_watermark(conn, name):
+    return conn.execute(db.select(Watermark.value).where(Watermark.name == name)).scalar()
+
+
+def _write_watermark(conn, name, value):
+    updated = conn.execute(
+        db.update(Watermark).where(Watermark.name == name).values(value=value)
+    ).rowcount
+    if not updated:
+        conn.execute(db.insert(Watermark).values(name=name, value=value))
+
+
+def bump_version(conn=None):
+    """Make readers drop their cached archive reads, in the caller's transaction"""
+    conn = conn or db.session
+    updated = conn.execute(
+        db.update(Watermark).where(Watermark.name == VERSION_WATERMARK).values(value=Watermark.value + 1)
+    ).rowcount
+    if not updated:
+        conn.execute(db.insert(Watermark).values(name=VERSION_WATERMARK, value=1))
+
+
+def archived_before(conn=None):
+    """First day still in the transactions table, or None if nothing was archived"""
+    value = _read_watermark(conn or db.session, HORIZON_WATERMARK)
+    return datetime.fromordinal(value).date() if value else None
+
+
+def archive_transactions(before, batch_size=ARCHIVE_BATCH):
+    """Move the transactions dated before the given day into the Parquet archive.
+
+    Rows go to <ARCHIVE_DIR>/transactions/date=YYYY-MM-DD/ in files of at
+    most batch_size rows, sorted by hash, and are deleted from the table in
+    the transaction that records the file. The file is only published once
+    that commits, so readers never count a row twice; files a crash left
+    unpublished are settled by the next run first. The daily rollup keeps
+    their days.
+    """
+    root = archive_root()
+    timestamp = Transaction.timestamp
+    end_of_range = datetime.combine(before, time())
+    results = {'days': 0, 'rows': 0, 'files': 0}
+
+    with db.engine.connect() as conn:
+        if os.path.isdir(root) and _recover(conn, root):
+            bump_version(conn)
+            conn.commit()
+
+        first = conn.execute(db.select(func.min(timestamp)).where(timestamp < end_of_range)).scalar()
+        while first is not None:
+            day = first.date()
+            start = datetime.combine(day, time())
+            end = start + timedelta(days=1)
+            last_id = 0
+            while True:
+                rows = conn.execute(
+                    db.select(*[_raw(Transaction.__table__.c[field.name]) for field in SCHEMA])
+                    .where(timestamp >= start, timestamp < end, Transaction.transaction_id > last_id)
+                    .order_by(Transaction.transaction_id)
+                    .limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                table = _to_arrow(rows)
+                partial = _write(root, day, table)
+                ids = table['transaction_id'].to_pylist()
+                for offset in range(0, len(ids), DELETE_CHUNK):
+                    chunk = and_(
+                        Transaction.transaction_id.in_(ids[offset:offset + DELETE_CHUNK]),
+                        timestamp >= start, timestamp < end
+                    )
+                    # The stat counters cover the table; the archive is added when read
+                    remove_transactions_where(chunk, conn)
+                    conn.execute(db.delete(Transaction).where(chunk))
+                horizon = _read_watermark(conn, HORIZON_WATERMARK) or 0
+                _write_watermark(conn, HORIZON_WATERMARK, max(horizon, before.toordinal()))
+                bump_version(conn)
+                bump_generation(conn)
+                conn.commit()
+                _publish(partial)
+                results['rows'] += len(ids)
+                results['files'] += 1
+                last_id = ids[-1]
+            results['days'] += 1
+            first = conn.execute(
+                db.select(func.min(timestamp)).where(timestamp >= end, timestamp < end_of_range)
+            ).scalar()
+
+    return results
+
+
+# Reads
+
+def _snapshot():
+    """The archive as a Snapshot, or None while it is empty; cached until the next archive commit.
+
+    Readers use only the snapshot they were handed, so a reload by another
+    thread cannot mix one version's dataset with another's contracts.
+    """
+    root = archive_root()
+    key = (root, _read_watermark(db.session, VERSION_WATERMARK))
+    with _cache_lock:
+        if _cache['key'] != key:
+            snapshot = None
+            if key[1] and os.path.isdir(root):
+                rows = db.session.execute(
+                    db.select(Contract.contract_id, Contract.protocol_id).order_by(Contract.contract_id)
+                ).all()
+                snapshot = Snapshot(
+                    ds.dataset(root, format='parquet', partitioning=PARTITIONING),
+                    (pa.array([row[0] for row in rows], pa.int32()), pa.array([row[1] for row in rows], pa.int32())),
+                    {}
+                )
+            _cache.update(key=key, snapshot=snapshot)
+        return _cache['snapshot']
+
+
+def _live(snapshot):
+    """Filter keeping the archived transactions whose contract still exists.
+
+    Deleting a contract, or its protocol, deletes its transactions from the
+    table but not from the archive, so reads leave them out instead.
+    """
+    ids, _ = snapshot.contracts
+    return ds.field('contract_id').isin(ids)
+
+
+def _current_protocols(snapshot, table):
+    """table with protocol_id taken from the contracts, which may have moved since archiving"""
+    ids, protocols = snapshot.contracts
+    current = pc.take(protocols, pc.index_in(table['contract_id'], value_set=ids))
+    return table.set_column(table.schema.get_field_index('protocol_id'), 'protocol_id', current)
+
+
+def _expression(snapshot, filters):
+    """Equality filters on table columns, in their stored form, over the live archived transactions"""
+    expression = _live(snapshot)
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if isinstance(Transaction.__table__.c[name].type, HexBinary):
+            value = to_binary(value)
+        expression = expression & (ds.field(name) == value)
+    return expression
+
+
+def _transactions(snapshot, table):
+    """Detached Transaction objects for archived rows"""
+    transactions = []
+    if DATE_PARTITION in table.column_names:
+        table = table.drop_columns([DATE_PARTITION])
+    for row in _current_protocols(snapshot, table).to_pylist():
+        for name, column in Transaction.__table__.c.items():
+            if isinstance(column.type, HexBinary):
+                row[name] = from_binary(row[name])
+            elif isinstance(column.type, ScaledInteger):
+                row[name] = from_scaled(row[name])
+        transactions.append(Transaction(**row))
+    return transactions
+
+
+def find(**filters):
+    """The archived transaction matching the filters, or None.
+
+    Only row groups whose statistics admit the filters are looked at, and
+    each is checked on the filtered columns before being read whole.
+    """
+    snapshot = _snapshot()
+    if snapshot is None:
+        return None
+    expression = _expression(snapshot, filters)
+    for fragment in snapshot.dataset.get_fragments(filter=expression):
+        for row_group in fragment.split_by_row_group(filter=expression):
+            if row_group.count_rows(filter=expression):
+                return _transactions(snapshot, row_group.to_table(filter=expression).slice(0, 1))[0]
+    return None
+
+
+def archived_hashes(hashes):
+    """The subset of the given transaction hashes that are archived.
+
+    Like find, only row groups whose hash statistics admit one of them are read.
+    """
+    snapshot = _snapshot()
+    hashes = [value for value in set(hashes) if value is not None]
+    if snapshot is None or not hashes:
+        return set()
+    wanted = pa.array([to_binary(value) for value in hashes], pa.binary())
+    table = snapshot.dataset.to_table(
+        columns=['transaction_hash'], filter=_live(snapshot) & ds.field('transaction_hash').isin(wanted)
+    )
+    return {from_binary(value) for value in table['transaction_hash'].to_pylist()}
+
+
+def count(**filters):
+    """Archived transactions matching the filters"""
+    snapshot = _snapshot()
+    if snapshot is None:
+        return 0
+    key = tuple(sorted(filters.items()))
+    counts = snapshot.counts
+    if key not in counts:
+        counts[key] = snapshot.dataset.count_rows(filter=_expression(snapshot, filters))
+    return counts[key]
+
+
+def newest(limit, offset=0, before=None, **filters):
+    """Archived transactions matching the filters, newest first, skipping offset of them.
+
+    before, a (timestamp, transaction_id) pair, starts the listing just
+    after that transaction instead. Days are read newest first, and a day
+    that is skipped whole is only counted, so a page only reads the days it
+    shows.
+    """
+    snapshot = _snapshot()
+    if snapshot is None:
+        return []
+    expression = _expression(snapshot, filters)
+    days = sorted({
+        ds.get_partition_keys(fragment.partition_expression)[DATE_PARTITION]
+        for fragment in snapshot.dataset.get_fragments()
+    }, reverse=True)
+    if before is not None:
+        timestamp, transaction_id = before
+        days = [day for day in days if day <= timestamp.date()]
+        expression = expression & ((ds.field('timestamp') < timestamp) | (
+            (ds.field('timestamp') == timestamp) & (ds.field('transaction_id') < transaction_id)
+        ))
+
+    tables = []
+    rows = 0
+    for day in days:
+        day_filter = (ds.field(DATE_PARTITION) == day) & expression
+        if not tables:
+            skipped = snapshot.dataset.count_rows(filter=day_filter)
+            if skipped <= offset:
+                offset -= skipped
+                continue
+        table = snapshot.dataset.to_table(filter=day_filter)
+        tables.append(table)
+        rows += table.num_rows
+        if rows >= offset + limit:
+            break
+    if not tables:
+        return []
+    table = pa.concat_tables(tables).sort_by([('timestamp', 'descending'), ('transaction_id', 'descending')])
+    return _transactions(snapshot, table.slice(offset, limit))
+
+
+def daily_volume(since):
+    """{date: (value units, count)} of the archived transactions from the since datetime on"""
+    snapshot = _snapshot()
+    if snapshot is None:
+        return {}
+    table = snapshot.dataset.to_table(
+        columns=[DATE_PARTITION, 'value'],
+        filter=(ds.field(DATE_PARTITION) >= since.date()) & (ds.field('timestamp') >= since) & _live(snapshot)
+    )
+    grouped = table.group_by(DATE_PARTITION).aggregate([('value', 'sum'), (DATE_PARTITION, 'count')])
+    return {
+        row[DATE_PARTITION]: (int(row['value_sum'] or 0), row[f'{DATE_PARTITION}_count'])
+        for row in grouped.to_pylist()
+    }
+
+
+def totals():
+    """Count, value units, count of values and fee units over the whole archive"""
+    snapshot = _snapshot()
+    if snapshot is None:
+        return {'count': 0, 'value': 0, 'value_count': 0, 'fee': 0}
+    key = ('totals',)
+    counts = snapshot.counts
+    if key not in counts:
+        table = snapshot.dataset.to_table(columns=['value', 'transaction_fee'], filter=_live(snapshot))
+        counts[key] = {
+            'count': table.num_rows,
+            'value': int(pc.sum(table['value']).as_py() or 0),
+            'value_count': pc.count(table['value']).as_py(),
+            'fee': int(pc.sum(table['transaction_fee']).as_py() or 0)
+        }
+    return counts[key]
+
+
+def read_columns(columns):
+    """The given columns of every live archived transaction, or None while the archive is empty.
+
+    protocol_id is only returned along with contract_id.
+    """
+    snapshot = _snapshot()
+    if snapshot is None:
+        return None
+    table = snapshot.dataset.to_table(columns=columns, filter=_live(snapshot))
+    return _current_protocols(snapshot, table) if 'protocol_id' in columns else table
+
+
+def user_activity():
+    """(user_id, tx_count, value units, first timestamp, last timestamp) per user in the archive.
+
+    Counts each transaction once for its sender and once for a distinct
+    receiver, as user_stats does for the table.
+    """
+    snapshot = _snapshot()
+    if snapshot is None:
+        return []
+    table = snapshot.dataset.to_table(
+        columns=['from_user_id', 'to_user_id', 'value', 'timestamp'], filter=_live(snapshot)
+    )
+    sender = table.filter(pc.is_valid(table['from_user_id']))
+    receiver = table.filter(pc.and_kleene(
+        pc.is_valid(table['to_user_id']),
+        pc.or_kleene(pc.is_null(table['from_user_id']), pc.not_equal(table['to_user_id'], table['from_user_id']))
+    ))
+    activity = pa.concat_tables([
+        pa.table({'user_id': part[column], 'value': part['value'], 'timestamp': part['timestamp']})
+        for part, column in ((sender, 'from_user_id'), (receiver, 'to_user_id'))
+    ])
+    grouped = activity.group_by('user_id').aggregate([
+        ('user_id', 'count'), ('value', 'sum'), ('timestamp', 'min'), ('timestamp', 'max')
+    ])
+    return [
+        (row['user_id'], row['user_id_count'], int(row['value_sum']) if row['value_sum'] is not None else None,
+         row['timestamp_min'], row['timestamp_max'])
+        for row in grouped.to_pylist()
+    ]
@@ -0,0 +1,112 @@
+import io
+import numpy as np
+import pandas as pd
+from sqlalchemy.dialects import postgresql, sqlite
+from ..models.models import db
+from ..models.types import HEX_PATTERN, HexBinary, ScaledInteger, to_binary, to_scaled
+
+
+def frame_to_records(df):
+    """Convert a DataFrame to a list of dicts with NaN/NaT mapped to None"""
+    if df.empty:
+        return []
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.Series(np.asarray(df[col].dt.to_pydatetime()), index=df.index, dtype=object)
+    df = df.astype(object)
+    return df.where(pd.notna(df), None).to_dict('records')
+
+
+def canonical_hex(values):
+    """Lower-case the 0x-hex strings in a Series, matching how HexBinary columns store them"""
+    if not (pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values)):
+        return values
+    is_hex = values.str.fullmatch(HEX_PATTERN.pattern, na=False).astype(bool)
+    return values.where(~is_hex, values.str.lower())
+
+
+def _copy_value(value):
+    """Text form of a HexBinary value in a COPY"""
+    return '\\x' + to_binary(value).hex()
+
+
+def _insert(table):
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    raise NotImplementedError(f'Bulk insert is not supported on {dialect}')
+
+
+def insert_ignore_keys(table, records):
+    """Insert records with INSERT ... ON CONFLICT DO NOTHING, skipping duplicates.
+
+    The records are sent as one executemany, which SQLAlchemy batches into
+    multi-row VALUES statements. On a partitioned transactions table the
+    hash guard skips hashes stored under another timestamp as well. Returns
+    the primary keys of the rows actually inserted.
+    """
+    if not records:
+        return []
+
+    key, = table.primary_key.columns
+    stmt = _insert(table).on_conflict_do_nothing().returning(key)
+    return db.session.execute(stmt, records).scalars().all()
+
+
+def insert_ignore(table, records):
+    """Insert records, skipping duplicates; returns the number actually inserted"""
+    return len(insert_ignore_keys(table, records))
+
+
+def copy_ignore_keys(table, df):
+    """Insert a DataFrame, skipping duplicates, through COPY on PostgreSQL.
+
+    The rows are COPYed into a temporary table and moved across with one
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING, which is several times
+    faster than an executemany. Other databases fall back to insert_ignore.
+    Returns the primary keys of the rows actually inserted.
+    """
+    if df.empty:
+        return []
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return insert_ignore_keys(table, frame_to_records(df))
+    key, = table.primary_key.columns
+
+    df = df.copy()
+    for column in df.columns:
+        type_ = table.c[column].type
+        if isinstance(type_, HexBinary):
+            df[column] = df[column].map(_copy_value, na_action='ignore')
+        elif isinstance(type_, ScaledInteger):
+            # Through Decimal, as the ORM binds them; float64 would round large amounts
+            df[column] = pd.Series([
+                to_scaled(value, type_.decimals) if pd.notna(value) else None for value in df[column]
+            ], index=df.index, dtype=object)
+
+    columns = ', '.join(df.columns)
+    staging = f'{table.name}_copy'
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    cursor = db.session.connection().connection.cursor()
+    cursor.execute(f'DROP TABLE IF EXISTS {staging}')
+    cursor.execute(
+        f'CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS SELECT {columns} FROM {table.name} WITH NO DATA'
+    )
+    cursor.copy_expert(f'COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+    cursor.execute(
+        f'INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {staging} '
+        f'ON CONFLICT DO NOTHING RETURNING {key.name}'
+    )
+    inserted = [row[0] for row in cursor.fetchall()]
+    cursor.execute(f'DROP TABLE {staging}')
+    return inserted
+
+
+def copy_ignore(table, df):
+    """Insert a DataFrame through COPY, skipping duplicates; returns the number actually inserted"""
+    return len(copy_ignore_keys(table, df))
@@ -0,0 +1,224 @@
+import io
+from datetime import datetime
+from sqlalchemy import text
+from ..models.models import db, IngestionCheckpoint
+from ..models.types import fits_sql, to_binary_sql, to_scaled_sql
+from . import counters
+from .archive import archived_before
+from .data_loader import TRANSACTION_COLUMNS, iter_parquet_batches
+from .manifest import open_manifest, close_manifest
+from .partitions import (HASH_GUARD, PARTITION_COLUMN, build_hash_guard, constraint_statements,
+                         create_partitions, install_hash_guard, is_partitioned, month_range, partitions,
+                         table_constraints, upcoming_months)
+from .rollup import rebuild_rollup
+
+STAGING_TABLE = 'transactions_staging'
+NEW_TABLE = 'transactions_new'
+NEW_GUARD = f'{HASH_GUARD}_new'
+
+STAGING_DDL = f"""
+    CREATE UNLOGGED TABLE {STAGING_TABLE} (
+        ordinal bigserial,
+        transaction_hash text,
+        contract_address text,
+        from_address text,
+        to_address text,
+        value numeric,
+        gas_used bigint,
+        gas_price numeric,
+        transaction_fee numeric,
+        timestamp timestamp,
+        block_number bigint,
+        status text
+    )
+"""
+
+# Convert hashes, addresses and amounts to their stored form, resolve ids,
+# drop invalid rows, amounts too large to store included, and rows older
+# than the archive horizon, and keep the first row for each hash. Hashes
+# that are already loaded keep their transaction_id, the oldest one should
+# a hash be stored twice.
+POPULATE_SQL = f"""
+    INSERT INTO {NEW_TABLE} (
+        transaction_id, transaction_hash, contract_id, protocol_id, from_user_id, to_user_id,
+        from_address, to_address, value, gas_used, gas_price, transaction_fee,
+        timestamp, block_number, status, created_at
+    )
+    SELECT COALESCE(old.transaction_id, nextval(:sequence)),
+           s.transaction_hash, c.contract_id, c.protocol_id, fu.user_id, tu.user_id,
+           s.from_address, s.to_address, {to_scaled_sql('COALESCE(s.value, 0)')}, s.gas_used,
+           {to_scaled_sql('s.gas_price')}, {to_scaled_sql('s.transaction_fee')},
+           s.timestamp, s.block_number, COALESCE(s.status, 'success'),
+           COALESCE(old.created_at, now() at time zone 'utc')
+    FROM (
+        SELECT DISTINCT ON (transaction_hash) *
+        FROM (
+            SELECT ordinal, {to_binary_sql('transaction_hash')} AS transaction_hash,
+                   {to_binary_sql('contract_address')} AS contract_address,
+                   {to_binary_sql('from_address')} AS from_address,
+                   {to_binary_sql('to_address')} AS to_address,
+                   value, gas_used, gas_price, transaction_fee, timestamp, block_number, status
+            FROM {STAGING_TABLE}
+        ) staged
+        WHERE transaction_hash IS NOT NULL
+          AND from_address IS NOT NULL
+          AND timestamp IS NOT NULL
+          AND timestamp >= :archived_before
+          AND {fits_sql('value')} AND {fits_sql('gas_price')} AND {fits_sql('transaction_fee')}
+        ORDER BY transaction_hash, ordinal
+    ) s
+    JOIN (
+        SELECT DISTINCT ON (contract_address) contract_address, contract_id, protocol_id
+        FROM contracts ORDER BY contract_address, contract_id DESC
+    ) c ON c.contract_address = s.contract_address
+    LEFT JOIN users fu ON fu.user_address = s.from_address
+    LEFT JOIN users tu ON tu.user_address = s.to_address
+    LEFT JOIN LATERAL (
+        SELECT transaction_id, created_at FROM transactions
+        WHERE transaction_hash = s.transaction_hash
+        ORDER BY transaction_id LIMIT 1
+    ) old ON true
+"""
+
+
+def _copy_batches(cursor, parquet_path, batch_size, memory_budget_mb):
+    """COPY the file into the staging table batch by batch, returning the rows read"""
+    rows = 0
+    for _, df in iter_parquet_batches(parquet_path, TRANSACTION_COLUMNS, batch_size, memory_budget_mb):
+        df = df.reindex(columns=TRANSACTION_COLUMNS)
+        for column in ('gas_used', 'block_number'):
+            df[column] = df[column].astype('Int64')
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {STAGING_TABLE} ({', '.join(TRANSACTION_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        rows += len(df)
+    return rows
+
+
+def rebuild_transactions(parquet_path, batch_size=None, memory_budget_mb=None):
+    """Replace the transactions table with the contents of a Parquet file.
+
+    The file is copied into an unlogged staging table, then validated,
+    deduplicated and resolved against contracts and users in SQL into a new
+    table with no secondary indexes. The indexes and constraints are built
+    once the table is full, and the table is then swapped in within a
+    single transaction. Readers see the old table until that commit.
+    A partitioned table is rebuilt partitioned, one unlogged partition per
+    month until it is complete, and its hash guard table is swapped in
+    with it. The daily rollup is rebuilt right after
+    the swap. Rows dated before the archive horizon stay in the archive
+    and count as rejected. PostgreSQL only.
+    """
+    if db.engine.dialect.name != 'postgresql':
+        raise RuntimeError('Bulk rebuild requires PostgreSQL')
+
+    manifest = open_manifest('transactions', parquet_path, force=True)
+
+    with db.engine.connect() as conn:
+        cursor = conn.connection.cursor()
+        try:
+            partitioned = is_partitioned(conn)
+            constraints = table_constraints(conn)
+            indexes = [index['name'] for index in constraints[0]]
+            foreign_keys = [fk['constrained_columns'][0] for fk in constraints[1]]
+            sequence = conn.execute(text("SELECT pg_get_serial_sequence('transactions', 'transaction_id')")).scalar()
+
+            # Stage the raw file
+            conn.execute(text(f'DROP TABLE IF EXISTS {STAGING_TABLE}'))
+            conn.execute(text(f'DROP TABLE IF EXISTS {NEW_TABLE}'))
+            conn.execute(text(f'DROP TABLE IF EXISTS {NEW_GUARD}'))
+            conn.execute(text(STAGING_DDL))
+            rows_read = _copy_batches(cursor, parquet_path, batch_size, memory_budget_mb)
+            conn.commit()
+
+            # Validate, dedupe and resolve into an index-free copy of the table
+            if partitioned:
+                conn.execute(text(
+                    f'CREATE TABLE {NEW_TABLE} (LIKE transactions INCLUDING DEFAULTS) '
+                    f'PARTITION BY RANGE ({PARTITION_COLUMN})'
+                ))
+                lo, hi = conn.execute(text(f'SELECT MIN(timestamp), MAX(timestamp) FROM {STAGING_TABLE}')).one()
+                months = month_range(lo, hi) if lo else []
+                create_partitions(conn, months + upcoming_months(), table=NEW_TABLE, unlogged=True)
+            else:
+                conn.execute(text(f'CREATE UNLOGGED TABLE {NEW_TABLE} (LIKE transactions INCLUDING DEFAULTS)'))
+            horizon = archived_before(conn)
+            rows_loaded = conn.execute(text(POPULATE_SQL), {
+                'sequence': sequence,
+                'archived_before': datetime.combine(horizon, datetime.min.time()) if horizon else datetime.min
+            }).rowcount
+            distinct_hashes = conn.execute(
+                text(f"SELECT COUNT(DISTINCT {to_binary_sql('transaction_hash')}) FROM {STAGING_TABLE}")
+            ).scalar()
+            conn.execute(text(f'DROP TABLE {STAGING_TABLE}'))
+            conn.commit()
+
+            # Make the table durable, then build indexes and constraints in bulk
+            for table in sorted(partitions(conn, NEW_TABLE)) if partitioned else [NEW_TABLE]:
+                conn.execute(text(f'ALTER TABLE {table} SET LOGGED'))
+            for statement in constraint_statements(NEW_TABLE, partitioned, constraints, suffix='_new'):
+                conn.execute(text(statement))
+            if partitioned:
+                build_hash_guard(conn, table=NEW_TABLE, guard=NEW_GUARD)
+            conn.execute(text(f'ANALYZE {NEW_TABLE}'))
+            conn.commit()
+
+            # Swap the tables atomically
+            conn.execute(text('LOCK TABLE transactions IN ACCESS EXCLUSIVE MODE'))
+            conn.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY {NEW_TABLE}.transaction_id'))
+            conn.execute(text('DROP TABLE transactions'))
+            conn.execute(text(f'ALTER TABLE {NEW_TABLE} RENAME TO transactions'))
+            conn.execute(text(f'ALTER TABLE transactions RENAME CONSTRAINT {NEW_TABLE}_pkey TO transactions_pkey'))
+            for name in indexes:
+                conn.execute(text(f'ALTER INDEX {name}_new RENAME TO {name}'))
+            for column in foreign_keys:
+                conn.execute(text(
+                    f'ALTER TABLE transactions RENAME CONSTRAINT {NEW_TABLE}_{column}_fkey '
+                    f'TO transactions_{column}_fkey'
+                ))
+            if partitioned:
+                for name in partitions(conn):
+                    conn.execute(text(f"ALTER TABLE {name} RENAME TO {name.replace(NEW_TABLE, 'transactions', 1)}"))
+                # The partitions' own indexes were named after the new table too
+                child_indexes = conn.execute(text(
+                    "SELECT indexname FROM pg_indexes WHERE tablename LIKE 'transactions\\_%' AND indexname LIKE :prefix"
+                ), {'prefix': f'{NEW_TABLE}\\_%'}).scalars().all()
+                for name in child_indexes:
+                    conn.execute(text(f"ALTER INDEX {name} RENAME TO {name.replace(NEW_TABLE, 'transactions', 1)}"))
+                # The old table's triggers went with it
+                conn.execute(text(f'DROP TABLE IF EXISTS {HASH_GUARD}'))
+                conn.execute(text(f'ALTER TABLE {NEW_GUARD} RENAME TO {HASH_GUARD}'))
+                conn.execute(text(f'ALTER TABLE {HASH_GUARD} RENAME CONSTRAINT {NEW_GUARD}_pkey TO {HASH_GUARD}_pkey'))
+                install_hash_guard(conn)
+            conn.commit()
+        except Exception:
+            # Leave the live table as it was and clear out the half-built ones
+            conn.rollback()
+            conn.execute(text(f'DROP TABLE IF EXISTS {STAGING_TABLE}'))
+            conn.execute(text(f'DROP TABLE IF EXISTS {NEW_TABLE}'))
+            conn.execute(text(f'DROP TABLE IF EXISTS {NEW_GUARD}'))
+            conn.commit()
+            raise
+
+        # The old rows went with the old table, so the rollup and counters start over
+        rebuild_rollup(conn)
+        counters.reconcile(conn, tables=['transactions'])
+        conn.commit()
+
+    IngestionCheckpoint.query.filter_by(manifest_id=manifest.manifest_id).update({
+        'rows_committed': IngestionCheckpoint.rows_total,
+        'is_complete': True
+    }, synchronize_session=False)
+    db.session.commit()
+    close_manifest(manifest.manifest_id)
+
+    return {
+        'transactions_loaded': rows_loaded,
+        'rows_read': rows_read,
+        'duplicates': rows_read - distinct_hashes,
+        'rejected': distinct_hashes - rows_loaded
+    }
@@ -0,0 +1,354 @@
+import io
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pacsv
+from sqlalchemy import Float, func, type_coerce
+from ..models.models import db, Transaction, Watermark
+from . import archive
+from .rollup import GENERATION_WATERMARK, UNKNOWN_STATUS
+
+logger = logging.getLogger(__name__)
+
+# Transaction ids read per statement while loading
+LOAD_CHUNK = 500_000
+
+EPOCH = date(1970, 1, 1)
+
+SECONDS_PER_DAY = 86400
+
+AMOUNTS = ['value', 'transaction_fee', 'gas_price']
+
+# Column name -> dtype. Amounts stay in the stored units, as float64 since
+# they can outgrow int64; a missing fee or gas price is 0 with its *_valid
+# flag off, as AVG() would skip it.
+DTYPES = {
+    'timestamp': np.int64,
+    'contract_id': np.int32,
+    'protocol_id': np.int32,
+    'value': np.float64,
+    'transaction_fee': np.float64,
+    'fee_valid': np.bool_,
+    'gas_price': np.float64,
+    'gas_price_valid': np.bool_,
+    'status': np.int8,
+}
+
+
+def _read_generation(conn):
+    return conn.execute(
+        db.select(Watermark.value).where(Watermark.name == GENERATION_WATERMARK)
+    ).scalar() or 0
+
+
+class ColumnStore:
+    """Append-only NumPy columns that grow by doubling.
+
+    Rows past size are never visible, so append() can fill them while
+    readers work on earlier views; a reader only needs the lock to take a
+    consistent view().
+    """
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.arrays = {name: np.zeros(capacity, dtype) for name, dtype in DTYPES.items()}
+        self.statuses = []
+        self.lock = threading.Lock()
+
+    def status_codes(self, values):
+        """Codes of the given status strings, assigning new ones as they appear"""
+        codes = []
+        for value in values:
+            value = UNKNOWN_STATUS if value is None else value
+            if value not in self.statuses:
+                self.statuses.append(value)
+            codes.append(self.statuses.index(value))
+        return np.array(codes, dtype=DTYPES['status'])
+
+    def append(self, columns):
+        count = len(columns['timestamp'])
+        if not count:
+            return
+        needed = self.size + count
+        arrays = self.arrays
+        capacity = len(arrays['timestamp'])
+        if needed > capacity:
+            capacity = max(needed, capacity * 2)
+            grown = {}
+            for name, array in arrays.items():
+                grown[name] = np.zeros(capacity, array.dtype)
+                grown[name][:self.size] = array[:self.size]
+            arrays = grown
+        for name, array in arrays.items():
+            array[self.size:needed] = columns[name]
+        with self.lock:
+            self.arrays = arrays
+            self.size = needed
+
+    def view(self):
+        with self.lock:
+            return {name: array[:self.size] for name, array in self.arrays.items()}
+
+    @property
+    def nbytes(self):
+        return sum(array.dtype.itemsize * self.size for array in self.arrays.values())
+
+    @property
+    def allocated_bytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+
+def _copy_chunk(conn, low, high):
+    """Transactions with low < transaction_id <= high as an Arrow table, through COPY on PostgreSQL"""
+    sql = (
+        'COPY (SELECT extract(epoch FROM timestamp)::bigint, contract_id, protocol_id, value, '
+        'transaction_fee, gas_price, status FROM transactions '
+        f'WHERE transaction_id > {int(low)} AND transaction_id <= {int(high)}) TO STDOUT WITH (FORMAT csv)'
+    )
+    buffer = io.BytesIO()
+    with conn.connection.driver_connection.cursor() as cursor:
+        cursor.copy_expert(sql, buffer)
+    if not buffer.tell():
+        return None
+    buffer.seek(0)
+    names = ['timestamp', 'contract_id', 'protocol_id', 'value', 'transaction_fee', 'gas_price', 'status']
+    return pacsv.read_csv(
+        buffer,
+        read_options=pacsv.ReadOptions(column_names=names),
+        convert_options=pacsv.ConvertOptions(
+            column_types={name: pa.int64() for name in names[:3]} | {name: pa.float64() for name in AMOUNTS}
+            | {'status': pa.string()},
+            strings_can_be_null=True
+        )
+    )
+
+
+def _select_chunk(conn, low, high):
+    """Same as _copy_chunk through an ordinary cursor, for other databases"""
+    raw = [type_coerce(column, Float) for column in
+           (Transaction.value, Transaction.transaction_fee, Transaction.gas_price)]
+    rows = conn.execute(
+        db.select(Transaction.timestamp, Transaction.contract_id, Transaction.protocol_id, *raw, Transaction.status)
+        .where(Transaction.transaction_id > low, Transaction.transaction_id <= high)
+    ).all()
+    if not rows:
+        return None
+    columns = list(zip(*rows))
+    return pa.table({
+        'timestamp': pc.cast(pa.array(columns[0], pa.timestamp('s')), pa.int64()),
+        'contract_id': pa.array(columns[1], pa.int64()),
+        'protocol_id': pa.array(columns[2], pa.int64()),
+        'value': pa.array(columns[3], pa.float64()),
+        'transaction_fee': pa.array(columns[4], pa.float64()),
+        'gas_price': pa.array(columns[5], pa.float64()),
+        'status': pa.array(columns[6], pa.string()),
+    })
+
+
+def _archived_chunk():
+    """The archived transactions in the layout _copy_chunk reads, or None"""
+    table = archive.read_columns(
+        ['timestamp', 'contract_id', 'protocol_id', 'value', 'transaction_fee', 'gas_price', 'status']
+    )
+    if table is None or not table.num_rows:
+        return None
+    seconds = pc.divide(pc.cast(table['timestamp'], pa.int64()), 1_000_000)
+    table = table.set_column(0, 'timestamp', seconds)
+    for name in AMOUNTS:
+        table = table.set_column(table.schema.get_field_index(name), name, pc.cast(table[name], pa.float64()))
+    return table
+
+
+def _to_columns(table, store):
+    """NumPy columns in the store's layout from a chunk read by _copy_chunk or _select_chunk"""
+    def filled(name):
+        return pc.fill_null(table[name], 0).to_numpy()
+
+    # Nulls take the code after the last dictionary entry, the unknown status
+    status = pc.dictionary_encode(table['status']).combine_chunks()
+    codes = store.status_codes(status.dictionary.to_pylist() + [None])
+    indices = pc.fill_null(status.indices, len(codes) - 1).to_numpy()
+    return {
+        'timestamp': filled('timestamp'),
+        'contract_id': filled('contract_id'),
+        'protocol_id': filled('protocol_id'),
+        'value': filled('value'),
+        'transaction_fee': filled('transaction_fee'),
+        'fee_valid': pc.is_valid(table['transaction_fee']).to_numpy(zero_copy_only=False),
+        'gas_price': filled('gas_price'),
+        'gas_price_valid': pc.is_valid(table['gas_price']).to_numpy(zero_copy_only=False),
+        'status': codes[indices],
+    }
+
+
+class AnalyticsEngine:
+    """In-memory copy of the transaction columns the dashboard aggregates.
+
+    A background thread appends the transactions past a transaction_id
+    high-water mark every refresh_seconds, and reloads everything when the
+    generation watermark shows rows were deleted or changed, or when a
+    periodic count finds rows that committed below the mark after it moved.
+    Archived transactions are read from Parquet on each full load, and
+    archiving bumps the generation. The dashboard asks ready() before each query and falls back to SQL while
+    the engine is loading or more than max_lag_seconds behind. Each process
+    holds its own copy.
+    """
+
+    def __init__(self, app, refresh_seconds=5, max_lag_seconds=60, reconcile_seconds=300):
+        self.app = app
+        self.refresh_seconds = refresh_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self.store = None
+        self.high_water_mark = 0
+        self.archived_rows = 0
+        self.generation = None
+        self.loaded_at = None
+        self.last_refresh_ms = None
+        self.last_reconcile = 0.0
+        self.full_loads = 0
+        self.last_error = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start the refresh thread, once per process"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='analytics-engine', daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.refresh()
+                self.last_error = None
+            except Exception as e:
+                logger.exception('Analytics engine refresh failed')
+                self.last_error = str(e)
+            time.sleep(self.refresh_seconds)
+
+    def _load(self, conn, store, low, high):
+        read = _copy_chunk if conn.dialect.name == 'postgresql' else _select_chunk
+        while low < high:
+            chunk = read(conn, low, min(low + LOAD_CHUNK, high))
+            if chunk is not None:
+                store.append(_to_columns(chunk, store))
+            low += LOAD_CHUNK
+
+    def _out_of_date(self, conn):
+        """Whether the loaded rows no longer match the table below the high-water mark"""
+        if self.generation != _read_generation(conn):
+            return True
+        if time.time() - self.last_reconcile < self.reconcile_seconds:
+            return False
+        self.last_reconcile = time.time()
+        count = conn.execute(
+            db.select(func.count()).where(Transaction.transaction_id <= self.high_water_mark)
+        ).scalar()
+        return count != self.store.size - self.archived_rows
+
+    def refresh(self):
+        """Bring the engine up to date with the transactions table"""
+        started = time.time()
+        with db.engine.connect() as conn:
+            generation = _read_generation(conn)
+            high = conn.execute(db.select(func.max(Transaction.transaction_id))).scalar() or 0
+            if self.store is None or self._out_of_date(conn):
+                # Readers keep the old store, or SQL, until the new one is complete
+                store = ColumnStore()
+                archived = _archived_chunk()
+                if archived is not None:
+                    store.append(_to_columns(archived, store))
+                self._load(conn, store, 0, high)
+                self.store, self.generation = store, generation
+                self.archived_rows = archived.num_rows if archived is not None else 0
+                self.last_reconcile = started
+                self.full_loads += 1
+            else:
+                self._load(conn, self.store, self.high_water_mark, high)
+            self.high_water_mark = high
+        self.loaded_at = started
+        self.last_refresh_ms = round((time.time() - started) * 1000, 1)
+
+    @property
+    def lag_seconds(self):
+        return None if self.loaded_at is None else time.time() - self.loaded_at
+
+    def ready(self):
+        """Whether queries can be answered from memory"""
+        lag = self.lag_seconds
+        return self.store is not None and lag is not None and lag <= self.max_lag_seconds
+
+    def status(self):
+        store = self.store
+        lag = self.lag_seconds
+        return {
+            'state': 'cold' if store is None else 'ready' if self.ready() else 'stale',
+            'rows': store.size if store else 0,
+            'archived_rows': self.archived_rows,
+            'memory_bytes': store.nbytes if store else 0,
+            'allocated_bytes': store.allocated_bytes if store else 0,
+            'high_water_mark': self.high_water_mark,
+            'generation': self.generation,
+            'loaded_at': datetime.utcfromtimestamp(self.loaded_at).isoformat() if self.loaded_at else None,
+            'lag_seconds': round(lag, 1) if lag is not None else None,
+            'last_refresh_ms': self.last_refresh_ms,
+            'full_loads': self.full_loads,
+            'last_error': self.last_error
+        }
+
+    # Queries, shaped like the rows of the SQL they replace
+
+    @staticmethod
+    def _amount(units):
+        return float(units) / 10 ** Transaction.value.type.decimals
+
+    def _days_since(self, columns, start_date):
+        """Day offsets from start_date of the rows on or after it, and the mask selecting them"""
+        days = columns['timestamp'] // SECONDS_PER_DAY - (start_date - EPOCH).days
+        mask = days >= 0
+        return days[mask], mask
+
+    def volume_by_day(self, start_date):
+        """(date, volume, count) per day from start_date on"""
+        columns = self.store.view()
+        days, mask = self._days_since(columns, start_date)
+        counts = np.bincount(days)
+        volumes = np.bincount(days, weights=columns['value'][mask], minlength=len(counts))
+        return [
+            (start_date + timedelta(days=int(day)), self._amount(volumes[day]), int(counts[day]))
+            for day in np.flatnonzero(counts)
+        ]
+
+    def gas_by_day(self, start_date):
+        """(date, average gas price, average fee, total fees) per day from start_date on"""
+        columns = self.store.view()
+        days, mask = self._days_since(columns, start_date)
+        counts = np.bincount(days)
+        size = len(counts)
+        gas_counts = np.bincount(days, weights=columns['gas_price_valid'][mask], minlength=size)
+        gas_totals = np.bincount(days, weights=columns['gas_price'][mask], minlength=size)
+        fee_counts = np.bincount(days, weights=columns['fee_valid'][mask], minlength=size)
+        fee_totals = np.bincount(days, weights=columns['transaction_fee'][mask], minlength=size)
+        return [
+            (
+                start_date + timedelta(days=int(day)),
+                self._amount(gas_totals[day] / gas_counts[day]) if gas_counts[day] else None,
+                self._amount(fee_totals[day] / fee_counts[day]) if fee_counts[day] else None,
+                self._amount(fee_totals[day])
+            )
+            for day in np.flatnonzero(counts)
+        ]
+
+    def protocol_volumes(self):
+        """{protocol_id: (volume, count)} for the protocols with transactions"""
+        columns = self.store.view()
+        counts = np.bincount(columns['protocol_id'])
+        volumes = np.bincount(columns['protocol_id'], weights=columns['value'], minlength=len(counts))
+        return {int(pid): (self._amount(volumes[pid]), int(counts[pid])) for pid in np.flatnonzero(counts)}
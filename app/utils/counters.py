@@ -0,0 +1,266 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import case, func, text, true
+from ..models.models import db, Contract, Protocol, StatCounter, Transaction, User, Watermark
+from ..models.types import add_units
+from .bulk import _insert
+
+logger = logging.getLogger(__name__)
+
+# Ids aggregated per statement
+COUNTER_CHUNK = 5_000
+
+PROTOCOLS = 'protocols'
+CONTRACTS = 'contracts'
+USERS = 'users'
+# Users with at least one transaction
+ACTIVE_USERS = 'active_users'
+TRANSACTIONS = 'transactions'
+# Amounts are sums of the transactions' stored units (see ScaledInteger)
+TRANSACTION_VALUE = 'transaction_value'
+# Transactions with a value, which the average value is taken over
+VALUED_TRANSACTIONS = 'valued_transactions'
+TRANSACTION_FEES = 'transaction_fees'
+# One counter of contracts per blockchain; the distinct chains are those above zero
+CHAIN_PREFIX = 'chain:'
+
+# Tables reconcile() recomputes counters from
+TABLES = ('protocols', 'contracts', 'users', 'transactions')
+
+# PostgreSQL advisory lock key held by a reconcile, so two never add the same drift
+RECONCILE_LOCK = 0x5747_0001
+# Unix time of the last background reconcile, in any process
+RECONCILED_WATERMARK = 'stat_counters_reconciled'
+
+
+def chain(blockchain):
+    return CHAIN_PREFIX + blockchain
+
+
+def _transaction_totals(where, conn=None):
+    row = (conn or db.session).execute(db.select(
+        func.count(),
+        func.coalesce(Transaction.value.type.sum_units(Transaction.value), 0),
+        func.count(Transaction.value),
+        func.coalesce(Transaction.transaction_fee.type.sum_units(Transaction.transaction_fee), 0)
+    ).where(where)).one()
+    return dict(zip([TRANSACTIONS, TRANSACTION_VALUE, VALUED_TRANSACTIONS, TRANSACTION_FEES], map(int, row)))
+
+
+def _contract_totals(where, conn=None):
+    rows = (conn or db.session).execute(
+        db.select(Contract.blockchain, func.count()).where(where).group_by(Contract.blockchain)
+    ).all()
+    totals = {chain(blockchain): count for blockchain, count in rows}
+    totals[CONTRACTS] = sum(count for _, count in rows)
+    return totals
+
+
+def _user_totals(where, conn=None):
+    row = (conn or db.session).execute(db.select(
+        func.count(), func.count(case((User.total_transactions > 0, 1)))
+    ).where(where)).one()
+    return {USERS: row[0], ACTIVE_USERS: row[1]}
+
+
+def _by_ids(totals, column, ids, sign):
+    deltas = {}
+    ids = list(ids)
+    for start in range(0, len(ids), COUNTER_CHUNK):
+        for name, value in totals(column.in_(ids[start:start + COUNTER_CHUNK])).items():
+            deltas[name] = deltas.get(name, 0) + sign * value
+    return deltas
+
+
+def add(deltas, conn=None):
+    """Add {name: delta} to the counters, in the caller's transaction"""
+    table = StatCounter.__table__
+    now = datetime.utcnow()
+    # A fixed order keeps concurrent writers from deadlocking on the upsert
+    rows = [{'name': name, 'value': deltas[name], 'updated_at': now} for name in sorted(deltas) if deltas[name]]
+    if not rows:
+        return
+    stmt = _insert(table).values(rows)
+    (conn or db.session).execute(stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'value': add_units(table.c.value, stmt.excluded.value), 'updated_at': stmt.excluded.updated_at}
+    ))
+
+
+def add_transactions(ids):
+    """Count the given, already inserted, transactions"""
+    add(_by_ids(_transaction_totals, Transaction.transaction_id, ids, 1))
+
+
+def remove_transactions(ids):
+    """Uncount the given transactions before they are deleted or changed"""
+    add(_by_ids(_transaction_totals, Transaction.transaction_id, ids, -1))
+
+
+def remove_transactions_where(where, conn=None):
+    """Uncount the transactions matching where before they are deleted"""
+    add({name: -value for name, value in _transaction_totals(where, conn).items()}, conn)
+
+
+def add_contracts(ids):
+    add(_by_ids(_contract_totals, Contract.contract_id, ids, 1))
+
+
+def add_users(ids):
+    add(_by_ids(_user_totals, User.user_id, ids, 1))
+
+
+def remove_contract(contract_id):
+    """Uncount a contract and the transactions deleted with it"""
+    deltas = _contract_totals(Contract.contract_id == contract_id)
+    deltas.update(_transaction_totals(Transaction.contract_id == contract_id))
+    add({name: -value for name, value in deltas.items()})
+
+
+def remove_protocol(protocol_id):
+    """Uncount a protocol and the contracts and transactions deleted with it"""
+    deltas = _contract_totals(Contract.protocol_id == protocol_id)
+    deltas.update(_transaction_totals(Transaction.protocol_id == protocol_id))
+    deltas[PROTOCOLS] = 1
+    add({name: -value for name, value in deltas.items()})
+
+
+def read():
+    """All counters as {name: int}"""
+    reconciler = current_app.extensions.get('stat_counters')
+    if reconciler is not None:
+        reconciler.start()
+    table = StatCounter.__table__
+    return {name: int(value) for name, value in db.session.execute(db.select(table.c.name, table.c.value))}
+
+
+def distinct_chains(counters):
+    return sum(1 for name, value in counters.items() if name.startswith(CHAIN_PREFIX) and value > 0)
+
+
+def actual(conn, tables=TABLES):
+    """Values of the counters of the given tables, recomputed from them"""
+    values = {}
+    if 'protocols' in tables:
+        values[PROTOCOLS] = conn.execute(db.select(func.count()).select_from(Protocol)).scalar()
+    if 'contracts' in tables:
+        values.update(_contract_totals(true(), conn))
+    if 'users' in tables:
+        values.update(_user_totals(true(), conn))
+    if 'transactions' in tables:
+        values.update(_transaction_totals(true(), conn))
+    return values
+
+
+def _lock(conn, wait=True):
+    """Take the reconcile lock until conn's transaction ends; whether it was taken.
+
+    Only PostgreSQL has the lock, and SQLite runs one writer at a time anyway.
+    """
+    if conn.dialect.name != 'postgresql':
+        return True
+    if wait:
+        conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': RECONCILE_LOCK})
+        return True
+    return conn.execute(text('SELECT pg_try_advisory_xact_lock(:key)'), {'key': RECONCILE_LOCK}).scalar()
+
+
+def _snapshot(conn, tables):
+    """(counted, actual) values read from the committed tables in one snapshot"""
+    options = {'isolation_level': 'REPEATABLE READ'} if conn.dialect.name == 'postgresql' else {}
+    with conn.engine.connect().execution_options(**options) as snapshot, snapshot.begin():
+        table = StatCounter.__table__
+        counted = {name: int(value) for name, value in snapshot.execute(db.select(table.c.name, table.c.value))}
+        return counted, actual(snapshot, tables)
+
+
+def reconcile(conn, tables=TABLES):
+    """Bring the counters of the given tables back in line with the tables.
+
+    The counters and the tables are read together in one snapshot, without
+    locking anything, and only their difference is added to the counters on
+    conn. Writers committing meanwhile are neither blocked by the table scans
+    nor lost, since they add their own deltas. Reads what is committed, and
+    waits for any other reconcile to commit first. Returns {name: (counted,
+    actual)} of the counters that had drifted. The caller commits.
+    """
+    _lock(conn)
+    counted, values = _snapshot(conn, tables)
+    # Blockchains left without contracts
+    stale = [
+        name for name in counted
+        if name not in values and 'contracts' in tables and name.startswith(CHAIN_PREFIX)
+    ]
+    drift = {
+        name: (counted.get(name, 0), values.get(name, 0))
+        for name in sorted(values.keys() | set(stale))
+        if counted.get(name, 0) != values.get(name, 0)
+    }
+    add({name: actual_value - counted_value for name, (counted_value, actual_value) in drift.items()}, conn)
+    if stale:
+        table = StatCounter.__table__
+        conn.execute(table.delete().where(table.c.name.in_(stale), table.c.value == 0))
+    return drift
+
+
+class Reconciler:
+    """Background thread reconciling the counters every interval seconds.
+
+    Every worker process starts one, but a run is skipped unless interval
+    seconds have passed since the last run in any process, and while another
+    process is running one. The first check comes straight away, so writes
+    that skipped the counters, such as from another tool, are fixed up
+    without waiting out a whole interval after a quiet spell.
+    """
+
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread = None
+        self.last_run = None
+        self.last_drift = {}
+        self.last_error = None
+
+    def start(self):
+        """Start the thread, once per process"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='stat-counters', daemon=True)
+                self.thread.start()
+
+    def run_once(self):
+        """Reconcile unless another process is, or did within the interval; whether it ran"""
+        with self.app.app_context(), db.engine.begin() as conn:
+            if not _lock(conn, wait=False):
+                return False
+            now = int(time.time())
+            last = conn.execute(
+                db.select(Watermark.value).where(Watermark.name == RECONCILED_WATERMARK)
+            ).scalar()
+            if last is not None and now - last < self.interval:
+                return False
+            drift = reconcile(conn)
+            updated = conn.execute(
+                db.update(Watermark).where(Watermark.name == RECONCILED_WATERMARK).values(value=now)
+            ).rowcount
+            if not updated:
+                conn.execute(db.insert(Watermark).values(name=RECONCILED_WATERMARK, value=now))
+        if drift:
+            logger.warning('Stat counters had drifted: %s', drift)
+        self.last_run = datetime.utcnow()
+        self.last_drift = drift
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as e:
+                logger.exception('Stat counter reconciliation failed')
+                self.last_error = str(e)
+            time.sleep(self.interval)
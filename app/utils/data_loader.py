@@ -1,187 +1,560 @@
+import logging
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from flask import current_app
 from ..models.models import db, Protocol, Contract, User, Transaction, MarketData
-from sqlalchemy.exc import IntegrityError
+from . import counters
+from .address_index import AddressIndex
+from .archive import archived_before
+from .bulk import canonical_hex, frame_to_records, insert_ignore, insert_ignore_keys
+from .dataset import DATE_PARTITION, filter_key, find_source, scan_dataset, scan_time_range
+from .manifest import (COMPLETE, open_manifest, pending_row_groups, record_progress, close_manifest,
+                       skip_row_groups)
+from .partitions import create_partitions, is_partitioned, month_range
+from .rollup import add_transactions
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import multiprocessing
 import os
+import time
 
-def load_contracts_from_parquet(parquet_path):
-    """Load contracts data from Parquet file"""
-    df = pd.read_parquet(parquet_path)
-    
-    protocols_added = {}
-    contracts_added = 0
-    
-    for _, row in df.iterrows():
-        protocol_name = row['protocol_name']
-        
-        if protocol_name not in protocols_added:
-            protocol = Protocol.query.filter_by(protocol_name=protocol_name).first()
-            if not protocol:
-                protocol = Protocol(
-                    protocol_name=row['protocol_name'],
-                    protocol_symbol=row['protocol_symbol'],
-                    type=row['type'],
-                    description=row.get('description', ''),
-                    website_url=row.get('website_url', '')
-                )
-                db.session.add(protocol)
-                db.session.flush()
-            protocols_added[protocol_name] = protocol.protocol_id
-        
-        existing_contract = Contract.query.filter_by(
-            contract_address=row['contract_address'],
-            blockchain=row['blockchain']
-        ).first()
-        
-        if not existing_contract:
-            contract = Contract(
-                contract_address=row['contract_address'],
-                blockchain=row['blockchain'],
-                protocol_id=protocols_added[protocol_name]
-            )
-            db.session.add(contract)
-            contracts_added += 1
-    
-    try:
-        db.session.commit()
-    except IntegrityError:
-        db.session.rollback()
-    
-    return {'protocols_added': len(protocols_added), 'contracts_added': contracts_added}
-
-
-def load_users_from_parquet(parquet_path):
-    """Load users data from Parquet file"""
-    df = pd.read_parquet(parquet_path)
-    users_added = 0
-    
-    for _, row in df.iterrows():
-        existing_user = User.query.filter_by(user_address=row['user_address']).first()
-        
-        if not existing_user:
-            user = User(
-                user_address=row['user_address'],
-                total_transactions=row.get('total_transactions', 0),
-                total_volume=row.get('total_volume', 0),
-                first_transaction_date=pd.to_datetime(row.get('first_transaction_date')) if pd.notna(row.get('first_transaction_date')) else None,
-                last_transaction_date=pd.to_datetime(row.get('last_transaction_date')) if pd.notna(row.get('last_transaction_date')) else None,
-                user_type=row.get('user_type', 'regular')
-            )
-            db.session.add(user)
-            users_added += 1
-    
-    try:
-        db.session.commit()
-    except IntegrityError:
-        db.session.rollback()
-    
-    return {'users_added': users_added}
+logger = logging.getLogger(__name__)
+
+# Rows sampled to estimate the in-memory size of a batch
+SAMPLE_ROWS = 1024
+
+# A batch is held as Arrow, as a DataFrame and as insert parameters at once
+BATCH_MEMORY_FACTOR = 3
+
+CONTRACT_COLUMNS = [
+    'protocol_name', 'protocol_symbol', 'type', 'description', 'website_url',
+    'contract_address', 'blockchain'
+]
+USER_COLUMNS = [
+    'user_address', 'total_transactions', 'total_volume',
+    'first_transaction_date', 'last_transaction_date', 'user_type'
+]
+TRANSACTION_COLUMNS = [
+    'transaction_hash', 'contract_address', 'from_address', 'to_address', 'value',
+    'gas_used', 'gas_price', 'transaction_fee', 'timestamp', 'block_number', 'status'
+]
+AMOUNT_COLUMNS = ['value', 'gas_price', 'transaction_fee']
+MARKET_COLUMNS = [
+    'protocol_name', 'date', 'total_volume', 'transaction_count', 'unique_users',
+    'avg_transaction_value', 'total_fees'
+]
+
+
+def _batch_rows(parquet_file, columns, batch_size=None, memory_budget_mb=None):
+    """Work out how many rows to read per batch to stay within the memory budget"""
+    batch_size = batch_size or current_app.config['LOAD_BATCH_SIZE']
+    memory_budget_mb = memory_budget_mb or current_app.config['LOAD_MEMORY_BUDGET_MB']
+
+    sample = next(parquet_file.iter_batches(batch_size=SAMPLE_ROWS, columns=columns), None)
+    if sample is None or sample.num_rows == 0:
+        return batch_size
+
+    row_bytes = sample.to_pandas().memory_usage(deep=True).sum() / sample.num_rows
+    budget_rows = int(memory_budget_mb * 1024 * 1024 / (row_bytes * BATCH_MEMORY_FACTOR))
+    return max(1, min(batch_size, budget_rows))
+
+
+def iter_parquet_batches(parquet_path, columns, batch_size=None, memory_budget_mb=None,
+                         row_groups=None, partition_values=None):
+    """Stream a Parquet file as (row_group, DataFrame) pairs, reading only the requested columns.
+
+    Partition values (from a Hive directory name) fill requested columns the
+    file itself does not have.
+    """
+    parquet_file = pq.ParquetFile(parquet_path)
+    available = [c for c in columns if c in parquet_file.schema_arrow.names]
+    constants = {
+        c: v for c, v in (partition_values or {}).items() if c in columns and c not in available
+    }
+    rows = _batch_rows(parquet_file, available, batch_size, memory_budget_mb)
 
+    if row_groups is None:
+        row_groups = range(parquet_file.num_row_groups)
 
-def load_transactions_from_parquet(parquet_path):
-    """Load transactions data from Parquet file"""
-    df = pd.read_parquet(parquet_path)
-    transactions_added = 0
-    
-    # Create address to contract_id mapping
-    contracts = {c.contract_address: c.contract_id for c in Contract.query.all()}
-    users = {u.user_address: u.user_id for u in User.query.all()}
-    
-    for _, row in df.iterrows():
-        existing_tx = Transaction.query.filter_by(transaction_hash=row['transaction_hash']).first()
-        
-        if not existing_tx:
-            contract_id = contracts.get(row.get('contract_address'))
-            if not contract_id:
+    for row_group in row_groups:
+        for batch in parquet_file.iter_batches(batch_size=rows, columns=available, row_groups=[row_group]):
+            yield row_group, batch.to_pandas().assign(**constants)
+
+
+def _filter_frame(df, row_filter):
+    """Keep the rows of a DataFrame that match a pyarrow dataset expression"""
+    return pa.Table.from_pandas(df, preserve_index=False).filter(row_filter).to_pandas()
+
+
+def load_row_groups(manifest_id, scan, columns, load_batch, batch_size=None,
+                    memory_budget_mb=None, row_groups=None):
+    """Feed the unfinished row groups of a file scan through load_batch.
+
+    Each batch is committed together with its checkpoint, so a crashed load
+    resumes from the last committed batch. Checkpoints count the rows read,
+    before the scan's row filter drops any. Returns (rows_read, rows_added).
+    """
+    offsets = pending_row_groups(manifest_id, row_groups)
+    rows_read = 0
+    rows_added = 0
+
+    for row_group, df in iter_parquet_batches(scan.path, columns, batch_size, memory_budget_mb,
+                                              list(offsets), scan.partition_values):
+        # Skip the rows a previous run already committed
+        skip = offsets[row_group]
+        if skip:
+            offsets[row_group] = max(0, skip - len(df))
+            df = df.iloc[skip:]
+            if df.empty:
                 continue
-            
-            transaction = Transaction(
-                transaction_hash=row['transaction_hash'],
-                contract_id=contract_id,
-                from_user_id=users.get(row.get('from_address')),
-                to_user_id=users.get(row.get('to_address')),
-                from_address=row['from_address'],
-                to_address=row.get('to_address'),
-                value=row.get('value', 0),
-                gas_used=row.get('gas_used'),
-                gas_price=row.get('gas_price'),
-                transaction_fee=row.get('transaction_fee'),
-                timestamp=pd.to_datetime(row['timestamp']),
-                block_number=row.get('block_number'),
-                status=row.get('status', 'success')
-            )
-            db.session.add(transaction)
-            transactions_added += 1
-            
-            if transactions_added % 1000 == 0:
-                db.session.commit()
-    
-    try:
+
+        rows = len(df)
+        if scan.row_filter is not None:
+            df = _filter_frame(df, scan.row_filter)
+        if not df.empty:
+            rows_added += load_batch(df)
+        rows_read += rows
+        record_progress(manifest_id, row_group, rows)
         db.session.commit()
-    except IntegrityError:
-        db.session.rollback()
-    
-    return {'transactions_added': transactions_added}
-
-
-def load_market_from_parquet(parquet_path):
-    """Load market data from Parquet file"""
-    df = pd.read_parquet(parquet_path)
-    market_added = 0
-    
-    protocols = {p.protocol_name: p.protocol_id for p in Protocol.query.all()}
-    
-    for _, row in df.iterrows():
-        protocol_id = protocols.get(row.get('protocol_name'))
-        if not protocol_id:
-            continue
-        
-        date_val = pd.to_datetime(row['date']).date() if pd.notna(row.get('date')) else None
-        
-        existing = MarketData.query.filter_by(
-            protocol_id=protocol_id,
-            date=date_val
-        ).first()
-        
-        if not existing:
-            market = MarketData(
-                protocol_id=protocol_id,
-                date=date_val,
-                total_volume=row.get('total_volume', 0),
-                transaction_count=row.get('transaction_count', 0),
-                unique_users=row.get('unique_users', 0),
-                avg_transaction_value=row.get('avg_transaction_value', 0),
-                total_fees=row.get('total_fees', 0)
+
+    return rows_read, rows_added
+
+
+def open_scan_manifest(loader, scan, force=False):
+    """Open the manifest for a file scan.
+
+    A filtered scan reads only part of the file, so it is tracked under its
+    own loader name and the row groups it does not need are marked done.
+    """
+    if scan.row_filter is not None:
+        loader = f'{loader}:{filter_key(scan.row_filter)}'
+
+    manifest = open_manifest(loader, scan.path, force)
+    if manifest.status != COMPLETE and scan.row_groups is not None:
+        skip_row_groups(manifest.manifest_id, scan.row_groups)
+    return manifest
+
+
+def load_file(loader, scan, columns, load_batch, batch_size=None,
+              memory_budget_mb=None, force=False):
+    """Load a file scan under its ingestion manifest.
+
+    Returns the number of rows inserted, or None if the manifest shows the
+    file was already loaded completely.
+    """
+    manifest = open_scan_manifest(loader, scan, force)
+    if manifest.status == COMPLETE:
+        return None
+
+    _, rows_added = load_row_groups(manifest.manifest_id, scan, columns,
+                                    load_batch, batch_size, memory_budget_mb)
+    close_manifest(manifest.manifest_id)
+    return rows_added
+
+
+def load_dataset(loader, scans, columns, load_batch, batch_size=None, memory_budget_mb=None,
+                 force=False):
+    """Load the file scans of a dataset (see scan_dataset) one file at a time.
+
+    Returns the number of rows inserted, or None if every selected file was
+    already loaded.
+    """
+    rows_added = None
+    for scan in scans:
+        added = load_file(loader, scan, columns, load_batch, batch_size, memory_budget_mb, force)
+        if added is not None:
+            rows_added = (rows_added or 0) + added
+    return rows_added
+
+
+def _with_defaults(df, defaults):
+    """Add any optional columns missing from the file and fill their gaps"""
+    for column, default in defaults.items():
+        if column not in df.columns:
+            df[column] = default
+        elif default is not None:
+            df[column] = df[column].fillna(default)
+    return df
+
+
+def _id_map(key_columns, id_column):
+    """Fetch a key -> id mapping as a DataFrame ready to be merged"""
+    rows = db.session.execute(db.select(*key_columns, id_column)).all()
+    names = [c.key for c in key_columns] + [id_column.key]
+    return pd.DataFrame(rows, columns=names)
+
+
+def _load_contracts_batch(df):
+    df = _with_defaults(df, {'description': '', 'website_url': ''})
+
+    protocols = df.drop_duplicates('protocol_name')[
+        ['protocol_name', 'protocol_symbol', 'type', 'description', 'website_url']
+    ]
+    counters.add({counters.PROTOCOLS: insert_ignore(Protocol.__table__, frame_to_records(protocols))})
+
+    protocol_ids = _id_map([Protocol.protocol_name], Protocol.protocol_id)
+    df['contract_address'] = canonical_hex(df['contract_address'])
+    contracts = df.drop_duplicates(['contract_address', 'blockchain'])\
+        .merge(protocol_ids, on='protocol_name', how='inner')[
+            ['contract_address', 'blockchain', 'protocol_id']
+        ]
+    added = insert_ignore_keys(Contract.__table__, frame_to_records(contracts))
+    counters.add_contracts(added)
+    return set(protocols['protocol_name']), len(added)
+
+
+def load_contracts_from_parquet(parquet_path, batch_size=None, memory_budget_mb=None, force=False,
+                                filters=None):
+    """Load contracts data from a Parquet file or Hive-partitioned directory"""
+    protocols_seen = set()
+
+    def load_batch(df):
+        protocols, added = _load_contracts_batch(df)
+        protocols_seen.update(protocols)
+        return added
+
+    scans = scan_dataset(parquet_path, 'contracts', **(filters or {}))
+    contracts_added = load_dataset('contracts', scans, CONTRACT_COLUMNS, load_batch,
+                                   batch_size, memory_budget_mb, force)
+    if contracts_added is None:
+        return {'protocols_added': 0, 'contracts_added': 0, 'skipped': True}
+
+    return {'protocols_added': len(protocols_seen), 'contracts_added': contracts_added}
+
+
+def _load_users_batch(df):
+    df = _with_defaults(df, {
+        'total_transactions': 0,
+        'total_volume': 0,
+        'first_transaction_date': None,
+        'last_transaction_date': None,
+        'user_type': 'regular'
+    })
+
+    df['user_address'] = canonical_hex(df['user_address'])
+    users = df.drop_duplicates('user_address')[[
+        'user_address', 'total_transactions', 'total_volume',
+        'first_transaction_date', 'last_transaction_date', 'user_type'
+    ]].copy()
+    users['total_transactions'] = users['total_transactions'].astype('Int64')
+    users['first_transaction_date'] = pd.to_datetime(users['first_transaction_date'])
+    users['last_transaction_date'] = pd.to_datetime(users['last_transaction_date'])
+
+    added = insert_ignore_keys(User.__table__, frame_to_records(users))
+    counters.add_users(added)
+    return len(added)
+
+
+def load_users_from_parquet(parquet_path, batch_size=None, memory_budget_mb=None, force=False,
+                            filters=None):
+    """Load users data from a Parquet file or Hive-partitioned directory"""
+    scans = scan_dataset(parquet_path, 'users', **(filters or {}))
+    users_added = load_dataset('users', scans, USER_COLUMNS, _load_users_batch,
+                               batch_size, memory_budget_mb, force)
+    if users_added is None:
+        return {'users_added': 0, 'skipped': True}
+
+    return {'users_added': users_added}
+
+
+def _amounts_fit(values, column_type):
+    """Mask of the amounts a ScaledInteger column can store; nulls fit"""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.isna() | (values.abs() < float(column_type.max_value))
+    return values.isna() | values.map(column_type.fits, na_action='ignore').eq(True)
+
+
+def _load_transactions_batch(df, contracts, users, protocols, horizon=None):
+    # Days before the archive horizon are in the archive already
+    if horizon is not None:
+        df = df[pd.to_datetime(df['timestamp']) >= horizon]
+    df = _with_defaults(df, {
+        'to_address': None,
+        'value': 0,
+        'gas_used': None,
+        'gas_price': None,
+        'transaction_fee': None,
+        'block_number': None,
+        'status': 'success'
+    })
+    # An amount too large to store would fail the whole insert, so only its row is dropped
+    fits = pd.Series(True, index=df.index)
+    for column in AMOUNT_COLUMNS:
+        fits &= _amounts_fit(df[column], Transaction.__table__.c[column].type)
+    if not fits.all():
+        logger.warning('Skipping %d transactions with amounts that cannot be stored', (~fits).sum())
+        df = df[fits]
+
+    # Hashes and addresses are deduplicated and resolved in their stored form
+    for column in ('transaction_hash', 'contract_address', 'from_address', 'to_address'):
+        df[column] = canonical_hex(df[column])
+    df = df.drop_duplicates('transaction_hash')
+
+    # Resolve foreign keys for the whole batch against the address indexes
+    df['contract_id'] = contracts.lookup(df['contract_address'])
+    df = df[df['contract_id'] != AddressIndex.MISSING].copy()
+    df['protocol_id'] = df['contract_id'].map(protocols)
+    for side in ('from', 'to'):
+        ids = users.lookup(df[f'{side}_address'])
+        df[f'{side}_user_id'] = pd.Series(ids, index=df.index).where(ids != AddressIndex.MISSING)
+
+    transactions = df[[
+        'transaction_hash', 'contract_id', 'protocol_id', 'from_user_id', 'to_user_id',
+        'from_address', 'to_address', 'value', 'gas_used', 'gas_price',
+        'transaction_fee', 'timestamp', 'block_number', 'status'
+    ]].copy()
+    for column in ('from_user_id', 'to_user_id', 'gas_used', 'block_number'):
+        transactions[column] = transactions[column].astype('Int64')
+    transactions['timestamp'] = pd.to_datetime(transactions['timestamp'])
+
+    inserted = insert_ignore_keys(Transaction.__table__, frame_to_records(transactions))
+    add_transactions(inserted)
+    counters.add_transactions(inserted)
+    return len(inserted)
+
+
+def _unarchived(scans):
+    """The scans of date partitions the archive does not hold yet; the rows of
+    other files are checked as they are loaded"""
+    horizon = archived_before()
+    if not horizon:
+        return scans
+    return [scan for scan in scans if scan.partition_values.get(DATE_PARTITION, horizon) >= horizon]
+
+
+def _create_partitions(scans):
+    """Make sure a partitioned transactions table has partitions for the months about to be loaded.
+
+    Runs on its own connection and commits straight away, so the partition
+    DDL never holds locks for the length of the load.
+    """
+    with db.engine.begin() as conn:
+        if not is_partitioned(conn):
+            return
+        lo, hi = scan_time_range(scans, 'timestamp')
+        if lo is not None:
+            create_partitions(conn, month_range(lo, hi))
+
+
+class _TransactionsBatchLoader:
+    """Batch loader holding the address indexes, the contract to protocol map
+    and the archive horizon, before which rows are not loaded again.
+
+    They are read on the first batch, so a run over files the manifests
+    already show as loaded does not read the contracts and users at all.
+    """
+
+    def __init__(self):
+        self.maps = None
+        self.horizon = None
+
+    def __call__(self, df):
+        if self.maps is None:
+            self.maps = (
+                AddressIndex.from_query(Contract.contract_address, Contract.contract_id),
+                AddressIndex.from_query(User.user_address, User.user_id),
+                dict(db.session.execute(db.select(Contract.contract_id, Contract.protocol_id)).all())
             )
-            db.session.add(market)
-            market_added += 1
-    
-    try:
-        db.session.commit()
-    except IntegrityError:
-        db.session.rollback()
-    
+            horizon = archived_before()
+            self.horizon = datetime.combine(horizon, datetime.min.time()) if horizon else None
+        return _load_transactions_batch(df, *self.maps, horizon=self.horizon)
+
+    def user_index(self):
+        """Memory footprint of the user index, or None if no batch was loaded"""
+        return self.maps[1].stats() if self.maps is not None else None
+
+
+def load_transactions_from_parquet(parquet_path, batch_size=None, memory_budget_mb=None, force=False,
+                                   filters=None):
+    """Load transactions data from a Parquet file or Hive-partitioned directory"""
+    scans = _unarchived(scan_dataset(parquet_path, 'transactions', **(filters or {})))
+    _create_partitions(scans)
+    load_batch = _TransactionsBatchLoader()
+    transactions_added = load_dataset('transactions', scans, TRANSACTION_COLUMNS,
+                                      load_batch, batch_size, memory_budget_mb, force)
+    if transactions_added is None:
+        return {'transactions_added': 0, 'skipped': True}
+
+    return {'transactions_added': transactions_added, 'user_index': load_batch.user_index()}
+
+
+def _load_market_batch(df, protocols):
+    df = _with_defaults(df, {
+        'total_volume': 0,
+        'transaction_count': 0,
+        'unique_users': 0,
+        'avg_transaction_value': 0,
+        'total_fees': 0
+    })
+
+    df = df.merge(protocols, on='protocol_name', how='inner')
+    df = df[df['date'].notna()].copy()
+    df['date'] = pd.to_datetime(df['date']).dt.date
+    df = df.drop_duplicates(['protocol_id', 'date'])
+
+    market = df[[
+        'protocol_id', 'date', 'total_volume', 'transaction_count',
+        'unique_users', 'avg_transaction_value', 'total_fees'
+    ]].copy()
+    market['transaction_count'] = market['transaction_count'].astype('Int64')
+    market['unique_users'] = market['unique_users'].astype('Int64')
+
+    return insert_ignore(MarketData.__table__, frame_to_records(market))
+
+
+def load_market_from_parquet(parquet_path, batch_size=None, memory_budget_mb=None, force=False,
+                             filters=None):
+    """Load market data from a Parquet file or Hive-partitioned directory"""
+    protocols = _id_map([Protocol.protocol_name], Protocol.protocol_id)
+
+    scans = scan_dataset(parquet_path, 'market', **(filters or {}))
+    market_added = load_dataset('market', scans, MARKET_COLUMNS,
+                                lambda df: _load_market_batch(df, protocols),
+                                batch_size, memory_budget_mb, force)
+    if market_added is None:
+        return {'market_added': 0, 'skipped': True}
+
     return {'market_added': market_added}
 
 
-def load_all_data(data_dir='data'):
-    """Load all Parquet files"""
+def _transactions_worker(config, share, batch_size, memory_budget_mb):
+    """Load a share of the transactions row groups, as (manifest_id, scan, row_groups) parts, in a worker process"""
+    from .. import create_app
+
+    app = create_app(config)
+    with app.app_context():
+        started = time.perf_counter()
+        load_batch = _TransactionsBatchLoader()
+        rows_read = 0
+        rows_added = 0
+        for manifest_id, scan, row_groups in share:
+            read, added = load_row_groups(
+                manifest_id, scan, TRANSACTION_COLUMNS, load_batch,
+                batch_size, memory_budget_mb, row_groups
+            )
+            rows_read += read
+            rows_added += added
+        db.engine.dispose()
+
+    seconds = time.perf_counter() - started
+
+    return {
+        'pid': os.getpid(),
+        'row_groups': sum(len(row_groups) for _, _, row_groups in share),
+        'rows_read': rows_read,
+        'transactions_added': rows_added,
+        'user_index': load_batch.user_index(),
+        'seconds': round(seconds, 2),
+        'rows_per_sec': round(rows_read / seconds) if seconds else None
+    }
+
+
+def load_transactions_parallel(parquet_path, workers, batch_size=None, memory_budget_mb=None,
+                               force=False, filters=None):
+    """Load transactions with a process pool, splitting the data by row group.
+
+    Every worker opens its own engine and session. The memory budget is
+    shared between the workers. Only row groups the manifests do not show
+    as complete are handed out, from every file the filters select at once.
+    """
+    scans = _unarchived(scan_dataset(parquet_path, 'transactions', **(filters or {})))
+    _create_partitions(scans)
+
+    tasks = []
+    manifests = []
+    for scan in scans:
+        manifest = open_scan_manifest('transactions', scan, force)
+        if manifest.status != COMPLETE:
+            manifests.append(manifest.manifest_id)
+            tasks.extend((manifest.manifest_id, scan, row_group)
+                         for row_group in pending_row_groups(manifest.manifest_id))
+    if not manifests:
+        return {'transactions_added': 0, 'skipped': True}
+
+    workers = max(1, min(workers, len(tasks)))
+    memory_budget_mb = memory_budget_mb or current_app.config['LOAD_MEMORY_BUDGET_MB']
+
+    config = {
+        key: current_app.config[key]
+        for key in ('SQLALCHEMY_DATABASE_URI', 'LOAD_BATCH_SIZE', 'LOAD_MEMORY_BUDGET_MB')
+    }
+
+    # Round-robin the row groups over the workers, grouped by file within each share
+    shares = [{} for _ in range(workers)]
+    for i, (manifest_id, scan, row_group) in enumerate(tasks):
+        shares[i % workers].setdefault(manifest_id, (scan, []))[1].append(row_group)
+
+    # Spawn rather than fork so no worker inherits the parent's pooled connections
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(_transactions_worker, config,
+                        [(manifest_id, scan, row_groups) for manifest_id, (scan, row_groups) in share.items()],
+                        batch_size, max(1, memory_budget_mb // workers))
+            for share in shares if share
+        ]
+        summaries = [f.result() for f in futures]
+
+    for manifest_id in manifests:
+        close_manifest(manifest_id)
+
+    return {
+        'transactions_added': sum(s['transactions_added'] for s in summaries),
+        'workers': summaries
+    }
+
+
+def load_all_data(data_dir='data', batch_size=None, memory_budget_mb=None, workers=1, force=False,
+                  bulk_rebuild=False, since=None, until=None, blockchain=None):
+    """Load all Parquet files.
+
+    Each dataset is read from <name>.parquet or from a Hive-partitioned
+    <name>/ directory. Files are loaded in dependency order: contracts,
+    users, transactions, market. since/until (dates, inclusive) and
+    blockchain select files by partition and row groups by statistics.
+    With workers > 1 the transactions are split across a process pool.
+    With bulk_rebuild the transactions table is rebuilt from the file through a
+    staging table and swapped in (see bulk_rebuild.py).
+    Files the ingestion manifest records as complete are skipped unless force is set.
+    Transactions dated before the archive horizon are not loaded again; they
+    are dropped as rows are read, so the horizon never enters a manifest key.
+    """
     results = {}
-    
-    contracts_path = os.path.join(data_dir, 'contracts.parquet')
-    if os.path.exists(contracts_path):
-        results['contracts'] = load_contracts_from_parquet(contracts_path)
-    
-    users_path = os.path.join(data_dir, 'users.parquet')
-    if os.path.exists(users_path):
-        results['users'] = load_users_from_parquet(users_path)
-    
-    transactions_path = os.path.join(data_dir, 'transactions.parquet')
-    if os.path.exists(transactions_path):
-        results['transactions'] = load_transactions_from_parquet(transactions_path)
-    
-    market_path = os.path.join(data_dir, 'market.parquet')
-    if os.path.exists(market_path):
-        results['market'] = load_market_from_parquet(market_path)
-    
+    filters = {'since': since, 'until': until, 'blockchain': blockchain}
+    options = {'batch_size': batch_size, 'memory_budget_mb': memory_budget_mb, 'force': force,
+               'filters': filters}
+
+    transactions_path = find_source(data_dir, 'transactions')
+    if bulk_rebuild and transactions_path and (os.path.isdir(transactions_path) or any(filters.values())):
+        raise ValueError('Bulk rebuild replaces the whole table and needs a single '
+                         'transactions.parquet without filters')
+
+    contracts_path = find_source(data_dir, 'contracts')
+    if contracts_path:
+        results['contracts'] = load_contracts_from_parquet(contracts_path, **options)
+
+    users_path = find_source(data_dir, 'users')
+    if users_path:
+        results['users'] = load_users_from_parquet(users_path, **options)
+
+    if transactions_path:
+        if bulk_rebuild:
+            from .bulk_rebuild import rebuild_transactions
+            results['transactions'] = rebuild_transactions(
+                transactions_path, batch_size=batch_size, memory_budget_mb=memory_budget_mb
+            )
+        elif workers > 1:
+            results['transactions'] = load_transactions_parallel(
+                transactions_path, workers, **options
+            )
+        else:
+            results['transactions'] = load_transactions_from_parquet(
+                transactions_path, **options
+            )
+
+    market_path = find_source(data_dir, 'market')
+    if market_path:
+        results['market'] = load_market_from_parquet(market_path, **options)
+
     return results
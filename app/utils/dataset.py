@@ -0,0 +1,145 @@
+import hashlib
+import os
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from ..models.models import db, Contract
+
+# Column each loader filters on for --since/--until
+TIME_FIELDS = {'transactions': 'timestamp', 'market': 'date'}
+
+# Hive partition keys the filters know how to prune
+DATE_PARTITION = 'date'
+BLOCKCHAIN_PARTITION = 'blockchain'
+
+# One file to read: which of its row groups, the partition values missing
+# from its columns, and the filter still to apply to its rows (or None)
+FileScan = namedtuple('FileScan', ['path', 'partition_values', 'row_groups', 'row_filter'])
+
+
+def find_source(data_dir, name):
+    """Path of the <name>/ dataset directory or the <name>.parquet file, or None"""
+    directory = os.path.join(data_dir, name)
+    if os.path.isdir(directory):
+        return directory
+    path = os.path.join(data_dir, f'{name}.parquet')
+    return path if os.path.exists(path) else None
+
+
+def _literal(value, type_):
+    """A date or datetime as a scalar of the field's type, so statistics can be compared"""
+    day = value.date() if isinstance(value, datetime) else value
+    if pa.types.is_string(type_) or pa.types.is_large_string(type_):
+        return pa.scalar(day.isoformat(), type_)
+    if pa.types.is_date(type_):
+        return pa.scalar(day, type_)
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, time())
+    return pa.scalar(value, type_)
+
+
+def _range(field, type_, since, until):
+    """field within [since, until], both whole days"""
+    expression = None
+    if since:
+        expression = ds.field(field) >= _literal(since, type_)
+    if until:
+        # Dates compare inclusively; anything finer stops before the next day
+        if pa.types.is_timestamp(type_):
+            bound = ds.field(field) < _literal(until + timedelta(days=1), type_)
+        else:
+            bound = ds.field(field) <= _literal(until, type_)
+        expression = bound if expression is None else expression & bound
+    return expression
+
+
+def _and(*expressions):
+    result = None
+    for expression in expressions:
+        if expression is not None:
+            result = expression if result is None else result & expression
+    return result
+
+
+def _chain_addresses(blockchain):
+    return db.session.execute(
+        db.select(Contract.contract_address).where(Contract.blockchain == blockchain)
+    ).scalars().all()
+
+
+def filter_key(row_filter):
+    """Short stable name for a row filter, used to keep filtered loads in their own manifest"""
+    return hashlib.sha1(str(row_filter).encode()).hexdigest()[:12]
+
+
+def scan_dataset(path, loader, since=None, until=None, blockchain=None):
+    """Plan the reads for a Parquet file or a Hive-partitioned directory.
+
+    Filters on a partition key (date=, blockchain=) prune whole files. The
+    rest become a row filter that also prunes row groups by their min/max
+    statistics. When the data has no blockchain field, transactions are
+    matched on the addresses of that chain's contracts instead.
+    """
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    schema = dataset.schema
+    # A single file reports its own schema as the partitioning schema
+    partitions = set(dataset.partitioning.schema.names) if os.path.isdir(path) else set()
+
+    partition_filters = []
+    row_filters = []
+
+    time_field = TIME_FIELDS.get(loader)
+    if since or until:
+        if DATE_PARTITION in partitions:
+            partition_filters.append(_range(DATE_PARTITION, schema.field(DATE_PARTITION).type, since, until))
+        elif time_field in schema.names:
+            row_filters.append(_range(time_field, schema.field(time_field).type, since, until))
+
+    if blockchain:
+        if BLOCKCHAIN_PARTITION in partitions:
+            partition_filters.append(ds.field(BLOCKCHAIN_PARTITION) == blockchain)
+        elif BLOCKCHAIN_PARTITION in schema.names:
+            row_filters.append(ds.field(BLOCKCHAIN_PARTITION) == blockchain)
+        elif loader == 'transactions' and 'contract_address' in schema.names:
+            row_filters.append(ds.field('contract_address').isin(_chain_addresses(blockchain)))
+
+    partition_filter = _and(*partition_filters)
+    row_filter = _and(*row_filters)
+    combined = _and(partition_filter, row_filter)
+
+    scans = []
+    for fragment in dataset.get_fragments(filter=combined if combined is not None else ds.scalar(True)):
+        partition_values = ds.get_partition_keys(fragment.partition_expression)
+        row_groups = None
+        if row_filter is not None:
+            row_groups = [
+                row_group.id
+                for piece in fragment.split_by_row_group(filter=combined)
+                for row_group in piece.row_groups
+            ]
+            if not row_groups:
+                continue
+        scans.append(FileScan(fragment.path, partition_values, row_groups, row_filter))
+
+    return sorted(scans, key=lambda scan: scan.path)
+
+
+def scan_time_range(scans, column):
+    """Min and max of a column over the row groups the scans read, from the Parquet statistics"""
+    lo = hi = None
+    for scan in scans:
+        metadata = pq.ParquetFile(scan.path).metadata
+        names = metadata.schema.to_arrow_schema().names
+        if column not in names:
+            continue
+        index = names.index(column)
+        row_groups = scan.row_groups if scan.row_groups is not None else range(metadata.num_row_groups)
+        for row_group in row_groups:
+            stats = metadata.row_group(row_group).column(index).statistics
+            if stats is None or not stats.has_min_max:
+                continue
+            lo = stats.min if lo is None else min(lo, stats.min)
+            hi = stats.max if hi is None else max(hi, stats.max)
+    return lo, hi
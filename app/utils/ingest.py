@@ -0,0 +1,207 @@
+import io
+import json
+from decimal import Decimal
+import pandas as pd
+import pyarrow as pa
+from ..models.models import db, Contract, User, Transaction
+from ..models.types import parse_amount
+from . import archive, counters
+from .bulk import canonical_hex, copy_ignore_keys
+from .rollup import add_transactions
+
+# Rows parsed and inserted at a time from a batch request
+CHUNK_ROWS = 10_000
+
+# Read buffer for NDJSON bodies; the raw request stream is unbuffered
+READ_BUFFER = 1 << 20
+
+# Bound on the per-row errors returned for one request
+MAX_ERRORS = 100
+
+# Addresses or ids sent per IN (...) lookup
+LOOKUP_CHUNK = 5_000
+
+NDJSON_TYPES = {'application/x-ndjson', 'application/ndjson', 'application/jsonl'}
+ARROW_STREAM_TYPES = {'application/vnd.apache.arrow.stream'}
+ARROW_FILE_TYPES = {'application/vnd.apache.arrow.file'}
+
+COLUMNS = [
+    'transaction_hash', 'contract_id', 'contract_address', 'from_user_id', 'to_user_id',
+    'from_address', 'to_address', 'value', 'gas_used', 'gas_price', 'transaction_fee',
+    'timestamp', 'block_number', 'status'
+]
+HEX_COLUMNS = ['transaction_hash', 'contract_address', 'from_address', 'to_address']
+# Parsed as Decimals, since float64 would round them before they are stored
+AMOUNT_COLUMNS = ['value', 'gas_price', 'transaction_fee']
+INTEGER_COLUMNS = ['contract_id', 'from_user_id', 'to_user_id', 'gas_used', 'block_number']
+
+
+def read_ndjson(stream, chunk_rows=CHUNK_ROWS):
+    """Yield (DataFrame, errors) chunks from an NDJSON stream, indexed by line number"""
+    records = []
+    rows = []
+    errors = []
+    for number, line in enumerate(io.BufferedReader(stream, READ_BUFFER)):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line, parse_float=Decimal)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            errors.append({'row': number, 'error': 'Invalid JSON object'})
+            continue
+        records.append(record)
+        rows.append(number)
+        if len(records) >= chunk_rows:
+            yield pd.DataFrame.from_records(records, index=rows), errors
+            records, rows, errors = [], [], []
+
+    if records or errors:
+        yield pd.DataFrame.from_records(records, index=rows), errors
+
+
+def read_arrow(stream, file_format=False):
+    """Yield (DataFrame, errors) chunks from an Arrow IPC stream or file, one per record batch"""
+    if file_format:
+        reader = pa.ipc.open_file(pa.BufferReader(stream.read()))
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    else:
+        batches = pa.ipc.open_stream(stream)
+
+    offset = 0
+    for batch in batches:
+        df = batch.to_pandas()
+        df.index = pd.RangeIndex(offset, offset + len(df))
+        offset += len(df)
+        yield df, []
+
+
+def _chunks(values, size=LOOKUP_CHUNK):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _address_ids(address_column, id_column, addresses):
+    """Map each address to its highest id with IN (...) lookups"""
+    addresses = list(pd.unique(addresses.dropna()))
+    ids = {}
+    for chunk in _chunks(addresses):
+        ids.update(db.session.execute(
+            db.select(address_column, db.func.max(id_column))
+            .where(address_column.in_(chunk))
+            .group_by(address_column)
+        ).all())
+    return ids
+
+
+def _existing_ids(id_column, ids):
+    """The subset of ids that exist in the table"""
+    ids = [int(i) for i in pd.unique(ids.dropna())]
+    found = set()
+    for chunk in _chunks(ids):
+        found.update(db.session.execute(db.select(id_column).where(id_column.in_(chunk))).scalars())
+    return found
+
+
+def _protocol_ids(contract_ids):
+    """Map each contract id to its protocol id"""
+    ids = [int(i) for i in pd.unique(contract_ids.dropna())]
+    protocols = {}
+    for chunk in _chunks(ids):
+        protocols.update(db.session.execute(
+            db.select(Contract.contract_id, Contract.protocol_id).where(Contract.contract_id.in_(chunk))
+        ).all())
+    return protocols
+
+
+def _resolve(df, id_name, address_name, address_column, id_column, reasons=None, error=None):
+    """Resolve an id column from an explicit id if it exists, else from an address.
+
+    Rows with an explicit id that does not exist are rejected with error when
+    reasons is given. Otherwise unknown ids and addresses resolve to null.
+    """
+    explicit = df[id_name].notna()
+    valid = df[id_name].isin(_existing_ids(id_column, df.loc[explicit, id_name]))
+    if reasons is not None:
+        reasons[explicit & ~valid & reasons.isna()] = error
+
+    by_address = df[address_name].map(_address_ids(address_column, id_column, df.loc[~explicit, address_name]))
+    return df[id_name].where(valid, by_address.where(~explicit)).astype('Int64')
+
+
+def ingest_transactions(df):
+    """Validate, resolve and insert one chunk of a transaction batch.
+
+    Contracts and users can be given by id or by address; both are resolved
+    for the whole chunk with a handful of IN (...) queries. Invalid rows are
+    rejected with a reason, repeated hashes within the chunk and hashes that
+    are already stored, in the table or the archive, count as duplicates, and
+    the rest are inserted with copy_ignore and added to the daily rollup. The
+    caller commits.
+    """
+    df = df.reindex(columns=COLUMNS)
+    reasons = pd.Series(None, index=df.index, dtype=object)
+
+    def reject(mask, error):
+        reasons[mask & reasons.isna()] = error
+
+    reject(df['transaction_hash'].isna() | df['from_address'].isna() | df['timestamp'].isna()
+           | (df['contract_id'].isna() & df['contract_address'].isna()), 'Missing required fields')
+
+    timestamps = pd.to_datetime(df['timestamp'], errors='coerce', utc=True, format='ISO8601')
+    reject(df['timestamp'].notna() & timestamps.isna(), 'Invalid timestamp')
+    df['timestamp'] = timestamps.dt.tz_convert(None)
+
+    for column in INTEGER_COLUMNS:
+        values = pd.to_numeric(df[column], errors='coerce')
+        values = values.where(values % 1 == 0)
+        reject(df[column].notna() & values.isna(), f'Invalid {column}')
+        df[column] = values
+
+    for column in AMOUNT_COLUMNS:
+        amounts = df[column].map(parse_amount, na_action='ignore').astype(object)
+        reject(df[column].notna() & amounts.isna(), f'Invalid {column}')
+        fits = Transaction.__table__.c[column].type.fits
+        reject(amounts.map(fits, na_action='ignore').eq(False), f'{column} is out of range')
+        df[column] = amounts
+
+    for column in ('transaction_hash', 'from_address', 'to_address', 'status'):
+        length = Transaction.__table__.c[column].type.length
+        reject(df[column].notna() & (df[column].astype(str).str.len() > length), f'{column} is too long')
+
+    # Compare and store addresses and hashes in their stored form
+    for column in HEX_COLUMNS:
+        df[column] = canonical_hex(df[column].where(df[column].isna(), df[column].astype(str)))
+
+    df['contract_id'] = _resolve(df, 'contract_id', 'contract_address',
+                                 Contract.contract_address, Contract.contract_id, reasons, 'Unknown contract')
+    reject(df['contract_id'].isna(), 'Unknown contract')
+    df['protocol_id'] = df['contract_id'].map(_protocol_ids(df['contract_id'])).astype('Int64')
+    for side in ('from', 'to'):
+        df[f'{side}_user_id'] = _resolve(df, f'{side}_user_id', f'{side}_address',
+                                         User.user_address, User.user_id)
+
+    valid = df[reasons.isna()]
+    unique = valid.drop_duplicates('transaction_hash')
+    # The table's unique hash only covers live rows, so archived ones are left out here
+    unique = unique[~unique['transaction_hash'].isin(archive.archived_hashes(unique['transaction_hash']))]
+    rows = unique.drop(columns='contract_address').assign(
+        value=unique['value'].fillna(0),
+        status=unique['status'].fillna('success')
+    )
+    for column in ('gas_used', 'block_number'):
+        rows[column] = rows[column].astype('Int64')
+    inserted = copy_ignore_keys(Transaction.__table__, rows)
+    add_transactions(inserted)
+    counters.add_transactions(inserted)
+    accepted = len(inserted)
+
+    rejected = reasons.dropna()
+    return {
+        'accepted': accepted,
+        'duplicates': len(valid) - accepted,
+        'rejected': len(rejected),
+        'errors': [{'row': int(row), 'error': error} for row, error in rejected.items()]
+    }
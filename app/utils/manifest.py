@@ -0,0 +1,113 @@
+import hashlib
+import os
+import struct
+from datetime import datetime
+import pyarrow.parquet as pq
+from ..models.models import db, IngestionManifest, IngestionCheckpoint
+
+PENDING = 'pending'
+RUNNING = 'running'
+COMPLETE = 'complete'
+
+
+def file_fingerprint(parquet_path):
+    """Hash the file size and Parquet footer, which changes whenever the data does"""
+    size = os.path.getsize(parquet_path)
+    with open(parquet_path, 'rb') as f:
+        f.seek(size - 8)
+        footer_length = struct.unpack('<I', f.read(4))[0]
+        f.seek(max(0, size - 8 - footer_length))
+        footer = f.read(footer_length)
+
+    digest = hashlib.sha256()
+    digest.update(str(size).encode())
+    digest.update(footer)
+    return digest.hexdigest()
+
+
+def open_manifest(loader, parquet_path, force=False):
+    """Find or create the manifest for a file and mark it running.
+
+    A complete manifest is returned untouched unless force is set, in which
+    case its checkpoints are reset so the file is loaded again.
+    """
+    fingerprint = file_fingerprint(parquet_path)
+    manifest = IngestionManifest.query.filter_by(loader=loader, fingerprint=fingerprint).first()
+
+    if manifest and manifest.status == COMPLETE and not force:
+        return manifest
+
+    if not manifest:
+        metadata = pq.ParquetFile(parquet_path).metadata
+        manifest = IngestionManifest(
+            loader=loader,
+            file_path=parquet_path,
+            fingerprint=fingerprint,
+            file_size=os.path.getsize(parquet_path),
+            row_groups=metadata.num_row_groups,
+            total_rows=metadata.num_rows
+        )
+        db.session.add(manifest)
+        db.session.flush()
+
+        for row_group in range(metadata.num_row_groups):
+            rows_total = metadata.row_group(row_group).num_rows
+            db.session.add(IngestionCheckpoint(
+                manifest_id=manifest.manifest_id,
+                row_group=row_group,
+                rows_total=rows_total,
+                rows_committed=0,
+                is_complete=rows_total == 0
+            ))
+    elif force:
+        manifest.checkpoints.update({'rows_committed': 0, 'is_complete': False})
+        manifest.rows_loaded = 0
+        manifest.completed_at = None
+
+    manifest.file_path = parquet_path
+    manifest.status = RUNNING
+    db.session.commit()
+
+    return manifest
+
+
+def pending_row_groups(manifest_id, row_groups=None):
+    """Map each unfinished row group to the number of rows already committed"""
+    query = IngestionCheckpoint.query.filter_by(manifest_id=manifest_id, is_complete=False)
+    if row_groups is not None:
+        query = query.filter(IngestionCheckpoint.row_group.in_(row_groups))
+
+    return {c.row_group: c.rows_committed for c in query.order_by(IngestionCheckpoint.row_group)}
+
+
+def record_progress(manifest_id, row_group, rows):
+    """Advance a row group checkpoint; commit it together with the batch it covers"""
+    IngestionCheckpoint.query.filter_by(manifest_id=manifest_id, row_group=row_group).update({
+        'rows_committed': IngestionCheckpoint.rows_committed + rows,
+        'is_complete': IngestionCheckpoint.rows_committed + rows >= IngestionCheckpoint.rows_total,
+        'updated_at': datetime.utcnow()
+    }, synchronize_session=False)
+
+
+def close_manifest(manifest_id):
+    """Roll the checkpoints up into the manifest and mark it complete if nothing is left"""
+    manifest = db.session.get(IngestionManifest, manifest_id)
+    checkpoints = manifest.checkpoints.all()
+
+    manifest.rows_loaded = sum(c.rows_committed for c in checkpoints)
+    if all(c.is_complete for c in checkpoints):
+        manifest.status = COMPLETE
+        manifest.completed_at = datetime.utcnow()
+    db.session.commit()
+
+    return manifest
+
+
+def skip_row_groups(manifest_id, row_groups):
+    """Mark every row group outside row_groups complete, for loads that read only some of a file"""
+    IngestionCheckpoint.query.filter(
+        IngestionCheckpoint.manifest_id == manifest_id,
+        IngestionCheckpoint.row_group.notin_(row_groups),
+        IngestionCheckpoint.is_complete.is_(False)
+    ).update({'is_complete': True, 'updated_at': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
@@ -0,0 +1,189 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+# Page size used when per_page is missing or below 1, as paginate() does
+DEFAULT_PER_PAGE = 20
+
+# include_total values: COUNT(*), the planner's row estimate, or no total
+TOTAL_MODES = ('exact', 'estimate', 'false')
+
+
+class PaginationError(ValueError):
+    pass
+
+
+class InvalidCursor(PaginationError):
+    pass
+
+
+class _Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain, 'postgresql')
+def _compile_explain(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kw)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return ['datetime', value.isoformat()]
+    if isinstance(value, date):
+        return ['date', value.isoformat()]
+    if isinstance(value, Decimal):
+        return ['decimal', str(value)]
+    return value
+
+
+def _decode_value(value):
+    if not isinstance(value, list):
+        return value
+    kind, text = value
+    if kind == 'datetime':
+        return datetime.fromisoformat(text)
+    if kind == 'date':
+        return date.fromisoformat(text)
+    if kind == 'decimal':
+        return Decimal(text)
+    raise ValueError(kind)
+
+
+def encode_cursor(order, item):
+    """Opaque cursor pointing just past item in a listing sorted by order"""
+    payload = {
+        'k': [column.key for column, _ in order],
+        'v': [_encode_value(getattr(item, column.key)) for column, _ in order]
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(order, cursor):
+    """Sort key values in a cursor made by encode_cursor for the same order"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if payload['k'] != [column.key for column, _ in order] or len(payload['v']) != len(order):
+            raise InvalidCursor('Cursor belongs to a different listing')
+        return [_decode_value(value) for value in payload['v']]
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, InvalidOperation,
+            KeyError, TypeError, ValueError) as e:
+        raise InvalidCursor('Invalid cursor') from e
+
+
+def order_by(order):
+    return [column.desc() if descending else column.asc() for column, descending in order]
+
+
+def _nulls_last(descending, nulls_largest):
+    return nulls_largest != descending
+
+
+def _after(column, descending, value, nulls_largest):
+    """Rows sorted strictly after value in column (None if there are none), and rows tied with it"""
+    if value is None:
+        return (column.isnot(None) if not _nulls_last(descending, nulls_largest) else None), column.is_(None)
+    after = column < value if descending else column > value
+    if _nulls_last(descending, nulls_largest):
+        after = or_(after, column.is_(None))
+    return after, column == value
+
+
+def keyset_filter(order, values, nulls_largest):
+    """Condition selecting the rows sorted after the cursor values.
+
+    The last column of order must be a unique, non-null key. The leading
+    column is also bounded on its own (timestamp <= :t, say), so an index
+    on it can start the scan at the cursor.
+    """
+    (*leading, (last, descending)), last_value = order, values[-1]
+    condition = last < last_value if descending else last > last_value
+    for (column, descending), value in reversed(list(zip(leading, values))):
+        after, tied = _after(column, descending, value, nulls_largest)
+        condition = and_(tied, condition) if after is None else or_(after, and_(tied, condition))
+
+    if leading and values[0] is not None:
+        column, descending = order[0]
+        bound = column <= values[0] if descending else column >= values[0]
+        if _nulls_last(descending, nulls_largest):
+            bound = or_(bound, column.is_(None))
+        condition = and_(bound, condition)
+    return condition
+
+
+def keyset_page(query, order, cursor, per_page):
+    """One page of query in order starting after cursor (from the start when empty).
+
+    Returns the items and the cursor of the next page, or None on the last
+    page. Raises InvalidCursor for a cursor this listing did not issue.
+    """
+    per_page = per_page if per_page > 0 else DEFAULT_PER_PAGE
+    if cursor:
+        nulls_largest = query.session.get_bind().dialect.name == 'postgresql'
+        query = query.filter(keyset_filter(order, decode_cursor(order, cursor), nulls_largest))
+    items = query.order_by(*order_by(order)).limit(per_page + 1).all()
+    if len(items) <= per_page:
+        return items, None
+    items = items[:per_page]
+    return items, encode_cursor(order, items[-1])
+
+
+def total_mode(include_total, cursor=None):
+    """Checked include_total, exact by default for page numbers and false for cursors"""
+    if include_total is None:
+        return 'false' if cursor is not None else 'exact'
+    if include_total not in TOTAL_MODES:
+        raise PaginationError(f"include_total must be one of {', '.join(TOTAL_MODES)}")
+    return include_total
+
+
+def estimate_count(query):
+    """Rows the PostgreSQL planner expects query to return; an exact count elsewhere"""
+    query = query.order_by(None)
+    if query.session.get_bind().dialect.name != 'postgresql':
+        return query.count()
+    plan = query.session.execute(_Explain(query.statement)).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count(query, mode):
+    """Rows in query by an exact or estimate include_total mode"""
+    return estimate_count(query) if mode == 'estimate' else query.order_by(None).count()
+
+
+def total_fields(total, per_page):
+    return {'total': total, 'pages': -(-total // per_page)}
+
+
+def paginate(query, order, page, per_page, cursor=None, include_total=None):
+    """Items of one page of query in order, and the pagination fields of the response.
+
+    With a cursor (empty for the first page) the page is read by keyset.
+    Otherwise page numbers work as before, with a next_cursor to switch
+    over from there. total and pages are added for include_total exact
+    (the default with page numbers) or estimate.
+    """
+    mode = total_mode(include_total, cursor)
+    per_page = per_page if per_page > 0 else DEFAULT_PER_PAGE
+    if cursor is not None:
+        items, next_cursor = keyset_page(query, order, cursor, per_page)
+        fields = {'next_cursor': next_cursor}
+    else:
+        page = page if page > 0 else 1
+        # One row past the page says whether there is a next one without counting
+        items = query.order_by(*order_by(order)).offset((page - 1) * per_page).limit(per_page + 1).all()
+        fields = {
+            'current_page': page,
+            'next_cursor': encode_cursor(order, items[per_page - 1]) if len(items) > per_page else None
+        }
+        items = items[:per_page]
+    if mode != 'false':
+        fields.update(total_fields(count(query, mode), per_page))
+    return items, fields
@@ -0,0 +1,332 @@
+import re
+from datetime import date, datetime
+from sqlalchemy import inspect, text
+from ..models.models import Transaction
+from .counters import remove_transactions_where
+from .rollup import bump_generation, remove_transactions_between
+
+TABLE = 'transactions'
+PARTITION_COLUMN = 'timestamp'
+
+# Months of empty partitions kept ready ahead of the current one
+MONTHS_AHEAD = 3
+
+PARTITION_NAME = re.compile(r'_p(\d{4})_(\d{2})$')
+
+# Keeps transaction hashes unique across the partitions, which the
+# (transaction_hash, timestamp) index only does within one timestamp
+HASH_GUARD = 'transaction_hashes'
+
+# A row whose hash another transaction holds is skipped, which
+# INSERT ... ON CONFLICT DO NOTHING callers see as a duplicate. A row moved
+# to another partition keeps its claim, since it keeps its transaction_id.
+CLAIM_HASH_SQL = f"""
+    CREATE OR REPLACE FUNCTION {HASH_GUARD}_claim() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO {HASH_GUARD} (transaction_hash, transaction_id)
+        VALUES (NEW.transaction_hash, NEW.transaction_id) ON CONFLICT DO NOTHING;
+        IF FOUND OR EXISTS (
+            SELECT 1 FROM {HASH_GUARD}
+            WHERE transaction_hash = NEW.transaction_hash AND transaction_id = NEW.transaction_id
+        ) THEN
+            RETURN NEW;
+        END IF;
+        RETURN NULL;
+    END $$
+"""
+
+# Row level, so deletes cascading from contracts, which run against the
+# partitions, release their hashes too
+RELEASE_HASH_SQL = f"""
+    CREATE OR REPLACE FUNCTION {HASH_GUARD}_release() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        DELETE FROM {HASH_GUARD} h
+        WHERE h.transaction_hash = OLD.transaction_hash AND h.transaction_id = OLD.transaction_id
+          AND NOT EXISTS (
+              SELECT 1 FROM {TABLE} t
+              WHERE t.transaction_hash = OLD.transaction_hash AND t.transaction_id = OLD.transaction_id
+          );
+        RETURN NULL;
+    END $$
+"""
+
+
+def _month(value):
+    return date(value.year, value.month, 1)
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def month_range(start, end):
+    """First days of the months from start to end, inclusive"""
+    months = []
+    month = _month(start)
+    while month <= _month(end):
+        months.append(month)
+        month = _next_month(month)
+    return months
+
+
+def upcoming_months(months_ahead=MONTHS_AHEAD):
+    """The current month and the months_ahead months after it"""
+    months = [_month(datetime.utcnow())]
+    for _ in range(months_ahead):
+        months.append(_next_month(months[-1]))
+    return months
+
+
+def partition_name(month, table=TABLE):
+    return f'{table}_p{month:%Y_%m}'
+
+
+def default_partition(table=TABLE):
+    return f'{table}_default'
+
+
+def is_partitioned(conn, table=TABLE):
+    """Whether table is a partitioned table; always False outside PostgreSQL"""
+    if conn.dialect.name != 'postgresql':
+        return False
+    return bool(conn.execute(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"), {'table': table}
+    ).scalar())
+
+
+def partitions(conn, table=TABLE):
+    """Names of the partitions attached to table"""
+    return set(conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:table)
+    """), {'table': table}).scalars())
+
+
+def table_constraints(conn, table=TABLE):
+    """The indexes and foreign keys of table as it is in the database.
+
+    Read from the database rather than the model, so migrations written
+    against an older schema still copy exactly what is there.
+    """
+    inspector = inspect(conn)
+    return inspector.get_indexes(table), inspector.get_foreign_keys(table)
+
+
+def constraint_statements(table, partitioned, constraints, suffix=''):
+    """Primary key, index and foreign key DDL for a copy of the transactions table.
+
+    constraints is what table_constraints returned for the original. On a
+    partitioned table the primary key and unique indexes must include the
+    partition column, and it is dropped from them again on a plain table.
+    Index names get suffix so they do not collide with the indexes of the
+    table being replaced.
+    """
+    indexes, foreign_keys = constraints
+    key = 'transaction_id, timestamp' if partitioned else 'transaction_id'
+    statements = [f'ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({key})']
+
+    for index in indexes:
+        columns = list(index['column_names'])
+        if index['unique'] and partitioned and PARTITION_COLUMN not in columns:
+            columns.append(PARTITION_COLUMN)
+        elif index['unique'] and not partitioned and len(columns) > 1 and columns[-1] == PARTITION_COLUMN:
+            columns.pop()
+        statements.append(
+            f"CREATE {'UNIQUE ' if index['unique'] else ''}INDEX {index['name']}{suffix} "
+            f"ON {table} ({', '.join(columns)})"
+        )
+
+    for fk in foreign_keys:
+        column, = fk['constrained_columns']
+        referred, = fk['referred_columns']
+        statements.append(
+            f'ALTER TABLE {table} ADD CONSTRAINT {table}_{column}_fkey '
+            f'FOREIGN KEY ({column}) REFERENCES {fk["referred_table"]} ({referred})'
+        )
+    return statements
+
+
+def create_partitions(conn, months, table=TABLE, unlogged=False):
+    """Create any missing partitions for the given months, and the default partition.
+
+    Rows already sitting in the default partition for a new month are moved
+    into it, since PostgreSQL refuses to create a partition that the
+    default partition holds rows for. Returns the partitions created.
+    """
+    existing = partitions(conn, table)
+    persistence = 'UNLOGGED ' if unlogged else ''
+    default = default_partition(table)
+    created = []
+
+    if default not in existing:
+        conn.execute(text(f'CREATE {persistence}TABLE {default} PARTITION OF {table} DEFAULT'))
+        created.append(default)
+
+    for month in sorted(set(months)):
+        name = partition_name(month, table)
+        if name in existing:
+            continue
+
+        bounds = {'lo': month, 'hi': _next_month(month)}
+        in_default = conn.execute(text(
+            f'SELECT EXISTS (SELECT 1 FROM {default} WHERE {PARTITION_COLUMN} >= :lo AND {PARTITION_COLUMN} < :hi)'
+        ), bounds).scalar()
+
+        if in_default:
+            conn.execute(text(f'ALTER TABLE {table} DETACH PARTITION {default}'))
+        conn.execute(text(
+            f"CREATE {persistence}TABLE {name} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{bounds['lo']}') TO ('{bounds['hi']}')"
+        ))
+        if in_default:
+            conn.execute(text(
+                f'WITH moved AS (DELETE FROM {default} WHERE {PARTITION_COLUMN} >= :lo AND {PARTITION_COLUMN} < :hi '
+                f'RETURNING *) INSERT INTO {name} SELECT * FROM moved'
+            ), bounds)
+            conn.execute(text(f'ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT'))
+        created.append(name)
+
+    return created
+
+
+def create_future_partitions(conn, months_ahead=MONTHS_AHEAD, table=TABLE):
+    """Create partitions for the current month and months_ahead months on.
+
+    Months that have rows in the default partition get their own partitions
+    too, which moves those rows out of it. Meant to be run on a schedule.
+    """
+    months = upcoming_months(months_ahead)
+    if default_partition(table) in partitions(conn, table):
+        months += conn.execute(text(
+            f"SELECT DISTINCT date_trunc('month', {PARTITION_COLUMN})::date FROM {default_partition(table)}"
+        )).scalars().all()
+
+    return create_partitions(conn, months, table)
+
+
+def detach_partitions(conn, before, drop=False, table=TABLE):
+    """Detach the monthly partitions that end on or before the given date.
+
+    Detached partitions stay behind as ordinary tables that can be archived,
+    unless drop is set, and their transactions leave the daily rollup, which
+    keeps what it counts of archived ones. Rows in the default partition are
+    not touched. Returns the partitions removed.
+    """
+    if isinstance(before, datetime):
+        before = before.date()
+
+    removed = []
+    for name in sorted(partitions(conn, table)):
+        match = PARTITION_NAME.search(name)
+        if not match:
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if _next_month(month) > before:
+            continue
+
+        if table == TABLE:
+            remove_transactions_where(
+                (Transaction.timestamp >= month) & (Transaction.timestamp < _next_month(month)), conn
+            )
+            remove_transactions_between(month, _next_month(month), conn)
+            # Detaching deletes nothing, so the rows' hashes are released by hand
+            conn.execute(text(
+                f'DELETE FROM {HASH_GUARD} h USING {name} p '
+                f'WHERE h.transaction_hash = p.transaction_hash AND h.transaction_id = p.transaction_id'
+            ))
+        conn.execute(text(f'ALTER TABLE {table} DETACH PARTITION {name}'))
+        if drop:
+            conn.execute(text(f'DROP TABLE {name}'))
+        removed.append(name)
+
+    if removed and table == TABLE:
+        bump_generation(conn)
+    return removed
+
+
+def has_hash_guard(conn):
+    return conn.execute(text('SELECT to_regclass(:guard) IS NOT NULL'), {'guard': HASH_GUARD}).scalar()
+
+
+def build_hash_guard(conn, table=TABLE, guard=HASH_GUARD):
+    """Create the hash guard table holding the hashes of table, with its key built in bulk"""
+    conn.execute(text(f'CREATE TABLE {guard} AS SELECT transaction_hash, transaction_id FROM {table}'))
+    conn.execute(text(f'ALTER TABLE {guard} ADD CONSTRAINT {guard}_pkey PRIMARY KEY (transaction_hash)'))
+    conn.execute(text(f'ALTER TABLE {guard} ALTER COLUMN transaction_id SET NOT NULL'))
+
+
+def install_hash_guard(conn):
+    """Create the triggers keeping the hash guard table in step with transactions"""
+    conn.execute(text(CLAIM_HASH_SQL))
+    conn.execute(text(RELEASE_HASH_SQL))
+    conn.execute(text(
+        f'CREATE TRIGGER {HASH_GUARD}_claim BEFORE INSERT ON {TABLE} '
+        f'FOR EACH ROW EXECUTE FUNCTION {HASH_GUARD}_claim()'
+    ))
+    conn.execute(text(
+        f'CREATE TRIGGER {HASH_GUARD}_release AFTER DELETE ON {TABLE} '
+        f'FOR EACH ROW EXECUTE FUNCTION {HASH_GUARD}_release()'
+    ))
+
+
+def drop_hash_guard(conn):
+    """Drop the hash guard table and its triggers"""
+    conn.execute(text(f'DROP TRIGGER IF EXISTS {HASH_GUARD}_claim ON {TABLE}'))
+    conn.execute(text(f'DROP TRIGGER IF EXISTS {HASH_GUARD}_release ON {TABLE}'))
+    conn.execute(text(f'DROP FUNCTION IF EXISTS {HASH_GUARD}_claim()'))
+    conn.execute(text(f'DROP FUNCTION IF EXISTS {HASH_GUARD}_release()'))
+    conn.execute(text(f'DROP TABLE IF EXISTS {HASH_GUARD}'))
+
+
+def _rebuild(conn, partitioned, months_ahead=MONTHS_AHEAD, guard=True):
+    """Copy the transactions table into a partitioned or plain table and swap it in"""
+    old = f'{TABLE}_old'
+    sequence = conn.execute(text(f"SELECT pg_get_serial_sequence('{TABLE}', 'transaction_id')")).scalar()
+    lo, hi = conn.execute(text(f'SELECT MIN({PARTITION_COLUMN}), MAX({PARTITION_COLUMN}) FROM {TABLE}')).one()
+    constraints = table_constraints(conn)
+
+    drop_hash_guard(conn)
+    conn.execute(text(f'ALTER TABLE {TABLE} RENAME TO {old}'))
+    conn.execute(text(f'ALTER TABLE {old} RENAME CONSTRAINT {TABLE}_pkey TO {old}_pkey'))
+    indexes, _ = constraints
+    for index in indexes:
+        conn.execute(text(f"DROP INDEX {index['name']}"))
+
+    partition_by = f' PARTITION BY RANGE ({PARTITION_COLUMN})' if partitioned else ''
+    conn.execute(text(f'CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS){partition_by}'))
+    if partitioned:
+        months = month_range(lo, hi) if lo else []
+        create_partitions(conn, months + upcoming_months(months_ahead))
+
+    # Load before building the indexes so they are built in bulk
+    conn.execute(text(f'INSERT INTO {TABLE} SELECT * FROM {old}'))
+    for statement in constraint_statements(TABLE, partitioned, constraints):
+        conn.execute(text(statement))
+    if partitioned and guard:
+        build_hash_guard(conn)
+        install_hash_guard(conn)
+
+    conn.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY {TABLE}.transaction_id'))
+    conn.execute(text(f'DROP TABLE {old}'))
+
+
+def partition_transactions(conn, months_ahead=MONTHS_AHEAD, guard=True):
+    """Convert transactions into a table range-partitioned by month on timestamp.
+
+    Partitions are created for every month with data up to months_ahead
+    months from now, plus a default partition for rows outside them. The
+    hash guard table keeps transaction hashes unique across partitions,
+    unless guard is False. PostgreSQL only; returns False when there is nothing to do.
+    """
+    if conn.dialect.name != 'postgresql' or is_partitioned(conn):
+        return False
+    _rebuild(conn, partitioned=True, months_ahead=months_ahead, guard=guard)
+    return True
+
+
+def unpartition_transactions(conn):
+    """Turn a partitioned transactions table back into a single table"""
+    if not is_partitioned(conn):
+        return False
+    _rebuild(conn, partitioned=False)
+    return True
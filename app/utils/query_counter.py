@@ -0,0 +1,60 @@
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _count(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and 'sql_queries' in g:
+        g.sql_queries += 1
+
+
+def install(app, engine):
+    """Count the statements each request runs on engine.
+
+    In debug and testing the count goes out in an X-SQL-Queries header,
+    and in testing a request running more than its budget raises
+    QueryBudgetExceeded.
+    """
+    event.listen(engine, 'before_cursor_execute', _count)
+    app.before_request(start)
+    app.after_request(_report)
+
+
+def start():
+    """Count the statements of the current app context from now on"""
+    g.sql_queries = 0
+
+
+def count():
+    return g.get('sql_queries', 0)
+
+
+def add(queries):
+    """Charge statements run on the request's behalf in other app contexts to it"""
+    if 'sql_queries' in g:
+        g.sql_queries += queries
+
+
+def query_budget(queries):
+    """Statements a view may run in testing, in place of QUERY_BUDGET"""
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
+
+
+def _report(response):
+    if 'sql_queries' not in g or not (current_app.debug or current_app.testing):
+        return response
+    response.headers['X-SQL-Queries'] = str(g.sql_queries)
+    if current_app.testing:
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', current_app.config['QUERY_BUDGET'])
+        if budget and g.sql_queries > budget:
+            raise QueryBudgetExceeded(
+                f'{request.method} {request.full_path} ran {g.sql_queries} SQL statements, over its budget of {budget}'
+            )
+    return response
@@ -0,0 +1,264 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+from urllib.parse import urlencode
+from flask import current_app, make_response, request
+from ..models.models import db, Watermark
+from .bulk import _insert
+
+logger = logging.getLogger(__name__)
+
+# What cached responses depend on and writes invalidate: one tag per table
+TAGS = ('protocols', 'contracts', 'users', 'transactions', 'market_data')
+
+# Watermark counting the invalidations of a tag, which is how other processes
+# (more workers, the CLI) learn about writes they did not make
+WATERMARK_PREFIX = 'cache:'
+
+# Larger responses are served but not kept
+MAX_ENTRY_BYTES = 1 << 20
+
+# How long a concurrent miss waits for the request already computing the response
+FLIGHT_WAIT_SECONDS = 60
+
+
+def _watermark(tag):
+    return WATERMARK_PREFIX + tag
+
+
+def _check_tags(tags):
+    unknown = set(tags) - set(TAGS)
+    if unknown:
+        raise ValueError(f"Unknown cache tags: {', '.join(sorted(unknown))}")
+
+
+def _bump(tags):
+    """Count an invalidation of each tag in the watermarks; returns {tag: new count}"""
+    table = Watermark.__table__
+    versions = {}
+    with db.engine.begin() as conn:
+        # A fixed order keeps concurrent writers from deadlocking on the upserts
+        for tag in sorted(tags):
+            stmt = _insert(table).values(name=_watermark(tag), value=1, updated_at=datetime.utcnow())
+            versions[tag] = conn.execute(stmt.on_conflict_do_update(
+                index_elements=['name'],
+                set_={'value': table.c.value + 1, 'updated_at': stmt.excluded.updated_at}
+            ).returning(table.c.value)).scalar()
+    return versions
+
+
+def invalidate(*tags):
+    """Drop the cached responses depending on any of tags, in this process and the others"""
+    _check_tags(tags)
+    versions = _bump(tags)
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        cache.drop(tags, versions)
+
+
+class _Entry:
+    __slots__ = ('body', 'etag', 'tags', 'fresh_until', 'stale_until')
+
+    def __init__(self, body, etag, tags, fresh_until, stale_until):
+        self.body = body
+        self.etag = etag
+        self.tags = tags
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class ResponseCache:
+    """In-process cache of JSON responses keyed by path and sorted query arguments.
+
+    Entries are fresh for ttl seconds and then served stale for up to
+    stale_seconds more while one background request recomputes them.
+    Concurrent misses on a key wait for the first one instead of running
+    the same query. Entries are tagged with the tables they read and dropped
+    when those are written here, or, checked every check_seconds, when the
+    tag watermarks show another process wrote them.
+    """
+
+    def __init__(self, app, ttl, stale_seconds, max_entries, check_seconds):
+        self.app = app
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self.check_seconds = check_seconds
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # key -> Event set when the request computing it is done
+        self.flights = {}
+        # Bumped on every drop, so results computed across one are not kept
+        self.generations = dict.fromkeys(TAGS, 0)
+        # Tag watermarks as last read
+        self.watermarks = None
+        self.checked_at = 0
+        self.stats = dict.fromkeys(['hits', 'stale_hits', 'misses', 'shared_misses', 'evictions', 'drops'], 0)
+
+    def status(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries), max_entries=self.max_entries,
+                        ttl=self.ttl, stale_seconds=self.stale_seconds)
+
+    def drop(self, tags, watermarks=None):
+        """Drop the entries depending on any of tags"""
+        with self.lock:
+            for tag in tags:
+                self.generations[tag] += 1
+            if watermarks and self.watermarks is not None:
+                self.watermarks.update(watermarks)
+            stale = [key for key, entry in self.entries.items() if entry.tags & set(tags)]
+            for key in stale:
+                del self.entries[key]
+            self.stats['drops'] += len(stale)
+
+    def _check_watermarks(self):
+        """Drop what other processes invalidated since the last check"""
+        now = time.monotonic()
+        if now - self.checked_at < self.check_seconds:
+            return
+        self.checked_at = now
+        with db.engine.connect() as conn:
+            rows = conn.execute(db.select(Watermark.name, Watermark.value).where(
+                Watermark.name.in_([_watermark(tag) for tag in TAGS])
+            )).all()
+        watermarks = dict.fromkeys(TAGS, 0)
+        watermarks.update({name[len(WATERMARK_PREFIX):]: value for name, value in rows})
+        if self.watermarks is None:
+            self.watermarks = watermarks
+            return
+        changed = [tag for tag in TAGS if watermarks[tag] != self.watermarks[tag]]
+        if changed:
+            self.drop(changed, watermarks)
+
+    def _lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry.stale_until:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, entry, generations):
+        with self.lock:
+            if any(self.generations[tag] != generation for tag, generation in generations.items()):
+                return
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def _compute(self, view, view_args, key, tags):
+        """Run the view and keep a successful response; returns (response, entry or None)"""
+        with self.lock:
+            generations = {tag: self.generations[tag] for tag in tags}
+        response = make_response(view(**view_args))
+        if response.status_code != 200 or response.direct_passthrough:
+            return response, None
+        body = response.get_data()
+        now = time.monotonic()
+        entry = _Entry(body, hashlib.blake2b(body, digest_size=16).hexdigest(), tags,
+                       now + self.ttl, now + self.ttl + self.stale_seconds)
+        if len(body) <= MAX_ENTRY_BYTES:
+            self._store(key, entry, generations)
+        return response, entry
+
+    def _revalidate(self, view, view_args, key, tags, path, query):
+        try:
+            with self.app.test_request_context(path, query_string=query):
+                self._compute(view, view_args, key, tags)
+        except Exception:
+            logger.exception('Revalidating %s?%s failed', path, query)
+        finally:
+            with self.lock:
+                self.flights.pop(key).set()
+
+    def _respond(self, entry, state):
+        response = current_app.response_class(entry.body, mimetype='application/json')
+        response.set_etag(entry.etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Cache'] = state
+        return response.make_conditional(request)
+
+    def respond(self, view, view_args, tags):
+        """The view's response for the current request, from the cache when possible"""
+        self._check_watermarks()
+        query = urlencode(sorted(request.args.items(multi=True)))
+        key = (request.path, query)
+
+        entry = self._lookup(key)
+        if entry is not None:
+            if time.monotonic() < entry.fresh_until:
+                self.stats['hits'] += 1
+                return self._respond(entry, 'hit')
+            self.stats['stale_hits'] += 1
+            with self.lock:
+                refresh = key not in self.flights
+                if refresh:
+                    self.flights[key] = threading.Event()
+            if refresh:
+                threading.Thread(
+                    target=self._revalidate, args=(view, view_args, key, tags, request.path, query),
+                    name='response-cache', daemon=True
+                ).start()
+            return self._respond(entry, 'stale')
+
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                self.flights[key] = threading.Event()
+        if flight is not None:
+            # Someone else is computing it: wait and take theirs
+            flight.wait(FLIGHT_WAIT_SECONDS)
+            entry = self._lookup(key)
+            if entry is not None:
+                self.stats['shared_misses'] += 1
+                return self._respond(entry, 'hit')
+            response, entry = self._compute(view, view_args, key, tags)
+        else:
+            try:
+                response, entry = self._compute(view, view_args, key, tags)
+            finally:
+                with self.lock:
+                    self.flights.pop(key).set()
+        self.stats['misses'] += 1
+        return self._respond(entry, 'miss') if entry is not None else response
+
+
+def cached(*tags):
+    """Serve a GET view from the response cache, dropping it when any of tags is written"""
+    _check_tags(tags)
+    tags = frozenset(tags)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            cache = current_app.extensions.get('response_cache')
+            if cache is None:
+                return view(**view_args)
+            return cache.respond(view, view_args, tags)
+        return wrapper
+    return decorator
+
+
+def invalidates(*tags):
+    """Invalidate tags once a write view has succeeded"""
+    _check_tags(tags)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            response = make_response(view(**view_args))
+            if response.status_code < 400:
+                invalidate(*tags)
+            return response
+        return wrapper
+    return decorator
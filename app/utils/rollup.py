@@ -0,0 +1,187 @@
+from datetime import datetime
+from sqlalchemy import func, tuple_, type_coerce
+from ..models.models import db, Transaction, TransactionDailyRollup, Watermark
+from .bulk import _insert
+
+# Transaction ids aggregated per statement
+ROLLUP_CHUNK = 5_000
+
+# Bucket for transactions without a status, since status is part of the key
+UNKNOWN_STATUS = 'unknown'
+
+# Bumped whenever transactions are deleted or changed in place, so in-memory
+# copies (app/utils/columnar.py) know to reload; appends never touch it
+GENERATION_WATERMARK = 'transactions_generation'
+
+KEY = ['date', 'contract_id', 'protocol_id', 'status']
+MEASURES = [
+    'tx_count', 'total_value', 'total_fee', 'fee_count',
+    'total_gas_used', 'gas_used_count', 'total_gas_price', 'gas_price_count'
+]
+
+
+def _key_columns():
+    # date() is text on SQLite; coerce it so the keys come back as dates
+    return [
+        type_coerce(func.date(Transaction.timestamp), db.Date), Transaction.contract_id, Transaction.protocol_id,
+        func.coalesce(Transaction.status, UNKNOWN_STATUS)
+    ]
+
+
+def _amount_sum(column):
+    # The rollup keeps plain numeric amounts, not the transactions' scaled units
+    return func.coalesce(column.type.unscaled(column.type.sum_units(column)), 0)
+
+
+def _aggregate(where=None, sign=1):
+    """SELECT of the rollup rows for the transactions matching where, negated when sign is -1"""
+    key = _key_columns()
+    select = db.select(
+        *key,
+        func.count() * sign,
+        _amount_sum(Transaction.value) * sign,
+        _amount_sum(Transaction.transaction_fee) * sign,
+        func.count(Transaction.transaction_fee) * sign,
+        func.coalesce(func.sum(Transaction.gas_used), 0) * sign,
+        func.count(Transaction.gas_used) * sign,
+        _amount_sum(Transaction.gas_price) * sign,
+        func.count(Transaction.gas_price) * sign
+    )
+    if where is not None:
+        select = select.where(where)
+    # A fixed key order keeps concurrent loaders from deadlocking on the upserts
+    return select.group_by(*key).order_by(*key)
+
+
+def bump_generation(conn=None):
+    """Record that existing transactions changed, in the caller's transaction"""
+    table = Watermark.__table__
+    stmt = _insert(table).values(name=GENERATION_WATERMARK, value=1, updated_at=datetime.utcnow())
+    (conn or db.session).execute(stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'value': table.c.value + 1, 'updated_at': stmt.excluded.updated_at}
+    ))
+
+
+def count_transactions(contract_id=None, status=None):
+    """Transactions, archived ones included, with the given contract and status, from the rollup"""
+    rollup = TransactionDailyRollup
+    query = db.session.query(func.coalesce(func.sum(rollup.tx_count), 0))
+    if contract_id:
+        query = query.filter(rollup.contract_id == contract_id)
+    if status:
+        query = query.filter(rollup.status == status)
+    return int(query.scalar())
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), ROLLUP_CHUNK):
+        yield ids[start:start + ROLLUP_CHUNK]
+
+
+def _upsert(select, conn=None):
+    """Add the rows of a _aggregate select to the rollup"""
+    table = TransactionDailyRollup.__table__
+    stmt = _insert(table).from_select(KEY + MEASURES, select)
+    (conn or db.session).execute(stmt.on_conflict_do_update(
+        index_elements=KEY,
+        set_={name: table.c[name] + stmt.excluded[name] for name in MEASURES}
+    ))
+
+
+def _apply(ids, sign):
+    for chunk in _chunks(ids):
+        _upsert(_aggregate(Transaction.transaction_id.in_(chunk), sign))
+
+
+def add_transactions(ids):
+    """Add the given, already inserted, transactions to the rollup.
+
+    Runs in the session's transaction, so the rollup commits or rolls back
+    with the rows it counts.
+    """
+    _apply(ids, 1)
+
+
+def remove_transactions(ids):
+    """Take the given transactions out of the rollup before they are deleted or changed"""
+    ids = list(ids)
+    rollup = TransactionDailyRollup
+    keys = []
+    for chunk in _chunks(ids):
+        keys += db.session.execute(
+            db.select(*_key_columns()).distinct()
+            .where(Transaction.transaction_id.in_(chunk))
+        ).all()
+
+    _apply(ids, -1)
+    # Drop the buckets that no longer count anything
+    for chunk in _chunks(keys):
+        db.session.execute(db.delete(rollup).where(
+            tuple_(rollup.date, rollup.contract_id, rollup.protocol_id, rollup.status).in_(chunk),
+            rollup.tx_count <= 0
+        ))
+    bump_generation()
+
+
+def remove_transactions_between(start, end, conn):
+    """Take the transactions dated from start to before end out of the rollup on conn.
+
+    For transactions leaving the table without being archived, such as
+    with a detached partition. Days before the archive horizon keep what
+    they count of archived transactions. The caller bumps the generation.
+    """
+    table = TransactionDailyRollup.__table__
+    _upsert(_aggregate((Transaction.timestamp >= start) & (Transaction.timestamp < end), -1), conn)
+    conn.execute(db.delete(table).where(table.c.date >= start, table.c.date < end, table.c.tx_count <= 0))
+
+
+def move_contract(contract_id, protocol_id):
+    """Move a contract's rollup rows to the protocol it now belongs to"""
+    rollup = TransactionDailyRollup
+    db.session.execute(
+        db.update(rollup).where(rollup.contract_id == contract_id).values(protocol_id=protocol_id)
+    )
+    bump_generation()
+
+
+def remove_contract(contract_id):
+    """Drop a contract's rollup rows, archived days included, before it is deleted.
+
+    Its foreign key does the same on PostgreSQL, but SQLite does not enforce
+    foreign keys.
+    """
+    rollup = TransactionDailyRollup
+    db.session.execute(db.delete(rollup).where(rollup.contract_id == contract_id))
+    bump_generation()
+
+
+def remove_protocol(protocol_id):
+    """Drop the rollup rows of a protocol's contracts before it is deleted; see remove_contract"""
+    rollup = TransactionDailyRollup
+    db.session.execute(db.delete(rollup).where(rollup.protocol_id == protocol_id))
+    bump_generation()
+
+
+def rebuild_rollup(conn):
+    """Recompute the rollup from the transactions table on conn.
+
+    Days before the archive horizon keep their rows, since their
+    transactions have moved to the archive. Readers keep seeing the old
+    rollup until the caller commits. Returns the number of rollup rows
+    written.
+    """
+    # archive imports this module for bump_generation
+    from .archive import archived_before
+
+    table = TransactionDailyRollup.__table__
+    horizon = archived_before(conn)
+    delete = db.delete(table)
+    select = _aggregate()
+    if horizon:
+        delete = delete.where(table.c.date >= horizon)
+        select = _aggregate(Transaction.timestamp >= datetime.combine(horizon, datetime.min.time()))
+    conn.execute(delete)
+    bump_generation(conn)
+    return conn.execute(db.insert(table).from_select(KEY + MEASURES, select)).rowcount
@@ -0,0 +1,199 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Statements kept in the in-memory summary, least recently seen dropped first
+MAX_STATEMENTS = 200
+
+# EXPLAIN samples kept per statement
+MAX_SAMPLES = 3
+
+# Only statements that cannot write are re-run under EXPLAIN ANALYZE
+EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+WRITES = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE|CREATE|DROP|ALTER|TRUNCATE|LOCK|FOR\s+UPDATE|FOR\s+SHARE)\b',
+                    re.IGNORECASE)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w$])-?\d+(?:\.\d+)?(?![\w$])')
+_PARAM = re.compile(r'%\(\w+\)s|%s|\?|(?<!:):\w+')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    """The statement with literals and bind parameters replaced by ?, IN lists collapsed and whitespace squeezed"""
+    sql = _STRING.sub('?', statement)
+    sql = _PARAM.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def _type_name(value):
+    if value is None:
+        return 'null'
+    if isinstance(value, (list, tuple)):
+        return f'{type(value).__name__}[{len(value)}]'
+    return type(value).__name__
+
+
+def params_shape(parameters, executemany=False):
+    """Names and types of the bind parameters, never their values"""
+    if executemany:
+        rows = list(parameters)
+        return {'rows': len(rows), 'row': params_shape(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {name: _type_name(value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_type_name(value) for value in parameters]
+    return _type_name(parameters)
+
+
+class SlowQueryRecorder:
+    """Record the statements an engine runs that take longer than a threshold.
+
+    Each slow statement is logged as one JSON line with its normalized SQL,
+    the shape of its parameters and its duration, and appended to log_path
+    when one is given. The first time a SELECT is seen slow, and then at
+    most every explain_interval seconds, it is run again under EXPLAIN
+    (ANALYZE, BUFFERS) inside a savepoint and the plan is kept as a sample.
+    summary() aggregates what this process has seen.
+    """
+
+    def __init__(self, threshold_ms, log_path=None, explain=True, explain_interval=300):
+        self.threshold_ms = threshold_ms
+        self.log_path = log_path
+        self.explain = explain
+        self.explain_interval = explain_interval
+        self.statements = OrderedDict()
+        self.lock = threading.Lock()
+
+    def install(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - conn.info['query_start'].pop()) * 1000
+        if duration_ms >= self.threshold_ms:
+            self.record(conn, cursor, statement, parameters, executemany, duration_ms)
+
+    def _should_explain(self, entry, statement, executemany):
+        if not self.explain or executemany:
+            return False
+        if not EXPLAINABLE.match(statement) or WRITES.search(statement):
+            return False
+        return time.time() - entry['last_explained'] >= self.explain_interval
+
+    def _explain(self, conn, cursor, statement, parameters):
+        """Plan of the statement, or None if it could not be explained"""
+        dialect = conn.dialect.name
+        if dialect not in ('postgresql', 'sqlite'):
+            return None
+
+        explain_cursor = cursor.connection.cursor()
+        try:
+            if dialect == 'sqlite':
+                # Only plans the statement, nothing is run
+                explain_cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+                return '\n'.join(str(row[-1]) for row in explain_cursor.fetchall())
+
+            # EXPLAIN ANALYZE runs the statement again; the savepoint keeps
+            # a failure from aborting the caller's transaction
+            explain_cursor.execute('SAVEPOINT slow_query_explain')
+            try:
+                explain_cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters)
+                return '\n'.join(row[0] for row in explain_cursor.fetchall())
+            finally:
+                explain_cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        except Exception as e:
+            logger.debug('Could not explain slow query: %s', e)
+            return None
+        finally:
+            explain_cursor.close()
+
+    def record(self, conn, cursor, statement, parameters, executemany, duration_ms):
+        sql = normalize_sql(statement)
+        shape = params_shape(parameters, executemany)
+
+        with self.lock:
+            entry = self.statements.pop(sql, None) or {
+                'sql': sql, 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'params_shape': shape, 'last_explained': 0.0, 'samples': deque(maxlen=MAX_SAMPLES)
+            }
+            self.statements[sql] = entry
+            while len(self.statements) > MAX_STATEMENTS:
+                self.statements.popitem(last=False)
+            entry['calls'] += 1
+            entry['total_ms'] += duration_ms
+            entry['max_ms'] = max(entry['max_ms'], duration_ms)
+            explain = self._should_explain(entry, statement, executemany)
+            if explain:
+                entry['last_explained'] = time.time()
+
+        plan = self._explain(conn, cursor, statement, parameters) if explain else None
+        record = {
+            'at': datetime.utcnow().isoformat(),
+            'duration_ms': round(duration_ms, 2),
+            'sql': sql,
+            'params_shape': shape,
+            'plan': plan
+        }
+        if plan:
+            with self.lock:
+                entry['samples'].append(record)
+
+        line = json.dumps(record)
+        logger.warning('Slow query: %s', line)
+        if self.log_path:
+            with self.lock, open(self.log_path, 'a') as f:
+                f.write(line + '\n')
+
+    def summary(self, limit=20):
+        """The statements seen so far, slowest in total first"""
+        with self.lock:
+            entries = [
+                {
+                    'sql': entry['sql'],
+                    'calls': entry['calls'],
+                    'total_ms': round(entry['total_ms'], 2),
+                    'mean_ms': round(entry['total_ms'] / entry['calls'], 2),
+                    'max_ms': round(entry['max_ms'], 2),
+                    'params_shape': entry['params_shape'],
+                    'samples': list(entry['samples'])
+                }
+                for entry in self.statements.values()
+            ]
+        return sorted(entries, key=lambda e: e['total_ms'], reverse=True)[:limit]
+
+
+def summarize_log(log_path, limit=20):
+    """Aggregate a slow query log file by normalized statement, slowest in total first"""
+    statements = {}
+    with open(log_path) as f:
+        for line in f:
+            record = json.loads(line)
+            entry = statements.setdefault(record['sql'], {
+                'sql': record['sql'], 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'params_shape': record['params_shape'], 'plan': None
+            })
+            entry['calls'] += 1
+            entry['total_ms'] += record['duration_ms']
+            entry['max_ms'] = max(entry['max_ms'], record['duration_ms'])
+            if record.get('plan'):
+                entry['plan'] = record['plan']
+
+    for entry in statements.values():
+        entry['total_ms'] = round(entry['total_ms'], 2)
+        entry['mean_ms'] = round(entry['total_ms'] / entry['calls'], 2)
+    return sorted(statements.values(), key=lambda e: e['total_ms'], reverse=True)[:limit]
@@ -0,0 +1,200 @@
+import os
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+BLOCKCHAINS = ['ethereum', 'polygon', 'arbitrum', 'optimism', 'bsc', 'avalanche', 'base', 'solana']
+PROTOCOL_TYPES = ['DEX', 'Lending', 'Yield Farming', 'Stablecoin', 'Derivatives', 'Bridge']
+STATUSES = ['success', 'failed', 'pending']
+STATUS_WEIGHTS = [0.97, 0.025, 0.005]
+
+SECONDS_PER_BLOCK = 12
+
+# Two ASCII hex digits for every byte value
+_HEX_DIGITS = np.array([f'{i:02x}' for i in range(256)], dtype='S2').view(np.uint8).reshape(256, 2)
+
+
+def _hex_chars(rng, n, nbytes):
+    """Random 0x-prefixed hex strings as an (n, 2 + 2 * nbytes) uint8 matrix"""
+    raw = rng.integers(0, 256, size=(n, nbytes), dtype=np.uint8)
+    chars = np.empty((n, 2 + 2 * nbytes), dtype=np.uint8)
+    chars[:, 0] = ord('0')
+    chars[:, 1] = ord('x')
+    chars[:, 2:] = _HEX_DIGITS[raw].reshape(n, 2 * nbytes)
+    return chars
+
+
+def _string_array(chars, valid=None):
+    """Build an Arrow string array straight from a fixed-width uint8 matrix"""
+    n, width = chars.shape
+    offsets = np.arange(n + 1, dtype=np.int32) * width
+    bitmap = pa.py_buffer(np.packbits(valid, bitorder='little')) if valid is not None else None
+    return pa.StringArray.from_buffers(
+        n, pa.py_buffer(offsets), pa.py_buffer(np.ascontiguousarray(chars)), bitmap
+    )
+
+
+def _zipf_sampler(rng, n, a):
+    """Draw ids in [0, n) with a bounded Zipf distribution over a shuffled ranking"""
+    weights = 1.0 / np.arange(1, n + 1) ** a
+    cdf = np.cumsum(weights)
+    cdf /= cdf[-1]
+    ranking = rng.permutation(n)
+
+    def sample(size):
+        return ranking[np.minimum(np.searchsorted(cdf, rng.random(size)), n - 1)]
+
+    return sample
+
+
+def generate_dataset(out_dir='data', transactions=1_000_000, users=100_000, contracts=2_000,
+                     protocols=50, days=90, zipf_a=1.1, seed=42, row_group_size=1_000_000,
+                     end_date=None):
+    """Write contracts, users, transactions and market Parquet files for load testing.
+
+    The files use the schema the loaders in data_loader.py expect. Senders,
+    receivers and contracts follow a Zipf distribution, transactions are
+    written in timestamp order one row group at a time, and the user and
+    market files are aggregated from the generated transactions. History
+    ends on end_date, today by default; the same seed and end_date always
+    produce the same data.
+    """
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    end = end_date or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    start_s = int((start - datetime(1970, 1, 1)).total_seconds())
+    span_s = days * 86400
+
+    # Protocols and contracts
+    protocol_names = np.array([f'Protocol {i:05d}' for i in range(protocols)], dtype=object)
+    protocol_types = np.array(PROTOCOL_TYPES, dtype=object)[rng.integers(0, len(PROTOCOL_TYPES), protocols)]
+    contract_protocol = _zipf_sampler(rng, protocols, zipf_a)(contracts)
+    contract_chars = _hex_chars(rng, contracts, 20)
+
+    pq.write_table(pa.table({
+        'protocol_name': pa.array(protocol_names[contract_protocol], pa.string()),
+        'protocol_symbol': pa.array([f'P{i:05d}' for i in contract_protocol], pa.string()),
+        'type': pa.array(protocol_types[contract_protocol], pa.string()),
+        'description': pa.array([f'Synthetic protocol {i}' for i in contract_protocol], pa.string()),
+        'website_url': pa.array([f'https://protocol{i}.example' for i in contract_protocol], pa.string()),
+        'contract_address': _string_array(contract_chars),
+        'blockchain': pa.array(
+            np.array(BLOCKCHAINS, dtype=object)[rng.integers(0, len(BLOCKCHAINS), contracts)], pa.string()
+        ),
+    }), os.path.join(out_dir, 'contracts.parquet'))
+
+    # Transactions, one time slice per row group so the file is sorted by timestamp
+    user_chars = _hex_chars(rng, users, 20)
+    sample_user = _zipf_sampler(rng, users, zipf_a)
+    sample_contract = _zipf_sampler(rng, contracts, zipf_a)
+
+    tx_count = np.zeros(users, dtype=np.int64)
+    tx_volume = np.zeros(users, dtype=np.float64)
+    first_seen = np.full(users, np.iinfo(np.int64).max, dtype=np.int64)
+    last_seen = np.full(users, np.iinfo(np.int64).min, dtype=np.int64)
+
+    cells = protocols * days
+    market_count = np.zeros(cells, dtype=np.int64)
+    market_volume = np.zeros(cells, dtype=np.float64)
+    market_fees = np.zeros(cells, dtype=np.float64)
+    market_users = np.zeros(cells, dtype=np.int64)
+
+    writer = None
+    written = 0
+    while written < transactions:
+        n = min(row_group_size, transactions - written)
+        slice_start = start_s + span_s * written // transactions
+        slice_end = start_s + span_s * (written + n) // transactions
+
+        seconds = np.sort(rng.integers(slice_start, max(slice_end, slice_start + 1), n))
+        senders = sample_user(n)
+        receivers = sample_user(n)
+        has_receiver = rng.random(n) > 0.05
+        contract_idx = sample_contract(n)
+
+        value = rng.lognormal(mean=0.0, sigma=2.0, size=n)
+        gas_used = rng.integers(21_000, 500_000, n)
+        gas_price = rng.lognormal(mean=np.log(30), sigma=0.5, size=n)  # gwei
+        fee = gas_used * gas_price * 1e-9
+        status = np.array(STATUSES, dtype=object)[rng.choice(len(STATUSES), n, p=STATUS_WEIGHTS)]
+
+        batch = pa.table({
+            'transaction_hash': _string_array(_hex_chars(rng, n, 32)),
+            'contract_address': _string_array(contract_chars[contract_idx]),
+            'from_address': _string_array(user_chars[senders]),
+            'to_address': _string_array(user_chars[receivers], valid=has_receiver),
+            'value': value,
+            'gas_used': gas_used,
+            'gas_price': gas_price,
+            'transaction_fee': fee,
+            'timestamp': pa.array(seconds * 1_000_000, pa.timestamp('us')),
+            'block_number': (seconds - start_s) // SECONDS_PER_BLOCK + 15_000_000,
+            'status': pa.array(status, pa.string()),
+        })
+        if writer is None:
+            writer = pq.ParquetWriter(os.path.join(out_dir, 'transactions.parquet'), batch.schema)
+        writer.write_table(batch, row_group_size=row_group_size)
+
+        # Per-user totals, counting a distinct receiver as well as the sender
+        participants = np.concatenate([senders, receivers[has_receiver & (receivers != senders)]])
+        times = np.concatenate([seconds, seconds[has_receiver & (receivers != senders)]])
+        amounts = np.concatenate([value, value[has_receiver & (receivers != senders)]])
+        tx_count += np.bincount(participants, minlength=users)
+        tx_volume += np.bincount(participants, weights=amounts, minlength=users)
+        np.minimum.at(first_seen, participants, times)
+        np.maximum.at(last_seen, participants, times)
+
+        # Per (protocol, day) market cells; unique users are exact within a row group
+        cell = contract_protocol[contract_idx] * days + np.minimum((seconds - start_s) // 86400, days - 1)
+        market_count += np.bincount(cell, minlength=cells)
+        market_volume += np.bincount(cell, weights=value, minlength=cells)
+        market_fees += np.bincount(cell, weights=fee, minlength=cells)
+        pairs = np.unique(cell.astype(np.int64) * users + senders)
+        market_users += np.bincount(pairs // users, minlength=cells)
+
+        written += n
+
+    if writer is not None:
+        writer.close()
+
+    # Users
+    active = tx_count > 0
+    user_type = np.where(tx_volume > np.quantile(tx_volume, 0.99), 'whale',
+                         np.where(tx_volume > np.quantile(tx_volume, 0.5), 'regular', 'small'))
+    pq.write_table(pa.table({
+        'user_address': _string_array(user_chars),
+        'total_transactions': tx_count,
+        'total_volume': tx_volume,
+        'first_transaction_date': pa.array(np.where(active, first_seen, 0) * 1_000_000,
+                                           pa.timestamp('us'), mask=~active),
+        'last_transaction_date': pa.array(np.where(active, last_seen, 0) * 1_000_000,
+                                          pa.timestamp('us'), mask=~active),
+        'user_type': pa.array(user_type.astype(object), pa.string()),
+    }), os.path.join(out_dir, 'users.parquet'), row_group_size=row_group_size)
+
+    # Market data
+    has_activity = market_count > 0
+    protocol_idx, day_idx = np.divmod(np.arange(cells)[has_activity], days)
+    dates = np.datetime64(start.date()) + day_idx.astype('timedelta64[D]')
+    pq.write_table(pa.table({
+        'protocol_name': pa.array(protocol_names[protocol_idx], pa.string()),
+        'date': pa.array(dates, pa.date32()),
+        'total_volume': market_volume[has_activity],
+        'transaction_count': market_count[has_activity],
+        'unique_users': market_users[has_activity],
+        'avg_transaction_value': market_volume[has_activity] / market_count[has_activity],
+        'total_fees': market_fees[has_activity],
+    }), os.path.join(out_dir, 'market.parquet'))
+
+    return {
+        'contracts': contracts,
+        'users': users,
+        'transactions': written,
+        'market': int(has_activity.sum()),
+        'seconds': round(time.perf_counter() - started, 2)
+    }
@@ -0,0 +1,45 @@
+from datetime import timedelta
+import pandas as pd
+from sqlalchemy import func
+from ..models.models import db, MarketData
+
+# market_data columns a series can be drawn from
+METRICS = ('total_volume', 'transaction_count', 'unique_users', 'avg_transaction_value', 'total_fees')
+
+
+def date_range(start_date, end_date):
+    """Every date from start_date to end_date, both included"""
+    return [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+
+def pivot(rows, dates, series=None):
+    """Pivot (date, series, value) rows into a frame of dates by series.
+
+    Every date gets a row, and a cell without rows is 0. series fixes the
+    columns and their order; by default they are the series in rows,
+    largest total first.
+    """
+    frame = pd.DataFrame(rows, columns=['date', 'series', 'value'])
+    frame['value'] = frame['value'].astype(float)
+    table = frame.pivot_table(index='date', columns='series', values='value', aggfunc='sum', fill_value=0)
+    if series is None:
+        series = table.sum().sort_values(ascending=False, kind='stable').index
+    return table.reindex(index=dates, columns=series, fill_value=0).astype(float)
+
+
+def market_series(metric, start_date, end_date, protocol_ids=None, limit=None):
+    """Daily metric per protocol from market_data, read in one grouped query.
+
+    Returns a frame of the dates from start_date to end_date by
+    protocol_id: the given protocol_ids in their order, or else every
+    protocol with data in the period, largest total first. limit keeps
+    the first limit of those.
+    """
+    column = getattr(MarketData, metric)
+    query = db.session.query(MarketData.date, MarketData.protocol_id, func.sum(column))\
+        .filter(MarketData.date >= start_date, MarketData.date <= end_date)
+    if protocol_ids is not None:
+        query = query.filter(MarketData.protocol_id.in_(protocol_ids))
+    rows = query.group_by(MarketData.date, MarketData.protocol_id).all()
+    frame = pivot(rows, date_range(start_date, end_date), protocol_ids)
+    return frame if limit is None else frame.iloc[:, :limit]
@@ -0,0 +1,189 @@
+from sqlalchemy import text
+from ..models.models import db, Transaction, Watermark
+from ..models.types import from_scaled_sql
+from . import archive, counters
+from .rollup import GENERATION_WATERMARK
+
+# Highest transaction id the last run aggregated
+WATERMARK_NAME = 'user_stats'
+# Transactions at or below that id, to notice rows that committed below it later
+ROWS_WATERMARK = 'user_stats:rows'
+# Transactions generation the last run saw; deletes and in-place changes bump it
+GENERATION_SEEN = 'user_stats:generation'
+
+# Every transaction counts once for its sender and once for a distinct receiver
+ACTIVITY_SQL = """
+    SELECT from_user_id AS user_id, value, timestamp
+    FROM transactions
+    WHERE from_user_id IS NOT NULL {filter_from}
+    UNION ALL
+    SELECT to_user_id AS user_id, value, timestamp
+    FROM transactions
+    WHERE to_user_id IS NOT NULL
+      AND (from_user_id IS NULL OR to_user_id <> from_user_id) {filter_to}
+"""
+
+# Per-user totals of archived transactions, filled from the Parquet archive
+ARCHIVED_ACTIVITY_DDL = """
+    CREATE TEMPORARY TABLE archived_activity (
+        user_id INTEGER, tx_count BIGINT, units NUMERIC(38, 0), first_ts TIMESTAMP, last_ts TIMESTAMP
+    )
+"""
+
+AGGREGATE_SQL = """
+    CREATE TEMPORARY TABLE user_activity AS
+    SELECT user_id,
+           CAST(SUM(tx_count) AS BIGINT) AS tx_count,
+           COALESCE({volume}, 0) AS volume,
+           MIN(first_ts) AS first_ts,
+           MAX(last_ts) AS last_ts
+    FROM (
+        SELECT user_id, COUNT(*) AS tx_count, SUM(value) AS units,
+               MIN(timestamp) AS first_ts, MAX(timestamp) AS last_ts
+        FROM ({activity}) activity
+        GROUP BY user_id
+        UNION ALL
+        SELECT user_id, tx_count, units, first_ts, last_ts
+        FROM archived_activity
+        {filter_archived}
+    ) combined
+    GROUP BY user_id
+"""
+
+UPDATE_SQL = """
+    UPDATE users
+    SET total_transactions = a.tx_count,
+        total_volume = a.volume,
+        first_transaction_date = a.first_ts,
+        last_transaction_date = a.last_ts
+    FROM user_activity a
+    WHERE users.user_id = a.user_id
+      AND a.user_id >= :lo AND a.user_id < :hi
+      AND (users.total_transactions IS DISTINCT FROM a.tx_count
+           OR users.total_volume IS DISTINCT FROM a.volume
+           OR users.first_transaction_date IS DISTINCT FROM a.first_ts
+           OR users.last_transaction_date IS DISTINCT FROM a.last_ts)
+"""
+
+RESET_SQL = """
+    UPDATE users
+    SET total_transactions = 0,
+        total_volume = 0,
+        first_transaction_date = NULL,
+        last_transaction_date = NULL
+    WHERE user_id >= :lo AND user_id < :hi
+      AND (total_transactions <> 0 OR total_volume <> 0
+           OR first_transaction_date IS NOT NULL OR last_transaction_date IS NOT NULL)
+      AND NOT EXISTS (SELECT 1 FROM user_activity a WHERE a.user_id = users.user_id)
+"""
+
+
+def _read_watermark(conn, name=WATERMARK_NAME):
+    value = conn.execute(
+        db.select(Watermark.value).where(Watermark.name == name)
+    ).scalar()
+    return value or 0
+
+
+def _write_watermark(conn, value, name=WATERMARK_NAME):
+    updated = conn.execute(
+        db.update(Watermark).where(Watermark.name == name).values(value=value)
+    ).rowcount
+    if not updated:
+        conn.execute(db.insert(Watermark).values(name=name, value=value))
+
+
+def _appends_only(conn, watermark):
+    """Whether the transactions only had rows appended above watermark since the last run"""
+    if _read_watermark(conn, GENERATION_SEEN) != _read_watermark(conn, GENERATION_WATERMARK):
+        return False
+    rows = conn.execute(
+        db.select(db.func.count()).where(Transaction.transaction_id <= watermark)
+    ).scalar()
+    return rows == _read_watermark(conn, ROWS_WATERMARK)
+
+
+def recompute_user_stats(incremental=False, batch_size=50000):
+    """Rebuild the User aggregate columns from the transactions table and the archive.
+
+    The transactions, and the per-user totals of the archived ones, are
+    aggregated per user once into a temporary table, which is then applied
+    to users with UPDATE ... FROM in user_id ranges, committing after each
+    range. A full run also resets users that have no
+    transactions. An incremental run only aggregates users that appear in
+    transactions added since the previous run's watermark; it falls back
+    to a full run when transactions were deleted or changed since, or when
+    rows committed below the watermark after it was taken.
+    """
+    with db.engine.connect() as conn:
+        try:
+            generation = _read_watermark(conn, GENERATION_WATERMARK)
+            # One statement, so the id and the row count describe the same rows
+            high_water, rows = conn.execute(
+                db.select(db.func.max(Transaction.transaction_id), db.func.count())
+            ).one()
+            high_water = high_water or 0
+            watermark = _read_watermark(conn) if incremental else 0
+            incremental = incremental and _appends_only(conn, watermark)
+
+            if incremental:
+                conn.execute(text("""
+                    CREATE TEMPORARY TABLE touched_users AS
+                    SELECT from_user_id AS user_id FROM transactions
+                    WHERE transaction_id > :lo AND transaction_id <= :hi AND from_user_id IS NOT NULL
+                    UNION
+                    SELECT to_user_id FROM transactions
+                    WHERE transaction_id > :lo AND transaction_id <= :hi AND to_user_id IS NOT NULL
+                """), {'lo': watermark, 'hi': high_water})
+                activity = ACTIVITY_SQL.format(
+                    filter_from='AND from_user_id IN (SELECT user_id FROM touched_users)',
+                    filter_to='AND to_user_id IN (SELECT user_id FROM touched_users)'
+                )
+                bounds_table = 'touched_users'
+            else:
+                activity = ACTIVITY_SQL.format(filter_from='', filter_to='')
+                bounds_table = 'users'
+
+            conn.execute(text(ARCHIVED_ACTIVITY_DDL))
+            archived = archive.user_activity()
+            if archived:
+                columns = ('user_id', 'tx_count', 'units', 'first_ts', 'last_ts')
+                conn.execute(text('INSERT INTO archived_activity VALUES (:user_id, :tx_count, :units, :first_ts, :last_ts)'),
+                             [dict(zip(columns, row)) for row in archived])
+            conn.execute(text(AGGREGATE_SQL.format(
+                activity=activity,
+                volume=from_scaled_sql('SUM(units)'),
+                filter_archived='WHERE user_id IN (SELECT user_id FROM touched_users)' if incremental else ''
+            )))
+            low, high = conn.execute(text(f'SELECT MIN(user_id), MAX(user_id) FROM {bounds_table}')).one()
+            conn.commit()
+
+            users_updated = 0
+            users_reset = 0
+            if low is not None:
+                for lo in range(low, high + 1, batch_size):
+                    params = {'lo': lo, 'hi': lo + batch_size}
+                    users_updated += conn.execute(text(UPDATE_SQL), params).rowcount
+                    if not incremental:
+                        users_reset += conn.execute(text(RESET_SQL), params).rowcount
+                    conn.commit()
+
+            _write_watermark(conn, high_water)
+            _write_watermark(conn, rows, ROWS_WATERMARK)
+            _write_watermark(conn, generation, GENERATION_SEEN)
+            # Users may have become active, or inactive
+            counters.reconcile(conn, tables=['users'])
+            conn.commit()
+        finally:
+            # Temporary tables live as long as the pooled connection, not the run
+            conn.rollback()
+            for table in ('user_activity', 'archived_activity', 'touched_users'):
+                conn.execute(text(f'DROP TABLE IF EXISTS {table}'))
+            conn.commit()
+
+    return {
+        'mode': 'incremental' if incremental else 'full',
+        'users_updated': users_updated,
+        'users_reset': users_reset,
+        'watermark': high_water
+    }
@@ -25,24 +25,43 @@ const StatCard = ({ title, value, icon: Icon, color }) => (
   </div>
 );
 
+const WIDGETS = [
+  'summary',
+  'protocol-distribution',
+  'contracts-by-blockchain',
+  'transaction-volume',
+  'top-protocols',
+  'user-activity',
+  'market-performance',
+  'gas-analysis',
+  'market-share',
+];
+
+const WIDGET_PARAMS = { days: 30, 'top-protocols.limit': 8, 'market-performance.days': 14 };
+
 const Dashboard = () => {
-  const [summary, setSummary] = useState(null);
+  const [widgets, setWidgets] = useState({});
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-    const fetchSummary = async () => {
+    const fetchWidgets = async () => {
       try {
-        const response = await dashboardAPI.getSummary();
-        setSummary(response.data.data);
+        const response = await dashboardAPI.getBundle(WIDGETS, WIDGET_PARAMS);
+        Object.entries(response.data.widgets).forEach(([name, widget]) => {
+          if (widget.error) console.error(`Error fetching ${name}:`, widget.error);
+        });
+        setWidgets(response.data.widgets);
       } catch (error) {
-        console.error('Error fetching summary:', error);
+        console.error('Error fetching dashboard:', error);
       } finally {
         setLoading(false);
       }
     };
-    fetchSummary();
+    fetchWidgets();
   }, []);
 
+  const summary = widgets.summary?.data;
+
   const formatNumber = (num) => {
     if (num >= 1000000) return `${(num / 1000000).toFixed(1)}M`;
     if (num >= 1000) return `${(num / 1000).toFixed(1)}K`;
@@ -103,23 +122,27 @@ const Dashboard = () => {
 
           {/* Charts Grid */}
           <div className="grid grid-cols-1 lg:grid-cols-2 gap-6 mb-6">
-            <ProtocolDistribution />
-            <BlockchainContracts />
+            <ProtocolDistribution data={widgets['protocol-distribution']?.data} loading={loading} />
+            <BlockchainContracts data={widgets['contracts-by-blockchain']?.data} loading={loading} />
           </div>
 
           <div className="grid grid-cols-1 lg:grid-cols-2 gap-6 mb-6">
-            <TransactionVolume />
-            <TopProtocols />
+            <TransactionVolume data={widgets['transaction-volume']?.data} loading={loading} />
+            <TopProtocols data={widgets['top-protocols']?.data} loading={loading} />
           </div>
 
           <div className="grid grid-cols-1 lg:grid-cols-2 gap-6 mb-6">
-            <UserActivity />
-            <MarketPerformance />
+            <UserActivity data={widgets['user-activity']?.data} loading={loading} />
+            <MarketPerformance
+              data={widgets['market-performance']?.data}
+              protocols={widgets['market-performance']?.protocols}
+              loading={loading}
+            />
           </div>
 
           <div className="grid grid-cols-1 lg:grid-cols-2 gap-6">
-            <GasFeeAnalysis />
-            <ProtocolMarketShare />
+            <GasFeeAnalysis data={widgets['gas-analysis']?.data} loading={loading} />
+            <ProtocolMarketShare data={widgets['market-share']?.data} loading={loading} />
           </div>
         </main>
       </div>
@@ -1,26 +1,8 @@
-import React, { useState, useEffect } from 'react';
+import React from 'react';
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer } from 'recharts';
-import { dashboardAPI } from '../../services/api';
 import DashboardCard from '../layout/DashboardCard';
 
-const BlockchainContracts = () => {
-  const [data, setData] = useState([]);
-  const [loading, setLoading] = useState(true);
-
-  useEffect(() => {
-    const fetchData = async () => {
-      try {
-        const response = await dashboardAPI.getContractsByBlockchain();
-        setData(response.data.data);
-      } catch (error) {
-        console.error('Error fetching blockchain contracts:', error);
-      } finally {
-        setLoading(false);
-      }
-    };
-    fetchData();
-  }, []);
-
+const BlockchainContracts = ({ data = [], loading }) => {
   if (loading) {
     return (
       <DashboardCard title="Contracts by Blockchain">
@@ -1,26 +1,8 @@
-import React, { useState, useEffect } from 'react';
+import React from 'react';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, Legend } from 'recharts';
-import { dashboardAPI } from '../../services/api';
 import DashboardCard from '../layout/DashboardCard';
 
-const GasFeeAnalysis = () => {
-  const [data, setData] = useState([]);
-  const [loading, setLoading] = useState(true);
-
-  useEffect(() => {
-    const fetchData = async () => {
-      try {
-        const response = await dashboardAPI.getGasAnalysis(30);
-        setData(response.data.data);
-      } catch (error) {
-        console.error('Error fetching gas analysis:', error);
-      } finally {
-        setLoading(false);
-      }
-    };
-    fetchData();
-  }, []);
-
+const GasFeeAnalysis = ({ data = [], loading }) => {
   if (loading) {
     return (
       <DashboardCard title="Gas Fee Analysis">
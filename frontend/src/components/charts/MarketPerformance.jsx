@@ -1,30 +1,10 @@
-import React, { useState, useEffect } from 'react';
+import React from 'react';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, Legend } from 'recharts';
-import { dashboardAPI } from '../../services/api';
 import DashboardCard from '../layout/DashboardCard';
 
 const COLORS = ['#6366f1', '#8b5cf6', '#ec4899', '#f59e0b', '#10b981'];
 
-const MarketPerformance = () => {
-  const [data, setData] = useState([]);
-  const [protocols, setProtocols] = useState([]);
-  const [loading, setLoading] = useState(true);
-
-  useEffect(() => {
-    const fetchData = async () => {
-      try {
-        const response = await dashboardAPI.getMarketPerformance(14);
-        setData(response.data.data);
-        setProtocols(response.data.protocols || []);
-      } catch (error) {
-        console.error('Error fetching market performance:', error);
-      } finally {
-        setLoading(false);
-      }
-    };
-    fetchData();
-  }, []);
-
+const MarketPerformance = ({ data = [], protocols = [], loading }) => {
   if (loading) {
     return (
       <DashboardCard title="Market Performance">
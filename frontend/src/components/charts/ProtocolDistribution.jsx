@@ -1,28 +1,10 @@
-import React, { useState, useEffect } from 'react';
+import React from 'react';
 import { PieChart, Pie, Cell, ResponsiveContainer, Legend, Tooltip } from 'recharts';
-import { dashboardAPI } from '../../services/api';
 import DashboardCard from '../layout/DashboardCard';
 
 const COLORS = ['#6366f1', '#8b5cf6', '#a855f7', '#d946ef', '#ec4899', '#f43f5e'];
 
-const ProtocolDistribution = () => {
-  const [data, setData] = useState([]);
-  const [loading, setLoading] = useState(true);
-
-  useEffect(() => {
-    const fetchData = async () => {
-      try {
-        const response = await dashboardAPI.getProtocolDistribution();
-        setData(response.data.data);
-      } catch (error) {
-        console.error('Error fetching protocol distribution:', error);
-      } finally {
-        setLoading(false);
-      }
-    };
-    fetchData();
-  }, []);
-
+const ProtocolDistribution = ({ data = [], loading }) => {
   if (loading) {
     return (
       <DashboardCard title="Protocol Distribution">
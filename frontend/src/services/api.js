@@ -20,6 +20,9 @@ export const dashboardAPI = {
   getMarketPerformance: (days = 14) => api.get(`/dashboard/market-performance?days=${days}`),
   getGasAnalysis: (days = 30) => api.get(`/dashboard/gas-analysis?days=${days}`),
   getMarketShare: () => api.get('/dashboard/market-share'),
+  // Several widgets in one request; params are shared (days) or per widget ('market-performance.days')
+  getBundle: (widgets, params = {}) =>
+    api.get('/dashboard/bundle', { params: { widgets: widgets.join(','), ...params } }),
 };
 
 // Protocols API
@@ -0,0 +1,119 @@
+"""store addresses and hashes as binary
+
+Revision ID: 05200bfea795
+Revises: 4349b5d98279
+Create Date: 2026-10-18 05:45:16.485417
+
+Converts contracts.contract_address, users.user_address and the
+transaction hash and addresses from varchar(255) to bytea (BLOB on
+SQLite). 0x-prefixed hex is stored as a 0x00 byte followed by its raw
+bytes and comes back lower case; any other string is stored as a 0x01
+byte followed by its UTF-8 text (see app/models/types.py).
+
+On PostgreSQL each table is rewritten once by ALTER COLUMN ... TYPE, and
+its indexes are rebuilt. Values that differ only in the case of their
+hex digits become equal, so a unique index holding both fails the
+upgrade; merge such rows first.
+
+"""
+from alembic import op
+import re
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '05200bfea795'
+down_revision = '4349b5d98279'
+branch_labels = None
+depends_on = None
+
+COLUMNS = {
+    'contracts': ('contract_id', ['contract_address']),
+    'users': ('user_id', ['user_address']),
+    'transactions': ('transaction_id', ['transaction_hash', 'from_address', 'to_address']),
+}
+
+HEX = re.compile(r'0x(?:[0-9a-fA-F]{2})+')
+
+TO_BINARY_SQL = (
+    "CASE WHEN {column} ~ '^0x(?:[0-9a-fA-F]{{2}})+$' "
+    "THEN '\\x00'::bytea || decode(substr({column}, 3), 'hex') "
+    "ELSE '\\x01'::bytea || convert_to({column}, 'UTF8') END"
+)
+TO_TEXT_SQL = (
+    "CASE get_byte({column}, 0) WHEN 0 THEN '0x' || encode(substr({column}, 2), 'hex') "
+    "ELSE convert_from(substr({column}, 2), 'UTF8') END"
+)
+
+# Rows converted per round trip on SQLite
+SQLITE_CHUNK = 10_000
+
+
+def _to_binary(value):
+    if value is None:
+        return None
+    if HEX.fullmatch(value):
+        return b'\x00' + bytes.fromhex(value[2:])
+    return b'\x01' + value.encode('utf-8')
+
+
+def _to_text(value):
+    if value is None:
+        return None
+    value = bytes(value)
+    if value[:1] == b'\x00':
+        return '0x' + value[1:].hex()
+    return value[1:].decode('utf-8')
+
+
+def _alter_postgresql(type_, using):
+    for table, (_, columns) in COLUMNS.items():
+        op.execute(f'ALTER TABLE {table} ' + ', '.join(
+            f'ALTER COLUMN {column} TYPE {type_} USING {using.format(column=column)}' for column in columns
+        ))
+
+
+def _convert_sqlite(convert):
+    """Rewrite the values of every column in Python, a chunk of rows at a time"""
+    conn = op.get_bind()
+    for table, (key, columns) in COLUMNS.items():
+        update = sa.text(
+            f"UPDATE {table} SET {', '.join(f'{column} = :{column}' for column in columns)} WHERE {key} = :key"
+        )
+        last = None
+        while True:
+            rows = conn.execute(sa.text(
+                f"SELECT {key}, {', '.join(columns)} FROM {table} "
+                f"{'WHERE ' + key + ' > :last ' if last is not None else ''}ORDER BY {key} LIMIT {SQLITE_CHUNK}"
+            ), {'last': last}).all()
+            if not rows:
+                break
+            conn.execute(update, [
+                dict({'key': row[0]}, **{column: convert(value) for column, value in zip(columns, row[1:])})
+                for row in rows
+            ])
+            last = rows[-1][0]
+
+
+def _alter_sqlite(type_, existing_type):
+    for table, (_, columns) in COLUMNS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.alter_column(column, type_=type_, existing_type=existing_type)
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        _alter_postgresql('bytea', TO_BINARY_SQL)
+    else:
+        # Convert before the alter, which copies the values across with a CAST
+        _convert_sqlite(_to_binary)
+        _alter_sqlite(sa.LargeBinary(), sa.String(length=255))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        _alter_postgresql('varchar(255)', TO_TEXT_SQL)
+    else:
+        _convert_sqlite(_to_text)
+        _alter_sqlite(sa.String(length=255), sa.LargeBinary())
@@ -0,0 +1,52 @@
+"""denormalize protocol_id on transactions
+
+Revision ID: 5576869a6f86
+Revises: ed72b4f8d9e7
+Create Date: 2026-10-18 05:27:18.473982
+
+Adds transactions.protocol_id, a copy of the contract's protocol_id, and
+backfills it in transaction_id ranges, committing after each range so a
+large table is never locked in one long UPDATE. The column is made NOT
+NULL and indexed once it is filled in.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5576869a6f86'
+down_revision = 'ed72b4f8d9e7'
+branch_labels = None
+depends_on = None
+
+# transaction_id range updated per commit
+BACKFILL_CHUNK = 100_000
+
+BACKFILL_SQL = """
+    UPDATE transactions
+    SET protocol_id = (SELECT protocol_id FROM contracts WHERE contracts.contract_id = transactions.contract_id)
+    WHERE transaction_id >= :lo AND transaction_id < :hi AND protocol_id IS NULL
+"""
+
+
+def upgrade():
+    op.add_column('transactions', sa.Column('protocol_id', sa.Integer(), nullable=True))
+
+    lo, hi = op.get_bind().execute(sa.text('SELECT MIN(transaction_id), MAX(transaction_id) FROM transactions')).one()
+    if lo is not None:
+        with op.get_context().autocommit_block():
+            for start in range(lo, hi + 1, BACKFILL_CHUNK):
+                op.execute(sa.text(BACKFILL_SQL).bindparams(lo=start, hi=start + BACKFILL_CHUNK))
+
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.alter_column('protocol_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_index(batch_op.f('ix_transactions_protocol_id'), ['protocol_id'], unique=False)
+        batch_op.create_foreign_key('transactions_protocol_id_fkey', 'protocols', ['protocol_id'], ['protocol_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_constraint('transactions_protocol_id_fkey', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_transactions_protocol_id'))
+        batch_op.drop_column('protocol_id')
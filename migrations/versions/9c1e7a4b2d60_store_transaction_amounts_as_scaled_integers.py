@@ -0,0 +1,54 @@
+"""store transaction amounts as scaled integers
+
+Revision ID: 9c1e7a4b2d60
+Revises: 05200bfea795
+Create Date: 2026-10-18 05:58:42.118306
+
+Converts transactions.value, gas_price and transaction_fee from
+numeric(38,18) to numeric(38,0) counts of 10**-18 units (see
+ScaledInteger in app/models/types.py). Every numeric(38,18) amount has an
+exact count, so neither direction loses anything.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1e7a4b2d60'
+down_revision = '05200bfea795'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ['value', 'gas_price', 'transaction_fee']
+
+DECIMALS = 18
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('ALTER TABLE transactions ' + ', '.join(
+            f'ALTER COLUMN {column} TYPE numeric(38, 0) USING {column} * 1e{DECIMALS}' for column in COLUMNS
+        ))
+        return
+
+    op.execute('UPDATE transactions SET ' + ', '.join(
+        f'{column} = round({column} * 1e{DECIMALS})' for column in COLUMNS
+    ))
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        for column in COLUMNS:
+            # SQLite has no exact type this wide; floats keep SUM() from overflowing
+            batch_op.alter_column(column, type_=sa.Float(), existing_type=sa.Numeric(precision=38, scale=18))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('ALTER TABLE transactions ' + ', '.join(
+            f'ALTER COLUMN {column} TYPE numeric(38, 18) USING {column} * 1e-{DECIMALS}' for column in COLUMNS
+        ))
+        return
+
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        for column in COLUMNS:
+            batch_op.alter_column(column, type_=sa.Numeric(precision=38, scale=18), existing_type=sa.Float())
+    op.execute('UPDATE transactions SET ' + ', '.join(f'{column} = {column} * 1e-{DECIMALS}' for column in COLUMNS))
@@ -0,0 +1,88 @@
+"""widen scaled amounts
+
+Revision ID: d81f5a3c6b92
+Revises: c4a8e2d17f35
+Create Date: 2026-10-18 14:02:51.604217
+
+Databases that took 9c1e7a4b2d60 when it stored amounts as bigint counts
+of 10**-9 units get the numeric(38,0) counts of 10**-18 units it stores
+now. The amount counters and the archived Parquet files hold the same
+units and are rescaled with them. Digits the bigint form already dropped
+cannot come back. Databases that took the current 9c1e7a4b2d60 are
+already in this form and are left alone, and so is everything on
+downgrade, which 9c1e7a4b2d60 handles.
+
+"""
+import os
+from decimal import Decimal
+from alembic import op
+from flask import current_app
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81f5a3c6b92'
+down_revision = 'c4a8e2d17f35'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ['value', 'gas_price', 'transaction_fee']
+
+COUNTERS = ['transaction_value', 'transaction_fees']
+
+# 10**-9 units to 10**-18 units
+FACTOR = 10 ** 9
+
+ARCHIVE_ROW_GROUP_SIZE = 4_096
+
+
+def _rescale_archive():
+    root = os.path.join(current_app.config['ARCHIVE_DIR'], 'transactions')
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.startswith('.') or not name.endswith('.parquet'):
+                continue
+            path = os.path.join(directory, name)
+            table = pq.ParquetFile(path).read()
+            if not pa.types.is_integer(table.schema.field('value').type):
+                continue
+            for column in COLUMNS:
+                units = pc.multiply(pc.cast(table[column], pa.decimal128(19, 0)),
+                                    pa.scalar(Decimal(FACTOR), pa.decimal128(10, 0)))
+                table = table.set_column(table.schema.get_field_index(column), column,
+                                         pc.cast(units, pa.decimal128(38, 0)))
+            partial = os.path.join(directory, '.' + name)
+            pq.write_table(table, partial, row_group_size=ARCHIVE_ROW_GROUP_SIZE)
+            os.replace(partial, path)
+
+
+def upgrade():
+    bind = op.get_bind()
+    types = {column['name']: column['type'] for column in sa.inspect(bind).get_columns('transactions')}
+    if not isinstance(types['value'], sa.BigInteger):
+        return
+
+    if bind.dialect.name == 'postgresql':
+        op.execute('ALTER TABLE transactions ' + ', '.join(
+            f'ALTER COLUMN {column} TYPE numeric(38, 0) USING {column}::numeric(38, 0) * {FACTOR}'
+            for column in COLUMNS
+        ))
+    else:
+        with op.batch_alter_table('transactions', schema=None) as batch_op:
+            for column in COLUMNS:
+                batch_op.alter_column(column, type_=sa.Float(), existing_type=sa.BigInteger())
+        op.execute('UPDATE transactions SET ' + ', '.join(f'{column} = {column} * {FACTOR}' for column in COLUMNS))
+
+    names = ', '.join(f"'{name}'" for name in COUNTERS)
+    op.execute(f'UPDATE stat_counters SET value = value * {FACTOR} WHERE name IN ({names})')
+
+    _rescale_archive()
+    # Readers cache the archive's dataset and totals until this moves
+    op.execute("UPDATE watermarks SET value = value + 1 WHERE name = 'transactions_archive'")
+
+
+def downgrade():
+    pass
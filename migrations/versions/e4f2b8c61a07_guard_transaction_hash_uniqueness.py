@@ -0,0 +1,55 @@
+"""guard transaction hash uniqueness
+
+Revision ID: e4f2b8c61a07
+Revises: d81f5a3c6b92
+Create Date: 2026-10-18 16:21:37.118530
+
+A partitioned transactions table only keeps (transaction_hash, timestamp)
+unique, so the same hash could be stored again under another timestamp.
+Adds the transaction_hashes guard table, and the triggers keeping it in
+step, to databases partitioned before it existed. Hashes stored more than
+once by then keep their oldest transaction; the later copies are deleted
+and the rollup and counters recomputed. Databases that are not
+partitioned, or already guarded, are left alone.
+
+"""
+from alembic import op
+from sqlalchemy import text
+from app.utils import counters
+from app.utils.partitions import (build_hash_guard, drop_hash_guard, has_hash_guard, install_hash_guard,
+                                  is_partitioned)
+from app.utils.rollup import rebuild_rollup
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4f2b8c61a07'
+down_revision = 'd81f5a3c6b92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not is_partitioned(bind) or has_hash_guard(bind):
+        return
+
+    duplicates = bind.execute(text("""
+        DELETE FROM transactions t
+        USING (
+            SELECT transaction_hash, MIN(transaction_id) AS transaction_id
+            FROM transactions GROUP BY transaction_hash HAVING COUNT(*) > 1
+        ) kept
+        WHERE t.transaction_hash = kept.transaction_hash AND t.transaction_id <> kept.transaction_id
+    """)).rowcount
+    if duplicates:
+        rebuild_rollup(bind)
+        counters.reconcile(bind, tables=['transactions'])
+
+    build_hash_guard(bind)
+    install_hash_guard(bind)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if is_partitioned(bind):
+        drop_hash_guard(bind)
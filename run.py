@@ -1,6 +1,10 @@
 from app import create_app
+from flask_migrate import stamp
 from app.models.models import db, Protocol, Contract, User, Transaction, MarketData
+from app.utils.response_cache import TAGS, invalidate
+import click
 import os
+import resource
 
 app = create_app()
 
@@ -10,15 +14,144 @@ def init_db():
     with app.app_context():
         db.drop_all()
         db.create_all()
+        from app.utils.partitions import partition_transactions
+        with db.engine.begin() as conn:
+            partition_transactions(conn)
+        # The tables are now at the latest revision
+        stamp()
+        invalidate(*TAGS)
         print("Database initialized!")
 
 @app.cli.command('load-data')
-def load_data():
+@click.option('--batch-size', type=int, default=None,
+              help='Maximum rows per batch (default: LOAD_BATCH_SIZE)')
+@click.option('--memory-budget', 'memory_budget_mb', type=int, default=None,
+              help='Memory budget per batch in MB (default: LOAD_MEMORY_BUDGET_MB)')
+@click.option('--workers', type=int, default=1,
+              help='Worker processes for the transactions file')
+@click.option('--force', is_flag=True,
+              help='Reload files the ingestion manifest marks as complete')
+@click.option('--bulk-rebuild', is_flag=True,
+              help='Rebuild the transactions table through a staging table and swap it in (PostgreSQL)')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Only load data from this date on (inclusive)')
+@click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Only load data up to this date (inclusive)')
+@click.option('--blockchain', default=None,
+              help='Only load data for this blockchain')
+def load_data(batch_size, memory_budget_mb, workers, force, bulk_rebuild, since, until, blockchain):
     """Load data from Parquet files"""
     with app.app_context():
         from app.utils.data_loader import load_all_data
-        results = load_all_data('data')
+        results = load_all_data('data', batch_size=batch_size,
+                                memory_budget_mb=memory_budget_mb, workers=workers, force=force,
+                                bulk_rebuild=bulk_rebuild, since=since, until=until,
+                                blockchain=blockchain)
+        invalidate(*TAGS)
         print(f"Data loaded: {results}")
+        print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB")
+
+@app.cli.command('recompute-user-stats')
+@click.option('--incremental', is_flag=True,
+              help='Only recompute users touched since the last run')
+@click.option('--batch-size', type=int, default=50000,
+              help='Users updated per transaction')
+def recompute_user_stats_command(incremental, batch_size):
+    """Rebuild user transaction totals from the transactions table"""
+    with app.app_context():
+        from app.utils.user_stats import recompute_user_stats
+        results = recompute_user_stats(incremental=incremental, batch_size=batch_size)
+        invalidate('users')
+        print(f"User stats recomputed: {results}")
+
+@app.cli.command('rebuild-rollup')
+def rebuild_rollup_command():
+    """Recompute the daily transaction rollup from the transactions table"""
+    with app.app_context():
+        from app.utils.rollup import rebuild_rollup
+        with db.engine.begin() as conn:
+            rows = rebuild_rollup(conn)
+        invalidate('transactions')
+        print(f"Rollup rebuilt: {rows} rows")
+
+@app.cli.command('reconcile-stats')
+def reconcile_stats_command():
+    """Recompute the stat counters from the tables (run on a schedule)"""
+    with app.app_context():
+        from app.utils.counters import reconcile
+        with db.engine.begin() as conn:
+            drift = reconcile(conn)
+        if drift:
+            invalidate('protocols', 'contracts', 'users', 'transactions')
+        for name, (counted, actual) in drift.items():
+            print(f"{name}: {counted} -> {actual}")
+        print(f"Stat counters reconciled: {len(drift)} had drifted")
+
+@app.cli.command('slow-queries')
+@click.option('--log', 'log_path', default=None,
+              help='Slow query log to read (defaults to SLOW_QUERY_LOG)')
+@click.option('--limit', type=int, default=20, help='Statements to show')
+@click.option('--plans', is_flag=True, help='Print the latest EXPLAIN sample of each statement')
+def slow_queries_command(log_path, limit, plans):
+    """Summarize the slow query log by statement, slowest in total first"""
+    from app.utils.slow_queries import summarize_log
+    log_path = log_path or app.config['SLOW_QUERY_LOG']
+    if not log_path or not os.path.exists(log_path):
+        print("No slow query log found; set SLOW_QUERY_MS and SLOW_QUERY_LOG to record one")
+        return
+    for entry in summarize_log(log_path, limit=limit):
+        print(f"{entry['total_ms']:>12.1f} ms total  {entry['calls']:>6} calls  "
+              f"{entry['mean_ms']:>9.1f} ms mean  {entry['max_ms']:>9.1f} ms max")
+        print(f"    {entry['sql']}")
+        print(f"    params: {entry['params_shape']}")
+        if plans and entry['plan']:
+            print('    ' + entry['plan'].replace('\n', '\n    '))
+
+@app.cli.command('create-partitions')
+@click.option('--months-ahead', type=int, default=3,
+              help='Months of partitions to keep ready after the current one')
+def create_partitions_command(months_ahead):
+    """Create upcoming monthly transaction partitions (run on a schedule)"""
+    with app.app_context():
+        from app.utils.partitions import create_future_partitions, is_partitioned
+        with db.engine.begin() as conn:
+            if not is_partitioned(conn):
+                print("The transactions table is not partitioned")
+                return
+            created = create_future_partitions(conn, months_ahead=months_ahead)
+        print(f"Partitions created: {created}")
+
+@app.cli.command('detach-partitions')
+@click.option('--before', type=click.DateTime(formats=['%Y-%m-%d']), required=True,
+              help='Detach the monthly partitions that end on or before this date')
+@click.option('--drop', is_flag=True,
+              help='Drop the detached partitions instead of keeping them as tables')
+def detach_partitions_command(before, drop):
+    """Remove old transactions by detaching their monthly partitions"""
+    with app.app_context():
+        from app.utils.partitions import detach_partitions, is_partitioned
+        with db.engine.begin() as conn:
+            if not is_partitioned(conn):
+                print("The transactions table is not partitioned")
+                return
+            removed = detach_partitions(conn, before, drop=drop)
+        invalidate('transactions')
+        print(f"Partitions {'dropped' if drop else 'detached'}: {removed}")
+
+@app.cli.command('archive-transactions')
+@click.option('--older-than-days', type=int, default=None,
+              help='Archive transactions older than this many days (default: ARCHIVE_AFTER_DAYS)')
+@click.option('--batch-size', type=int, default=100_000, help='Rows per archive file')
+def archive_transactions_command(older_than_days, batch_size):
+    """Move old transactions out of the table into date-partitioned Parquet (run on a schedule)"""
+    with app.app_context():
+        from datetime import datetime, timedelta
+        from app.utils.archive import archive_root, archive_transactions
+        days = older_than_days if older_than_days is not None else app.config['ARCHIVE_AFTER_DAYS']
+        before = datetime.utcnow().date() - timedelta(days=days)
+        results = archive_transactions(before, batch_size=batch_size)
+        invalidate('transactions')
+        print(f"Transactions before {before} archived to {archive_root()}: {results}")
 
 @app.cli.command('seed-sample')
 def seed_sample():
@@ -50,34 +183,53 @@ def seed_sample():
                     description=f'{name} is a {ptype} protocol'
                 )
                 db.session.add(protocol)
+            from app.utils import counters
+            counters.add({counters.PROTOCOLS: len(protocols_data)})
             
             db.session.commit()
             print("Sample protocols added!")
         
         # Add sample market data
-        protocols = Protocol.query.all()
-        for protocol in protocols:
-            for i in range(30):
-                date = datetime.utcnow().date() - timedelta(days=30-i)
-                existing = MarketData.query.filter_by(
-                    protocol_id=protocol.protocol_id,
-                    date=date
-                ).first()
-                
-                if not existing:
-                    market = MarketData(
-                        protocol_id=protocol.protocol_id,
-                        date=date,
-                        total_volume=random.uniform(10000, 500000),
-                        transaction_count=random.randint(100, 5000),
-                        unique_users=random.randint(50, 1000),
-                        avg_transaction_value=random.uniform(100, 1000),
-                        total_fees=random.uniform(100, 5000)
-                    )
-                    db.session.add(market)
+        from app.utils.bulk import insert_ignore
+        
+        today = datetime.utcnow().date()
+        records = [{
+            'protocol_id': protocol.protocol_id,
+            'date': today - timedelta(days=30-i),
+            'total_volume': random.uniform(10000, 500000),
+            'transaction_count': random.randint(100, 5000),
+            'unique_users': random.randint(50, 1000),
+            'avg_transaction_value': random.uniform(100, 1000),
+            'total_fees': random.uniform(100, 5000)
+        } for protocol in Protocol.query.all() for i in range(30)]
+        insert_ignore(MarketData.__table__, records)
         
         db.session.commit()
+        invalidate('protocols', 'market_data')
         print("Sample market data added!")
 
+@app.cli.command('generate-data')
+@click.option('--out', 'out_dir', default='data', help='Directory to write the Parquet files to')
+@click.option('--transactions', type=int, default=1_000_000)
+@click.option('--users', type=int, default=100_000)
+@click.option('--contracts', type=int, default=2_000)
+@click.option('--protocols', type=int, default=50)
+@click.option('--days', type=int, default=90, help='Days of history ending on the end date')
+@click.option('--end-date', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Last day of history (default today); fix it to reproduce a dataset')
+@click.option('--zipf', 'zipf_a', type=float, default=1.1, help='Zipf exponent for users and contracts')
+@click.option('--seed', type=int, default=42)
+@click.option('--row-group-size', type=int, default=1_000_000)
+def generate_data(out_dir, transactions, users, contracts, protocols, days, end_date, zipf_a, seed,
+                  row_group_size):
+    """Generate a synthetic dataset in the load-data Parquet format"""
+    from app.utils.synthetic import generate_dataset
+    results = generate_dataset(
+        out_dir, transactions=transactions, users=users, contracts=contracts,
+        protocols=protocols, days=days, zipf_a=zipf_a, seed=seed,
+        row_group_size=row_group_size, end_date=end_date
+    )
+    print(f"Synthetic data written to {out_dir}: {results}")
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -0,0 +1,156 @@
+"""Apps on throwaway databases, seeded with a little of everything.
+
+Tests run on SQLite. The ones needing PostgreSQL, such as partitioning,
+use the database named by TEST_DATABASE_URL and are skipped without it;
+that database is wiped.
+"""
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal, localcontext
+import pytest
+from app import create_app
+from app.models.models import db, Contract, MarketData, Protocol, Transaction, TransactionDailyRollup, User
+from app.models.types import SCALE_CONTEXT, from_scaled
+from app.utils import archive, counters, rollup
+
+PROTOCOLS = 3
+CONTRACTS_PER_PROTOCOL = 2
+USERS = 12
+TRANSACTIONS = 120
+DAYS = 60
+
+
+def address(prefix, n):
+    return f'0x{prefix}{n:038x}'
+
+
+def transaction_hash(n):
+    return f'0x{n:064x}'
+
+
+def seed(now=None, transactions=TRANSACTIONS, days=DAYS):
+    """Protocols, contracts, users, market data and transactions spread over
+    the days before now, with the rollup and counters built from them"""
+    now = now or datetime.utcnow()
+    protocols = [Protocol(protocol_name=f'Protocol {n}', protocol_symbol=f'P{n}', type=('DEX', 'Lending')[n % 2])
+                 for n in range(PROTOCOLS)]
+    db.session.add_all(protocols)
+    db.session.flush()
+
+    contracts = [
+        Contract(contract_address=address('c', n), blockchain=('ethereum', 'polygon')[n % 2],
+                 protocol_id=protocols[n % PROTOCOLS].protocol_id)
+        for n in range(PROTOCOLS * CONTRACTS_PER_PROTOCOL)
+    ]
+    users = [User(user_address=address('a', n), user_type='regular') for n in range(USERS)]
+    db.session.add_all(contracts + users)
+    db.session.flush()
+
+    for n in range(transactions):
+        contract = contracts[n % len(contracts)]
+        sender, receiver = users[n % USERS], users[(n * 7 + 1) % USERS]
+        db.session.add(Transaction(
+            transaction_hash=transaction_hash(n), contract_id=contract.contract_id, protocol_id=contract.protocol_id,
+            from_user_id=sender.user_id, to_user_id=receiver.user_id,
+            from_address=sender.user_address, to_address=receiver.user_address,
+            value=Decimal(n) + Decimal('0.5'), gas_used=21_000 + n, gas_price=Decimal('0.00000002'),
+            transaction_fee=Decimal('0.00042'), timestamp=now - timedelta(hours=n * days * 24 // transactions),
+            block_number=1_000_000 + n, status=('success', 'failed')[n % 5 == 0]
+        ))
+
+    db.session.add_all(
+        MarketData(protocol_id=protocol.protocol_id, date=(now - timedelta(days=day)).date(),
+                   total_volume=Decimal(1000 + day), transaction_count=10 + day, unique_users=5,
+                   avg_transaction_value=Decimal(100), total_fees=Decimal(3))
+        for protocol in protocols for day in range(30)
+    )
+    db.session.commit()
+
+    with db.engine.begin() as conn:
+        rollup.rebuild_rollup(conn)
+        counters.reconcile(conn)
+
+
+def make_app(uri, directory, **config):
+    """An app with TESTING on over an emptied database at uri"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': uri,
+        'ARCHIVE_DIR': str(directory / 'archive'),
+        'RESPONSE_CACHE_SECONDS': 0,
+        'STATS_RECONCILE_SECONDS': 0,
+        **config
+    })
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        from app.utils.partitions import partition_transactions
+        with db.engine.begin() as conn:
+            partition_transactions(conn)
+    return app
+
+
+def _app(uri, directory):
+    app = make_app(uri, directory)
+    with app.app_context():
+        seed()
+        from app.utils.partitions import create_future_partitions, is_partitioned
+        with db.engine.begin() as conn:
+            if is_partitioned(conn):
+                # Moves the seeded rows out of the default partition
+                create_future_partitions(conn)
+        yield app
+        db.session.remove()
+    app.extensions['dashboard_pool'].shutdown()
+
+
+@pytest.fixture
+def app(tmp_path):
+    """A seeded app on SQLite, in an app context"""
+    yield from _app(f"sqlite:///{tmp_path / 'test.db'}", tmp_path)
+
+
+@pytest.fixture
+def pg_app(tmp_path):
+    """A seeded app on the PostgreSQL database at TEST_DATABASE_URL, partitioned, in an app context"""
+    uri = os.getenv('TEST_DATABASE_URL')
+    if not uri:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    yield from _app(uri, tmp_path)
+
+
+@pytest.fixture(params=['app', 'pg_app'])
+def any_app(request):
+    """app, then pg_app"""
+    return request.getfixturevalue(request.param)
+
+
+def rollup_days():
+    """{date: (transactions, value)} as the daily rollup has them"""
+    days = defaultdict(lambda: [0, Decimal(0)])
+    with localcontext(SCALE_CONTEXT):
+        for row in TransactionDailyRollup.query.all():
+            days[row.date][0] += row.tx_count
+            days[row.date][1] += Decimal(row.total_value)
+    return {day: tuple(totals) for day, totals in days.items() if totals[0]}
+
+
+def actual_days():
+    """{date: (transactions, value)} of the table and the live archive together"""
+    days = defaultdict(lambda: [0, Decimal(0)])
+    with localcontext(SCALE_CONTEXT):
+        for timestamp, value in db.session.execute(db.select(Transaction.timestamp, Transaction.value)):
+            days[timestamp.date()][0] += 1
+            days[timestamp.date()][1] += value or 0
+        archived = archive.read_columns(['timestamp', 'contract_id', 'value'])
+        if archived is not None:
+            for timestamp, units in zip(archived['timestamp'].to_pylist(), archived['value'].to_pylist()):
+                days[timestamp.date()][0] += 1
+                days[timestamp.date()][1] += from_scaled(units) or 0
+    return {day: tuple(totals) for day, totals in days.items()}
+
+
+def assert_counters_match():
+    with db.engine.begin() as conn:
+        assert counters.reconcile(conn) == {}
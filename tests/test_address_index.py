@@ -0,0 +1,31 @@
+import numpy as np
+from app.models.models import User
+from app.utils.address_index import AddressIndex
+
+EVM = ['0x' + 'ab' * 19 + '00', '0x' + 'ab' * 19 + '01', '0x' + '00' * 20]
+OTHER = ['So11111111111111111111111111111111111111112', 'bc1qxy', '0xabc', '0x' + 'zz' * 20]
+
+
+def test_evm_addresses_are_kept_as_raw_bytes():
+    index = AddressIndex(EVM + OTHER, range(1, 8))
+    assert index.words.keys.dtype == np.dtype('S20')
+    assert len(index.words) == len(EVM)
+    assert len(index.others) == len(OTHER)
+    assert index.stats()['evm_addresses'] == len(EVM)
+
+    found = index.lookup(EVM + OTHER + [None, EVM[1].upper().replace('0X', '0x'), '0x' + 'ab' * 19, 'missing'])
+    assert found.tolist() == [1, 2, 3, 4, 5, 6, 7, -1, 2, -1, -1]
+
+
+def test_duplicates_keep_the_highest_id():
+    index = AddressIndex([EVM[0], OTHER[0], EVM[0], OTHER[0]], [4, 9, 7, 2])
+    assert index.lookup([EVM[0], OTHER[0]]).tolist() == [7, 9]
+
+
+def test_from_query_matches_the_table(app):
+    # The seeded addresses have an odd number of hex digits, so they are kept as text
+    index = AddressIndex.from_query(User.user_address, User.user_id)
+    users = User.query.all()
+    assert len(index) == len(users)
+    assert index.lookup([user.user_address for user in users]).tolist() == [user.user_id for user in users]
+    assert index.stats()['evm_addresses'] == 0
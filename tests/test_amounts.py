@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+from decimal import Decimal, localcontext
+from app.models.models import Contract
+from app.models.types import SCALE_CONTEXT
+from conftest import rollup_days, transaction_hash
+
+# Amounts with at most 15 significant digits, which SQLite's floats keep
+AMOUNTS = ['0.000000000000000001', '0.1', '1.5', '123456789.123456', '999999999999999', '0.000000421']
+# Amounts whose sums also keep to 15 digits
+SUMMED = ['0.1', '0.2', '0.3', '1.5', '123456.789', '0.000421']
+# Only PostgreSQL keeps all 38 digits
+WIDE_AMOUNTS = ['12345678901234567890.123456789012345678', '0.123456789012345678']
+
+
+def _post(app, n, value, timestamp):
+    response = app.test_client().post('/api/transactions', json={
+        'transaction_hash': transaction_hash(n), 'contract_id': Contract.query.first().contract_id,
+        'from_address': '0x' + '1' * 40, 'timestamp': timestamp.isoformat(), 'value': value
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['transaction']['transaction_id']
+
+
+def _wide(app):
+    return app.extensions['sqlalchemy'].engine.dialect.name == 'postgresql'
+
+
+def _amounts(app, amounts):
+    return amounts + (WIDE_AMOUNTS if _wide(app) else [])
+
+
+def _same(app, sum, expected):
+    """Whether sum is expected: exactly on PostgreSQL, to SQLite's 15 significant digits there"""
+    if _wide(app):
+        return sum == expected
+    with localcontext() as context:
+        context.prec = 15
+        return +sum == +expected
+
+
+def test_amounts_round_trip(any_app):
+    client = any_app.test_client()
+    day = datetime.utcnow() - timedelta(days=200)
+    for n, value in enumerate(_amounts(any_app, AMOUNTS)):
+        transaction_id = _post(any_app, 10_000 + n, value, day)
+        assert Decimal(client.get(f'/api/transactions/{transaction_id}').get_json()['value']) == Decimal(value)
+
+
+def test_amount_sums_are_exact(any_app):
+    client = any_app.test_client()
+    before = Decimal(client.get('/api/transactions/stats').get_json()['total_volume'])
+    day = datetime.utcnow() - timedelta(days=200)
+    amounts = _amounts(any_app, SUMMED)
+    for n, value in enumerate(amounts):
+        _post(any_app, 10_000 + n, value, day)
+    with localcontext(SCALE_CONTEXT):
+        total = sum(map(Decimal, amounts))
+        expected = before + total
+
+    count, value = rollup_days()[day.date()]
+    assert count == len(amounts) and _same(any_app, value, total)
+    assert _same(any_app, Decimal(client.get('/api/transactions/stats').get_json()['total_volume']), expected)
+    volumes = client.get('/api/transactions/volume-over-time?days=365').get_json()['data']
+    [volume] = [Decimal(v['total_volume']) for v in volumes if v['date'] == day.date().isoformat()]
+    assert _same(any_app, volume, total)
+
+
+def test_out_of_range_amount_is_rejected(app):
+    response = app.test_client().post('/api/transactions', json={
+        'transaction_hash': transaction_hash(10_000), 'contract_id': Contract.query.first().contract_id,
+        'from_address': '0x' + '1' * 40, 'timestamp': datetime.utcnow().isoformat(), 'value': '1e20'
+    })
+    assert response.status_code == 400
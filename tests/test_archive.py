@@ -0,0 +1,121 @@
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from app.models.models import Contract, Transaction
+from app.utils import archive
+from conftest import actual_days, transaction_hash
+
+ARCHIVE_AFTER_DAYS = 30
+
+
+def _archive():
+    return archive.archive_transactions((datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)).date())
+
+
+def test_top_protocols_count_archived_transactions(app):
+    client = app.test_client()
+    before = client.get('/api/protocols/top-by-volume').get_json()['top_protocols']
+    assert _archive()
+    after = client.get('/api/protocols/top-by-volume').get_json()['top_protocols']
+    assert after == before
+    assert sum(p['transaction_count'] for p in after) == sum(count for count, _ in actual_days().values())
+    assert sum(Decimal(p['total_volume']) for p in after) == sum(value for _, value in actual_days().values())
+
+
+def test_archived_hash_is_a_duplicate(app):
+    assert _archive()
+    archived = archive.newest(1)[0]
+    client = app.test_client()
+    row = {
+        'transaction_hash': archived.transaction_hash.upper().replace('0X', '0x'),
+        'contract_id': archived.contract_id, 'from_address': archived.from_address,
+        'timestamp': datetime.utcnow().isoformat(), 'value': '1'
+    }
+    response = client.post('/api/transactions', json=row)
+    assert response.status_code == 409
+
+    fresh = dict(row, transaction_hash=transaction_hash(10_000))
+    response = client.post('/api/transactions/batch', data='\n'.join(json.dumps(r) for r in (row, fresh)),
+                           content_type='application/x-ndjson')
+    assert response.get_json()['accepted'] == 1
+    assert response.get_json()['duplicates'] == 1
+    assert Transaction.query.filter_by(transaction_hash=archived.transaction_hash).count() == 0
+
+
+def test_reads_keep_their_snapshot(app):
+    assert _archive()
+    snapshot = archive._snapshot()
+    contract = Contract.query.filter(Contract.contract_id.in_(snapshot.contracts[0].to_pylist())).first()
+    before = archive.count(contract_id=contract.contract_id)
+    assert before
+
+    # A reload after a delete replaces the snapshot instead of changing the one in use
+    client = app.test_client()
+    assert client.delete(f'/api/contracts/{contract.contract_id}').status_code == 200
+    assert contract.contract_id in snapshot.contracts[0].to_pylist()
+    assert archive._snapshot() is not snapshot
+    assert archive.count(contract_id=contract.contract_id) == 0
+    assert snapshot.counts[(('contract_id', contract.contract_id),)] == before
+
+
+def _listing(client, per_page, **params):
+    """Transaction ids of the whole listing, by numbered pages and by cursor"""
+    pages, page = [], 1
+    while True:
+        body = client.get('/api/transactions', query_string={'page': page, 'per_page': per_page, **params}).get_json()
+        if not body['transactions']:
+            break
+        pages += [t['transaction_id'] for t in body['transactions']]
+        page += 1
+    cursored, cursor = [], ''
+    while cursor is not None:
+        body = client.get('/api/transactions', query_string={'cursor': cursor, 'per_page': per_page, **params}).get_json()
+        cursored += [t['transaction_id'] for t in body['transactions']]
+        cursor = body['next_cursor']
+    return pages, cursored
+
+
+def test_listing_runs_on_into_the_archive(app):
+    client = app.test_client()
+    contract_id = Contract.query.first().contract_id
+    before = {params: _listing(client, 7, **dict(params)) for params in ((), (('contract_id', contract_id),))}
+    assert _archive()
+    assert Transaction.query.count()
+
+    for params, (pages, cursored) in before.items():
+        assert pages == cursored
+        assert _listing(client, 7, **dict(params)) == (pages, cursored)
+        total = client.get('/api/transactions', query_string={'include_total': 'exact', **dict(params)}).get_json()
+        assert total['total'] == len(pages)
+
+
+def test_load_skips_archived_days_under_the_plain_manifest(app, tmp_path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from app.models.models import IngestionManifest
+    from app.utils.data_loader import load_all_data
+
+    assert _archive()
+    contract = Contract.query.first()
+    rows = [
+        (transaction_hash(20_000), datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS + 5)),
+        (transaction_hash(20_001), datetime.utcnow() - timedelta(days=1)),
+    ]
+    pq.write_table(pa.table({
+        'transaction_hash': [h for h, _ in rows],
+        'contract_address': [contract.contract_address] * 2,
+        'from_address': ['0x' + '1' * 40] * 2,
+        'to_address': ['0x' + '2' * 40] * 2,
+        'value': ['1.5'] * 2,
+        'gas_used': [21_000] * 2,
+        'gas_price': ['0.00000002'] * 2,
+        'transaction_fee': ['0.00042'] * 2,
+        'timestamp': [t for _, t in rows],
+        'block_number': [2_000_000, 2_000_001],
+        'status': ['success'] * 2,
+    }), tmp_path / 'transactions.parquet')
+
+    load_all_data(str(tmp_path))
+    assert [m.loader for m in IngestionManifest.query.all()] == ['transactions']
+    assert Transaction.query.filter_by(transaction_hash=rows[0][0]).count() == 0
+    assert Transaction.query.filter_by(transaction_hash=rows[1][0]).count() == 1
@@ -0,0 +1,52 @@
+import threading
+from sqlalchemy import text
+from app.models.models import db, StatCounter, Transaction
+from app.utils import counters
+from conftest import assert_counters_match
+
+
+def test_reconcile_adds_the_drift(any_app):
+    table = StatCounter.__table__
+    db.session.execute(table.update().where(table.c.name == counters.TRANSACTIONS).values(value=table.c.value + 5))
+    db.session.commit()
+    with db.engine.begin() as conn:
+        drift = counters.reconcile(conn)
+    assert drift == {counters.TRANSACTIONS: (Transaction.query.count() + 5, Transaction.query.count())}
+    assert_counters_match()
+
+
+def test_reconcile_does_not_wait_for_writers(pg_app):
+    transaction_id = db.session.scalar(db.select(Transaction.transaction_id))
+    db.session.rollback()
+    with db.engine.connect() as writer:
+        # Deleted and uncounted, but not committed yet
+        counters.remove_transactions_where(Transaction.transaction_id == transaction_id, writer)
+        writer.execute(db.delete(Transaction).where(Transaction.transaction_id == transaction_id))
+        with db.engine.begin() as conn:
+            conn.execute(text("SET LOCAL lock_timeout = '2s'"))
+            assert counters.reconcile(conn) == {}
+        writer.commit()
+    assert_counters_match()
+
+
+def test_background_reconcile_runs_once_per_interval(any_app):
+    reconciler = counters.Reconciler(any_app, interval=3600)
+    db.session.execute(StatCounter.__table__.delete().where(StatCounter.name == counters.TRANSACTIONS))
+    db.session.commit()
+    assert reconciler.run_once()
+    assert reconciler.last_drift == {counters.TRANSACTIONS: (0, Transaction.query.count())}
+    # Another worker's thread finds it done
+    assert not counters.Reconciler(any_app, interval=3600).run_once()
+    assert counters.Reconciler(any_app, interval=0).run_once()
+    assert_counters_match()
+
+
+def test_background_reconcile_skips_while_another_runs(pg_app):
+    db.session.rollback()
+    with db.engine.begin() as conn:
+        counters._lock(conn)
+        skipped = []
+        thread = threading.Thread(target=lambda: skipped.append(not counters.Reconciler(pg_app, 0).run_once()))
+        thread.start()
+        thread.join()
+    assert skipped == [True]
@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+from app.models.models import db, MarketData, Protocol
+
+
+def _trends(client, **params):
+    response = client.get('/api/market/trends', query_string=params)
+    assert response.status_code == 200
+    return response.get_json(), int(response.headers['X-SQL-Queries'])
+
+
+def test_trends_series_come_from_the_rows(any_app):
+    protocol_ids = db.session.scalars(db.select(Protocol.protocol_id).order_by(Protocol.protocol_id)).all()
+    missing = max(protocol_ids) + 1
+    # A day with no row for the first protocol
+    db.session.execute(db.delete(MarketData).where(
+        MarketData.protocol_id == protocol_ids[0], MarketData.date == (datetime.utcnow() - timedelta(days=3)).date()
+    ))
+    db.session.commit()
+
+    client = any_app.test_client()
+    ids = ','.join(str(p) for p in [protocol_ids[1], protocol_ids[0], missing])
+    for metric in ('total_volume', 'transaction_count'):
+        with_rows, queries = _trends(client, protocol_ids=ids, metric=metric, days=10)
+        series_only, _ = _trends(client, protocol_ids=ids, metric=metric, days=10, include_rows='false')
+        assert queries == 1
+        assert 'trends' not in series_only
+        assert with_rows['series'] == series_only['series']
+        assert [p['protocol_id'] for p in with_rows['series']['protocols']] == [protocol_ids[1], protocol_ids[0], missing]
+        assert with_rows['series']['protocols'][2]['values'] == [0] * 11
+        assert 0 in with_rows['series']['protocols'][1]['values']
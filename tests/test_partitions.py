@@ -0,0 +1,57 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from app.models.models import db, Contract, Transaction
+from app.utils import archive
+from app.utils.partitions import detach_partitions
+from conftest import actual_days, assert_counters_match, rollup_days, transaction_hash
+
+
+def _month(value):
+    return date(value.year, value.month, 1)
+
+
+def test_detach_keeps_archived_days_in_rollup(pg_app):
+    now = datetime.utcnow()
+    # Everything before the month holding the horizon is archived
+    horizon = _month(now - timedelta(days=40))
+    archive.archive_transactions(horizon)
+    archived = rollup_days()
+
+    # A late arrival in an archived month, still in the table
+    contract = Contract.query.first()
+    late = datetime.combine(horizon - timedelta(days=3), datetime.min.time())
+    response = pg_app.test_client().post('/api/transactions', json={
+        'transaction_hash': transaction_hash(10_000), 'contract_id': contract.contract_id,
+        'from_address': '0x' + '1' * 40, 'timestamp': late.isoformat(), 'value': '7.25'
+    })
+    assert response.status_code == 201
+    assert rollup_days()[late.date()][0] == archived.get(late.date(), (0,))[0] + 1
+
+    # Detaching waits for readers of the table
+    db.session.rollback()
+    with db.engine.begin() as conn:
+        removed = detach_partitions(conn, horizon, drop=True)
+    assert removed
+    db.session.expire_all()
+
+    # The late arrival left with its partition; the archived days stayed
+    assert rollup_days() == actual_days()
+    assert rollup_days() == {day: totals for day, totals in archived.items()} | {
+        day: totals for day, totals in actual_days().items() if day >= horizon
+    }
+    assert db.session.get(Transaction, response.get_json()['transaction']['transaction_id']) is None
+    assert_counters_match()
+
+
+def test_detach_without_archive_empties_rollup_days(pg_app):
+    start = _month(min(db.session.scalars(db.select(Transaction.timestamp))))
+    before = _month(start + timedelta(days=32))
+    db.session.rollback()
+    with db.engine.begin() as conn:
+        assert detach_partitions(conn, before, drop=True)
+    db.session.expire_all()
+    assert min(rollup_days()) >= before
+    assert rollup_days() == actual_days()
+    assert sum(count for count, _ in rollup_days().values()) == Transaction.query.count()
+    assert Decimal(0) < sum(value for _, value in rollup_days().values())
+    assert_counters_match()
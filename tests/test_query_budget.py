@@ -0,0 +1,115 @@
+"""Every GET endpoint answers within its SQL query budget.
+
+With TESTING on, app/utils/query_counter.py fails a request that runs more
+statements than QUERY_BUDGET, or the view's own query_budget. The app runs
+on a throwaway SQLite database seeded with a little of everything, part of
+it archived, so the archive reads are exercised too.
+"""
+from datetime import datetime, timedelta
+import pytest
+from app.models.models import db, MarketData, Protocol, Transaction
+from app.utils import archive
+from conftest import make_app, seed
+
+ARCHIVE_AFTER_DAYS = 30
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('query_budget')
+    app = make_app(f"sqlite:///{directory / 'test.db'}", directory)
+    with app.app_context():
+        seed()
+        archive.archive_transactions((datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)).date())
+    yield app
+    app.extensions['dashboard_pool'].shutdown()
+
+
+@pytest.fixture(scope='module')
+def ids(app):
+    """Values for the endpoints' path parameters, including an archived transaction"""
+    with app.app_context():
+        live = Transaction.query.order_by(Transaction.timestamp.desc()).first()
+        archived = archive.newest(1)[0]
+        return {
+            'protocol_id': db.session.scalar(db.select(Protocol.protocol_id)),
+            'contract_id': live.contract_id,
+            'user_id': live.from_user_id,
+            'address': live.from_address,
+            'transaction_id': live.transaction_id,
+            'archived_id': archived.transaction_id,
+            'tx_hash': live.transaction_hash,
+            'archived_hash': archived.transaction_hash,
+            'market_id': db.session.scalar(db.select(MarketData.market_id)),
+        }
+
+
+# Every GET endpoint at least once, with the query arguments that take a
+# different path through the view
+URLS = [
+    '/api/protocols',
+    '/api/protocols?include_total=exact',
+    '/api/protocols/{protocol_id}',
+    '/api/protocols/stats',
+    '/api/protocols/top-by-volume',
+    '/api/contracts',
+    '/api/contracts?protocol_id={protocol_id}&include_total=estimate',
+    '/api/contracts/{contract_id}',
+    '/api/contracts/by-blockchain',
+    '/api/users',
+    '/api/users?include_total=exact',
+    '/api/users/{user_id}',
+    '/api/users/address/{address}',
+    '/api/users/top-by-volume',
+    '/api/users/stats',
+    '/api/transactions',
+    '/api/transactions?include_total=exact&per_page=100',
+    '/api/transactions?include_total=estimate&contract_id={contract_id}',
+    '/api/transactions?status=failed&page=3&per_page=20',
+    '/api/transactions?from_address={address}&cursor=',
+    '/api/transactions/{transaction_id}',
+    '/api/transactions/{archived_id}',
+    '/api/transactions/hash/{tx_hash}',
+    '/api/transactions/hash/{archived_hash}',
+    '/api/transactions/volume-over-time?days=90',
+    '/api/transactions/stats',
+    '/api/market',
+    '/api/market?protocol_id={protocol_id}&include_total=exact',
+    '/api/market/{market_id}',
+    '/api/market/trends?days=30',
+    '/api/market/trends?protocol_ids={protocol_id}&metric=transaction_count',
+    '/api/market/trends?protocol_ids={protocol_id}&include_rows=false',
+    '/api/market/compare',
+    '/api/dashboard/engine',
+    '/api/dashboard/cache',
+    '/api/dashboard/protocol-distribution',
+    '/api/dashboard/contracts-by-blockchain',
+    '/api/dashboard/transaction-volume?days=90',
+    '/api/dashboard/top-protocols',
+    '/api/dashboard/user-activity?days=90',
+    '/api/dashboard/market-performance',
+    '/api/dashboard/gas-analysis?days=90',
+    '/api/dashboard/market-share',
+    '/api/dashboard/summary',
+    '/api/dashboard/bundle',
+]
+
+
+def test_every_get_endpoint_is_listed(app):
+    listed = set()
+    for url in URLS:
+        with app.test_request_context(url.split('?')[0].format(
+            protocol_id=1, contract_id=1, user_id=1, address='0x1', transaction_id=1, archived_id=1,
+            tx_hash='0x1', archived_hash='0x1', market_id=1
+        )) as context:
+            listed.add(context.request.url_rule.endpoint)
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules() if 'GET' in rule.methods} - {'static'}
+    assert endpoints - listed == set()
+
+
+@pytest.mark.parametrize('url', URLS)
+def test_within_query_budget(app, ids, url):
+    # QueryBudgetExceeded propagates out of the test client in testing
+    response = app.test_client().get(url.format(**ids))
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert 'X-SQL-Queries' in response.headers
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+from app.models.models import db, Contract
+from app.utils import archive
+from conftest import actual_days, assert_counters_match, rollup_days, transaction_hash
+
+
+def _post(app, n, **fields):
+    contract = Contract.query.first()
+    response = app.test_client().post('/api/transactions', json={
+        'transaction_hash': transaction_hash(n), 'contract_id': contract.contract_id,
+        'from_address': '0x' + '1' * 40, 'timestamp': datetime.utcnow().isoformat(), 'value': '2.5', **fields
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['transaction']['transaction_id']
+
+
+def test_rollup_and_counters_follow_writes(app):
+    # The contract deleted last has archived days too
+    assert archive.archive_transactions((datetime.utcnow() - timedelta(days=30)).date())
+    client = app.test_client()
+    created = _post(app, 10_000, transaction_fee='0.001')
+    assert rollup_days() == actual_days()
+    assert_counters_match()
+
+    assert client.put(f'/api/transactions/{created}', json={'status': 'failed'}).status_code == 200
+    assert rollup_days() == actual_days()
+    assert_counters_match()
+
+    assert client.delete(f'/api/transactions/{created}').status_code == 200
+    assert client.delete(f'/api/contracts/{Contract.query.first().contract_id}').status_code == 200
+    db.session.expire_all()
+    assert rollup_days() == actual_days()
+    assert_counters_match()